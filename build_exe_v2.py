@@ -93,11 +93,25 @@ a = Analysis(
     datas=[
         ('whisk_gui_v2.py', '.'),
         ('whisk_core_v2.py', '.'),
+        ('whisk_capture_v2.py', '.'),
+        ('whisk_core_async_v2.py', '.'),
+        ('whisk_pool_v2.py', '.'),
+        ('whisk_bitbrowser_v2.py', '.'),
+        ('whisk_scheduler_v2.py', '.'),
+        ('whisk_log_v2.py', '.'),
+        ('whisk_metrics_v2.py', '.'),
+        ('whisk_pacing_v2.py', '.'),
+        ('whisk_journal_v2.py', '.'),
+        ('whisk_dedup_v2.py', '.'),
+        ('whisk_cancel_v2.py', '.'),
+        ('whisk_template_v2.py', '.'),
+        ('whisk_postprocess_v2.py', '.'),
     ],
     hiddenimports=[
         'requests',
         'playwright',
         'playwright.sync_api',
+        'playwright.async_api',
         'tkinter',
         'PIL',
     ],
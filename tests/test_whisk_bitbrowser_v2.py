@@ -0,0 +1,54 @@
+"""比特浏览器客户端：连接复用和 Session 数量"""
+
+import threading
+
+from whisk_bitbrowser_stub_v2 import BitBrowserStubServer
+from whisk_bitbrowser_v2 import BitBrowserClient
+
+
+def test_requests_reuse_connections():
+    with BitBrowserStubServer(BitBrowserStubServer.make_profiles(3)) as stub:
+        client = BitBrowserClient(stub.url)
+        try:
+            for _ in range(10):
+                client.list_browsers(force_refresh=True)
+        finally:
+            client.close()
+        assert stub.request_counts['/browser/list'] == 10
+        assert stub.connection_count == 1
+
+
+def test_short_lived_threads_share_sessions():
+    """界面每次刷新都在新线程中请求，Session 数量不随线程数增长"""
+    with BitBrowserStubServer(BitBrowserStubServer.make_profiles(3)) as stub:
+        client = BitBrowserClient(stub.url, max_sessions=2)
+        try:
+            for _ in range(50):
+                thread = threading.Thread(target=client.list_browsers, kwargs={'force_refresh': True})
+                thread.start()
+                thread.join()
+            assert client._session_count == 1
+            assert stub.connection_count == 1
+
+            threads = [threading.Thread(target=client.list_browsers, kwargs={'force_refresh': True})
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert client._session_count <= 2
+        finally:
+            client.close()
+        assert stub.request_counts['/browser/list'] == 58
+
+
+def test_list_cache():
+    with BitBrowserStubServer(BitBrowserStubServer.make_profiles(3)) as stub:
+        client = BitBrowserClient(stub.url, list_ttl=60)
+        try:
+            client.list_browsers()
+            client.list_browsers()
+            client.list_browsers(force_refresh=True)
+        finally:
+            client.close()
+        assert stub.request_counts['/browser/list'] == 2
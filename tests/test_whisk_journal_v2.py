@@ -0,0 +1,55 @@
+"""任务日志：断点续跑时已完成的生成序号"""
+
+from whisk_journal_v2 import JobJournal
+
+
+def _save(directory, name):
+    path = directory / name
+    path.write_bytes(b'image')
+    return path
+
+
+def test_resume_ignores_earlier_runs_in_shared_directory(tmp_path):
+    journal = JobJournal.for_directory(tmp_path)
+
+    # 第一次运行完成 1-3
+    journal.start_job("猫", "1:1", 3)
+    for i in range(1, 4):
+        journal.record(i, "猫", "1:1", 'done', [_save(tmp_path, f"run1_{i}.png")])
+
+    # 第二次全新运行只完成 1 就中断
+    journal.start_job("猫", "1:1", 3)
+    journal.record(1, "猫", "1:1", 'done', [_save(tmp_path, "run2_1.png")])
+
+    assert journal.completed_iterations("猫", "1:1") == {1}
+
+
+def test_resume_keeps_results_of_earlier_resumes(tmp_path):
+    journal = JobJournal.for_directory(tmp_path)
+
+    journal.start_job("猫", "1:1", 4)
+    journal.record(1, "猫", "1:1", 'done', [_save(tmp_path, "a.png")])
+    journal.start_job("猫", "1:1", 4, resume=True)
+    journal.record(2, "猫", "1:1", 'done', [_save(tmp_path, "b.png")])
+    journal.record(3, "猫", "1:1", 'failed')
+    # 其他提示词、纵横比的全新运行不影响
+    journal.start_job("狗", "1:1", 4)
+    journal.start_job("猫", "16:9", 4)
+
+    assert journal.completed_iterations("猫", "1:1") == {1, 2}
+
+
+def test_missing_files_are_not_completed(tmp_path):
+    journal = JobJournal.for_directory(tmp_path)
+
+    journal.start_job("猫", "1:1", 2)
+    kept = _save(tmp_path, "kept.png")
+    converted = _save(tmp_path, "converted.png")
+    journal.record(1, "猫", "1:1", 'done', [kept])
+    journal.record(2, "猫", "1:1", 'done', [converted])
+    # 后处理把截图转换为 JPEG 后仍算完成；文件删除后不算
+    converted.rename(converted.with_suffix('.jpg'))
+    assert journal.completed_iterations("猫", "1:1") == {1, 2}
+
+    kept.unlink()
+    assert journal.completed_iterations("猫", "1:1") == {2}
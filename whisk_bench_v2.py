@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 离线基准测试
+FakeWhiskServer 模拟 Whisk 页面（输入框、aspect_ratio 按钮、"下载图片" 按钮，
+按设定延迟出现的生成图片），比特浏览器 API 由 BitBrowserStubServer 模拟，
+每个模拟窗口对应一个开启远程调试端口的 Chromium，核心类通过 CDP 端到端运行 run()
+
+输出 JSON 报告：每分钟图片数、各阶段耗时分布、降级计数、峰值内存
+（浏览器内存在运行期间对各 Chromium 进程树采样，需要 psutil 或 Linux /proc）
+
+用法: python whisk_bench_v2.py --profiles 2 --count 5 --latency 3 --output bench.json
+      --executable 指定 Chromium/Chrome 可执行文件，默认使用 Playwright 自带的 Chromium
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from whisk_bitbrowser_stub_v2 import BitBrowserStubServer
+from whisk_bitbrowser_v2 import BitBrowserClient, set_client
+from whisk_metrics_v2 import RunMetrics
+
+
+FAKE_WHISK_PATH = "/fx/tools/whisk/project"
+
+FAKE_WHISK_HTML = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>Whisk (benchmark)</title>
+<style>
+  body { font-family: sans-serif; margin: 24px; }
+  #ratios { display: none; }
+  #ratios.open { display: block; }
+  .batch { display: flex; gap: 16px; margin-top: 16px; }
+  .result { display: flex; flex-direction: column; gap: 4px; }
+  .result img { width: 320px; height: 320px; }
+</style>
+</head>
+<body>
+<div id="toolbar">
+  <button id="aspect"><i>aspect_ratio</i></button>
+  <div id="ratios"></div>
+</div>
+<textarea id="prompt" rows="3" cols="60" placeholder="描述您想生成的图片"></textarea>
+<div id="status"></div>
+<div id="results"></div>
+<script>
+const CONFIG = __CONFIG__;
+let counter = 0;
+let ratio = '1:1';
+
+const ratios = document.getElementById('ratios');
+function renderRatios() {
+  ['1:1', '4:3', '3:4', '16:9', '9:16'].forEach((value) => {
+    const button = document.createElement('button');
+    button.textContent = value;
+    button.onclick = () => { ratio = value; ratios.classList.remove('open'); };
+    ratios.appendChild(button);
+  });
+}
+// 面板打开后选项延迟 ratioDelayMs 才渲染（模拟页面卡顿、后台标签页）
+document.getElementById('aspect').onclick = () => {
+  ratios.innerHTML = '';
+  if (ratios.classList.toggle('open')) setTimeout(renderRatios, CONFIG.ratioDelayMs);
+};
+
+document.getElementById('prompt').addEventListener('keydown', (event) => {
+  if (event.key !== 'Enter' || event.shiftKey) return;
+  event.preventDefault();
+  if (event.target.value.trim()) generate();
+});
+
+function generate() {
+  const status = document.getElementById('status');
+  status.textContent = '生成中...';
+  setTimeout(() => {
+    const results = document.getElementById('results');
+    if (!CONFIG.keepHistory) results.innerHTML = '';
+    const batch = document.createElement('div');
+    batch.className = 'batch';
+    batch.dataset.ratio = ratio;
+    for (let i = 0; i < CONFIG.imagesPerGeneration; i++) {
+      const n = ++counter;
+      const item = document.createElement('div');
+      item.className = 'result';
+      const img = document.createElement('img');
+      img.src = '/media/googleusercontent.com/' + n + '.png';
+      const button = document.createElement('button');
+      button.setAttribute('aria-label', '下载图片');
+      button.textContent = 'download';
+      button.onclick = () => {
+        const link = document.createElement('a');
+        link.href = '/download/' + n + '.png?ratio=' + encodeURIComponent(batch.dataset.ratio);
+        link.download = 'whisk_' + n + '.png';
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+      };
+      item.append(img, button);
+      batch.appendChild(item);
+    }
+    results.prepend(batch);
+    status.textContent = '';
+  }, CONFIG.latencyMs);
+}
+</script>
+</body>
+</html>
+"""
+
+
+def make_png(seed: int, size: int = 512, noise_kb: int = 64) -> bytes:
+    """生成 size x size 的 RGB PNG；前 noise_kb KB 像素为随机噪声，控制文件大小且每张内容不同"""
+    noise = random.Random(seed).randbytes(noise_kb * 1024)
+    row_bytes = size * 3
+    raw = bytearray()
+    for y in range(size):
+        raw += b'\x00' + noise[y * row_bytes:(y + 1) * row_bytes].ljust(row_bytes, b'\x80')
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(bytes(raw), 6)) + chunk(b'IEND', b''))
+
+
+class FakeWhiskServer:
+    """模拟 Whisk 页面的 HTTP 服务（后台线程运行）"""
+
+    def __init__(self, latency: float = 3.0, image_kb: int = 64, keep_history: bool = False,
+                 images_per_generation: int = 2, ratio_delay: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.image_kb = image_kb
+        self.keep_history = keep_history
+        self.images_per_generation = images_per_generation
+        self.ratio_delay = ratio_delay
+
+        self.request_counts: Dict[str, int] = {}
+        # 下载的图片按生成时页面所选纵横比计数，用于检查纵横比是否选择成功
+        self.download_ratios: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def page_url(self) -> str:
+        return self.url + FAKE_WHISK_PATH
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.request_counts[kind] = self.request_counts.get(kind, 0) + 1
+
+    def render_page(self) -> bytes:
+        config = {
+            'latencyMs': int(self.latency * 1000),
+            'keepHistory': self.keep_history,
+            'imagesPerGeneration': self.images_per_generation,
+            'ratioDelayMs': int(self.ratio_delay * 1000),
+        }
+        return FAKE_WHISK_HTML.replace('__CONFIG__', json.dumps(config)).encode('utf-8')
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, body: bytes, content_type: str, extra_headers: Optional[Dict] = None):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (extra_headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path, _, query = self.path.partition('?')
+                if path.startswith(FAKE_WHISK_PATH):
+                    server._count('page')
+                    self._send(server.render_page(), 'text/html; charset=utf-8')
+                    return
+
+                match = re.fullmatch(r'/(media/googleusercontent\.com|download)/(\d+)\.png', path)
+                if match:
+                    kind = 'image' if match.group(1) != 'download' else 'download'
+                    server._count(kind)
+                    headers = {'Cache-Control': 'no-store'}
+                    if kind == 'download':
+                        ratio = parse_qs(query).get('ratio', ['?'])[0]
+                        with server._lock:
+                            server.download_ratios[ratio] = server.download_ratios.get(ratio, 0) + 1
+                        headers['Content-Disposition'] = f'attachment; filename="whisk_{match.group(2)}.png"'
+                    self._send(make_png(int(match.group(2)), noise_kb=server.image_kb), 'image/png', headers)
+                    return
+
+                self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'FakeWhiskServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class ChromiumProcess:
+    """开启远程调试端口的 Chromium 进程（代替比特浏览器窗口）"""
+
+    def __init__(self, url: str, headless: bool = True, executable_path: Optional[str] = None,
+                 startup_timeout: float = 30):
+        self.user_data_dir = Path(tempfile.mkdtemp(prefix="whisk_bench_"))
+        executable_path = executable_path or self.default_executable()
+        args = [
+            executable_path,
+            f"--user-data-dir={self.user_data_dir}",
+            "--remote-debugging-port=0",
+            "--no-first-run",
+            "--no-default-browser-check",
+        ]
+        if headless:
+            args.append("--headless=new")
+        if hasattr(os, 'geteuid') and os.geteuid() == 0:
+            # 以 root 运行（如容器中）时 Chromium 拒绝启用沙箱
+            args.append("--no-sandbox")
+        args.append(url)
+
+        self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.ws_endpoint = self._wait_for_endpoint(startup_timeout)
+
+    @staticmethod
+    def default_executable() -> str:
+        """Playwright 自带的 Chromium"""
+        from playwright.sync_api import sync_playwright
+        with sync_playwright() as playwright:
+            return playwright.chromium.executable_path
+
+    def _wait_for_endpoint(self, timeout: float) -> str:
+        # Chromium 启动后把端口和 ws 路径写入 DevToolsActivePort
+        port_file = self.user_data_dir / "DevToolsActivePort"
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Chromium 启动失败，退出码 {self.process.returncode}")
+            try:
+                port, path = port_file.read_text().split()[:2]
+                return f"ws://127.0.0.1:{port}{path}"
+            except (OSError, ValueError):
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("等待 Chromium 远程调试端口超时")
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+def python_peak_rss_mb() -> Optional[float]:
+    """本进程的峰值内存（MB）；不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # Linux 上 ru_maxrss 单位为 KB，macOS 为字节
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor, 1)
+
+
+def _proc_children() -> Dict[int, List[int]]:
+    """Linux /proc 中的 父进程 -> 子进程 映射"""
+    children: Dict[int, List[int]] = {}
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            # comm 中可能含空格，ppid 位于最后一个 ")" 之后的第二个字段
+            ppid = int((entry / 'stat').read_text().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry.name))
+    return children
+
+
+def _proc_rss_bytes(pid: int) -> int:
+    try:
+        for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def process_tree_rss_bytes(pids: List[int]) -> Optional[int]:
+    """
+    若干进程及其全部子进程（Chromium 的渲染、GPU 等进程）当前的 RSS 之和
+    优先使用 psutil，其次 Linux /proc；都不可用时返回 None
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    if psutil is not None:
+        total = 0
+        for pid in pids:
+            try:
+                root = psutil.Process(pid)
+                for process in [root] + root.children(recursive=True):
+                    try:
+                        total += process.memory_info().rss
+                    except psutil.Error:
+                        continue
+            except psutil.Error:
+                continue
+        return total
+
+    if not Path('/proc/self/status').exists():
+        return None
+    children = _proc_children()
+    total, stack, seen = 0, list(pids), set()
+    while stack:
+        pid = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        total += _proc_rss_bytes(pid)
+        stack.extend(children.get(pid, []))
+    return total
+
+
+class BrowserMemorySampler:
+    """后台线程定期采样所有浏览器进程树的 RSS 之和，记录峰值（MB）"""
+
+    def __init__(self, pids: List[int], interval: float = 0.5):
+        self.pids = pids
+        self.interval = interval
+        self.peak_mb: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        total = process_tree_rss_bytes(self.pids)
+        if total is not None:
+            mb = round(total / (1024 * 1024), 1)
+            self.peak_mb = mb if self.peak_mb is None else max(self.peak_mb, mb)
+
+    def _run(self):
+        while True:
+            self._sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self) -> 'BrowserMemorySampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def _run_sync(profiles: List[Dict], output_dir: Path, prompt: str, count: int, aspect_ratio: str,
+              min_delay: int, max_delay: int, core_options: Dict,
+              message_callback: Callable, metrics_callback: Callable) -> List[Dict]:
+    """每个窗口一个线程，同步核心类端到端运行"""
+    from whisk_core_v2 import WhiskAutomationCoreV2
+
+    results = [None] * len(profiles)
+
+    def run_profile(slot: int, browser_id: str):
+        automation = WhiskAutomationCoreV2(
+            browser_id=browser_id,
+            save_directory=str(output_dir / browser_id),
+            message_callback=lambda msg: message_callback(f"[{browser_id}] {msg}"),
+            metrics_callback=metrics_callback,
+            **core_options
+        )
+        result = {'browser_id': browser_id, 'success': True, 'error': None}
+        try:
+            automation.run(prompt, count, aspect_ratio, min_delay, max_delay)
+        except Exception as e:
+            result.update(success=False, error=str(e))
+        result.update(downloaded=automation.downloaded_count, metrics=automation.metrics_summary)
+        results[slot] = result
+
+    threads = [threading.Thread(target=run_profile, args=(slot, profile['id']))
+               for slot, profile in enumerate(profiles)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _run_async(profiles: List[Dict], output_dir: Path, prompt: str, count: int, aspect_ratio: str,
+               min_delay: int, max_delay: int, core_options: Dict,
+               message_callback: Callable, metrics_callback: Callable) -> List[Dict]:
+    """所有窗口共享一个事件循环和 Playwright 驱动（run_many）"""
+    from whisk_core_async_v2 import run_many
+
+    jobs = [dict(core_options, browser_id=profile['id'], save_directory=str(output_dir / profile['id']),
+                 prompt=prompt, count=count, aspect_ratio=aspect_ratio,
+                 min_delay=min_delay, max_delay=max_delay, metrics_callback=metrics_callback)
+            for profile in profiles]
+    return asyncio.run(run_many(jobs, message_callback=message_callback))
+
+
+def run_benchmark(profiles: int = 1, count: int = 5, latency: float = 3.0, image_kb: int = 64,
+                  aspect_ratio: str = "1:1", prompt: str = "A benchmark landscape",
+                  min_delay: int = 0, max_delay: int = 0, core_options: Optional[Dict] = None,
+                  use_async: bool = False, headless: bool = True, keep_history: bool = False,
+                  executable_path: Optional[str] = None, ratio_delay: float = 0.0,
+                  message_callback: Optional[Callable] = None) -> Dict:
+    """端到端运行基准测试并返回报告（executable_path 为空时使用 Playwright 自带的 Chromium）"""
+    message_callback = message_callback or (lambda msg: None)
+    core_options = core_options or {}
+    output_dir = Path(tempfile.mkdtemp(prefix="whisk_bench_out_"))
+
+    # 所有窗口的阶段事件汇总到同一个指标对象
+    combined = RunMetrics()
+
+    def metrics_callback(event: Dict):
+        if event['type'] == 'span':
+            combined.observe(event['name'], event['seconds'], event['ok'])
+        elif event['type'] == 'count':
+            combined.count(event['name'], event['value'])
+
+    browsers = []
+    stub = None
+    try:
+        with FakeWhiskServer(latency=latency, image_kb=image_kb, keep_history=keep_history,
+                             ratio_delay=ratio_delay) as fake:
+            executable_path = executable_path or ChromiumProcess.default_executable()
+            for _ in range(profiles):
+                browsers.append(ChromiumProcess(fake.page_url, headless=headless, executable_path=executable_path))
+
+            stub = BitBrowserStubServer(BitBrowserStubServer.make_profiles(profiles)).start()
+            stub.ws_endpoints = {p['id']: b.ws_endpoint for p, b in zip(stub.profiles, browsers)}
+            set_client(BitBrowserClient(stub.url))
+
+            runner = _run_async if use_async else _run_sync
+            start_time = time.time()
+            with BrowserMemorySampler([b.process.pid for b in browsers]) as memory:
+                results = runner(stub.profiles, output_dir, prompt, count, aspect_ratio, min_delay, max_delay,
+                                 core_options, message_callback, metrics_callback)
+            seconds = time.time() - start_time
+            server_requests = dict(fake.request_counts)
+            download_ratios = dict(fake.download_ratios)
+    finally:
+        set_client(None)
+        if stub:
+            stub.stop()
+        for browser in browsers:
+            browser.stop()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    images = sum(r['downloaded'] for r in results)
+    summary = combined.summary()
+    total_bytes = sum((r.get('metrics') or {}).get('bytes', 0) for r in results)
+    return {
+        'config': {
+            'profiles': profiles, 'count': count, 'latency': latency, 'image_kb': image_kb,
+            'aspect_ratio': aspect_ratio, 'min_delay': min_delay, 'max_delay': max_delay,
+            'async': use_async, 'core_options': core_options, 'executable': executable_path,
+            'ratio_delay': ratio_delay,
+        },
+        'seconds': round(seconds, 2),
+        'images': images,
+        'images_per_minute': round(images / seconds * 60, 2) if seconds > 0 else None,
+        'expected_images': profiles * count * fake.images_per_generation,
+        'failed_profiles': [r['browser_id'] for r in results if not r['success']],
+        'bytes': total_bytes,
+        'stages': summary['stages'],
+        'counters': summary['counters'],
+        'server_requests': server_requests,
+        # 以其他纵横比生成的下载数（纵横比选择失败时不为 0）
+        'downloads_by_ratio': download_ratios,
+        'wrong_ratio_downloads': sum(n for r, n in download_ratios.items() if r != aspect_ratio),
+        # browsers: 运行期间采样到的所有浏览器进程树 RSS 之和的峰值（无法采样时为 None）
+        'peak_rss_mb': {'python': python_peak_rss_mb(), 'browsers': memory.peak_mb},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Whisk 自动化离线基准测试")
+    parser.add_argument('--profiles', type=int, default=1, help="模拟的浏览器窗口数")
+    parser.add_argument('--count', type=int, default=5, help="每个窗口的生成次数")
+    parser.add_argument('--latency', type=float, default=3.0, help="模拟生成耗时（秒）")
+    parser.add_argument('--image-kb', type=int, default=64, help="每张图片的大致大小（KB）")
+    parser.add_argument('--ratio', default='1:1')
+    parser.add_argument('--min-delay', type=int, default=0)
+    parser.add_argument('--max-delay', type=int, default=0)
+    parser.add_argument('--wait-mode', choices=('event', 'poll'), default='event')
+    parser.add_argument('--capture-mode', choices=('click', 'network'), default='click')
+    parser.add_argument('--pacing', choices=('static', 'adaptive'), default='static',
+                        help="生成间隔：static 在延时范围内随机，adaptive 按服务状态自动调整")
+    parser.add_argument('--input-mode', choices=('fill', 'js', 'type'), default='fill')
+    parser.add_argument('--pipeline', action='store_true')
+    parser.add_argument('--tabs', type=int, default=1, help="每个窗口同时使用的标签页数（比较多标签页的吞吐）")
+    parser.add_argument('--no-enhanced-download', action='store_true')
+    parser.add_argument('--async', dest='use_async', action='store_true', help="使用异步核心类（run_many）")
+    parser.add_argument('--keep-history', action='store_true', help="模拟页面保留之前的生成结果")
+    parser.add_argument('--ratio-delay', type=float, default=0.0,
+                        help="纵横比面板打开后选项延迟出现的秒数（检查选项晚出现时仍能选中）")
+    parser.add_argument('--headful', action='store_true', help="显示浏览器窗口")
+    parser.add_argument('--executable', help="Chromium/Chrome 可执行文件（默认使用 Playwright 自带的 Chromium）")
+    parser.add_argument('--output', help="报告另存为 JSON 文件")
+    parser.add_argument('--verbose', action='store_true', help="输出核心日志")
+    args = parser.parse_args(argv)
+
+    core_options = {
+        'use_enhanced_download': not args.no_enhanced_download,
+        'wait_mode': args.wait_mode,
+        'capture_mode': args.capture_mode,
+        'input_mode': args.input_mode,
+        'pacing': args.pacing,
+        'pipeline': args.pipeline,
+        'tabs': args.tabs,
+    }
+    report = run_benchmark(
+        profiles=args.profiles, count=args.count, latency=args.latency, image_kb=args.image_kb,
+        aspect_ratio=args.ratio, min_delay=args.min_delay, max_delay=args.max_delay,
+        core_options=core_options, use_async=args.use_async, headless=not args.headful,
+        keep_history=args.keep_history, executable_path=args.executable, ratio_delay=args.ratio_delay,
+        message_callback=(lambda msg: print(msg, file=sys.stderr)) if args.verbose else None,
+    )
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding='utf-8')
+    return 0 if not report['failed_profiles'] and not report['wrong_ratio_downloads'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
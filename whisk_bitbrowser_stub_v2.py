@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+比特浏览器本地 API 桩服务
+模拟 /browser/list（分页）和 /browser/open，用于离线测试和基准测试
+
+用法: python whisk_bitbrowser_stub_v2.py --port 54345 --profiles 300 --ws ws://127.0.0.1:9222/devtools/browser/xxx
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+class BitBrowserStubServer:
+    """比特浏览器 API 桩服务（后台线程运行）"""
+
+    def __init__(self, profiles: Optional[List[Dict]] = None, ws_endpoint: str = "",
+                 host: str = "127.0.0.1", port: int = 0, max_page_size: int = 100):
+        self.profiles = profiles if profiles is not None else self.make_profiles(3)
+        self.ws_endpoint = ws_endpoint
+        self.ws_endpoints: Dict[str, str] = {}  # browser_id -> ws，优先于 ws_endpoint
+        self.max_page_size = max_page_size
+
+        # 各接口的调用次数和 TCP 连接数，便于验证缓存和连接复用是否生效
+        self.request_counts: Dict[str, int] = {}
+        self.connection_count = 0
+        self._lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @staticmethod
+    def make_profiles(count: int, running: bool = True) -> List[Dict]:
+        """生成 count 个模拟窗口"""
+        return [
+            {'id': f"stub{i:04d}", 'name': f"窗口{i}", 'status': 1 if running else 0}
+            for i in range(count)
+        ]
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count_connection(self):
+        with self._lock:
+            self.connection_count += 1
+
+    def _count(self, path: str):
+        with self._lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+    def handle(self, path: str, payload: Dict) -> Dict:
+        """处理一个 API 请求，返回响应 JSON"""
+        self._count(path)
+
+        if path == '/browser/list':
+            page = int(payload.get('page', 0))
+            page_size = min(int(payload.get('pageSize', 10)), self.max_page_size)
+            items = self.profiles[page * page_size:(page + 1) * page_size]
+            return {'success': True, 'data': {
+                'list': items, 'page': page, 'pageSize': page_size, 'totalNum': len(self.profiles)
+            }}
+
+        if path == '/browser/open':
+            browser_id = payload.get('id')
+            profile = next((p for p in self.profiles if p['id'] == browser_id), None)
+            if profile is None:
+                return {'success': False, 'msg': f"窗口不存在: {browser_id}"}
+            profile['status'] = 1
+            ws = self.ws_endpoints.get(browser_id, self.ws_endpoint)
+            return {'success': True, 'data': {'ws': ws, 'http': ws}}
+
+        return {'success': False, 'msg': f"未知接口: {path}"}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 与比特浏览器一样使用 HTTP/1.1 长连接，一个连接可处理多个请求
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                server._count_connection()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    payload = {}
+
+                body = json.dumps(server.handle(self.path, payload), ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'BitBrowserStubServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比特浏览器 API 桩服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=54345)
+    parser.add_argument('--profiles', type=int, default=3, help="模拟窗口数量")
+    parser.add_argument('--ws', default='', help="/browser/open 返回的 CDP 端点")
+    args = parser.parse_args()
+
+    server = BitBrowserStubServer(BitBrowserStubServer.make_profiles(args.profiles),
+                                  ws_endpoint=args.ws, host=args.host, port=args.port)
+    print(f"比特浏览器桩服务运行于 {server.url}（{args.profiles} 个窗口）")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
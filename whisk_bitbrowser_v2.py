@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 比特浏览器 API 客户端
+从固定数量的 requests.Session 中借用连接（Session 不保证线程安全，同一时刻只给一个线程使用），缓存 /browser/list 结果和 /browser/open 返回的 ws 端点，
+并支持超过单页数量的窗口列表分页获取
+"""
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import requests
+
+
+class BitBrowserError(Exception):
+    """比特浏览器 API 返回失败或格式错误"""
+
+
+class BitBrowserClient:
+    """比特浏览器本地 API 客户端（线程安全）"""
+
+    DEFAULT_URL = "http://127.0.0.1:54345"
+
+    # 比特浏览器单页最多返回 100 个窗口
+    PAGE_SIZE = 100
+
+    def __init__(self, base_url: str = DEFAULT_URL, list_ttl: float = 10,
+                 endpoint_ttl: float = 300, timeout: float = 10, max_sessions: int = 4):
+        self.base_url = base_url.rstrip('/')
+        self.list_ttl = list_ttl
+        self.endpoint_ttl = endpoint_ttl
+        self.timeout = timeout
+
+        # 空闲的 Session；最多创建 max_sessions 个，都在使用中时等待归还
+        self.max_sessions = max(1, max_sessions)
+        self._idle_sessions: queue.LifoQueue = queue.LifoQueue()
+        self._session_count = 0
+        self._lock = threading.Lock()
+        self._list_cache = None  # (时间戳, 窗口列表)
+        self._endpoint_cache: Dict[str, tuple] = {}  # browser_id -> (时间戳, ws)
+
+    @contextmanager
+    def _session(self):
+        """借用一个 Session，用完归还（线程再多也只保持 max_sessions 个连接）"""
+        try:
+            session = self._idle_sessions.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._session_count < self.max_sessions
+                if create:
+                    self._session_count += 1
+            session = requests.Session() if create else self._idle_sessions.get()
+        try:
+            yield session
+        finally:
+            self._idle_sessions.put(session)
+
+    def _post(self, path: str, payload: Dict, timeout: Optional[float] = None):
+        """发送请求并返回响应中的 data 字段"""
+        with self._session() as session:
+            response = session.post(f"{self.base_url}{path}", json=payload,
+                                    timeout=timeout or self.timeout)
+        if response.status_code != 200:
+            raise BitBrowserError(f"比特浏览器API请求失败: {response.status_code} {response.text}")
+
+        data = response.json()
+        if not data.get('success') or 'data' not in data:
+            raise BitBrowserError(f"比特浏览器API返回失败: {data.get('msg', data)}")
+        return data['data']
+
+    def list_browsers(self, force_refresh: bool = False, timeout: Optional[float] = None) -> List[Dict]:
+        """获取全部窗口列表（自动翻页，结果缓存 list_ttl 秒）"""
+        with self._lock:
+            cached = self._list_cache
+        if not force_refresh and cached and time.time() - cached[0] < self.list_ttl:
+            return list(cached[1])
+
+        browsers = []
+        page = 0
+        while True:
+            data = self._post("/browser/list", {"page": page, "pageSize": self.PAGE_SIZE}, timeout)
+            if not isinstance(data, dict) or 'list' not in data:
+                raise BitBrowserError("API响应格式错误")
+
+            page_list = [b for b in data['list'] if isinstance(b, dict)]
+            browsers.extend(page_list)
+
+            total = data.get('totalNum')
+            if len(page_list) < self.PAGE_SIZE or (total is not None and len(browsers) >= total):
+                break
+            page += 1
+
+        with self._lock:
+            self._list_cache = (time.time(), browsers)
+        return list(browsers)
+
+    def open_browser(self, browser_id: str, force_refresh: bool = False) -> str:
+        """打开窗口并返回 CDP ws 端点（端点缓存 endpoint_ttl 秒）"""
+        with self._lock:
+            cached = self._endpoint_cache.get(browser_id)
+        if not force_refresh and cached and time.time() - cached[0] < self.endpoint_ttl:
+            return cached[1]
+
+        data = self._post("/browser/open", {"id": browser_id})
+        if not isinstance(data, dict) or 'ws' not in data:
+            raise BitBrowserError("无法从响应中获取WebSocket端点")
+
+        ws_endpoint = data['ws']
+        with self._lock:
+            self._endpoint_cache[browser_id] = (time.time(), ws_endpoint)
+        return ws_endpoint
+
+    def invalidate_endpoint(self, browser_id: str):
+        """清除窗口的 ws 端点缓存（连接失败时调用）"""
+        with self._lock:
+            self._endpoint_cache.pop(browser_id, None)
+
+    def invalidate_list(self):
+        """清除窗口列表缓存"""
+        with self._lock:
+            self._list_cache = None
+
+    def close(self):
+        """关闭空闲的 Session（之后的请求会重新创建）"""
+        while True:
+            try:
+                session = self._idle_sessions.get_nowait()
+            except queue.Empty:
+                break
+            session.close()
+            with self._lock:
+                self._session_count -= 1
+
+
+_default_client: Optional[BitBrowserClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> BitBrowserClient:
+    """进程级默认客户端"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = BitBrowserClient()
+        return _default_client
+
+
+def set_client(client: Optional[BitBrowserClient]):
+    """替换进程级默认客户端（例如指向桩服务进行基准测试），None 表示恢复默认"""
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 任务取消
+CancellationToken 由界面（或调度器）创建并传给核心类，核心类的所有等待都通过它进行：
+取消后正在进行的等待立即结束并抛出 TaskCancelled，run() 随即清理资源、归还浏览器连接
+"""
+
+import asyncio
+import threading
+from typing import Callable, List
+
+
+class TaskCancelled(BaseException):
+    """
+    任务已被取消
+    与 asyncio.CancelledError 一样继承 BaseException，
+    不会被核心类中大量"记录日志后继续"的 except Exception 吞掉
+    """
+
+
+class CancellationToken:
+    """线程安全的取消标记，同一个标记可以被多个线程和事件循环等待"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable] = []
+        self.reason = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "任务已停止"):
+        """请求取消（可重复调用，只有第一次生效）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TaskCancelled(self.reason)
+
+    def sleep(self, seconds: float):
+        """可被取消打断的 time.sleep"""
+        if self._event.wait(max(0.0, seconds)):
+            raise TaskCancelled(self.reason)
+
+    def _add_callback(self, callback: Callable) -> bool:
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self._callbacks.append(callback)
+            return True
+
+    def _remove_callback(self, callback: Callable):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    async def sleep_async(self, seconds: float):
+        """可被取消打断的 asyncio.sleep（取消可以来自其他线程）"""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+
+        if not self._add_callback(wake):
+            raise TaskCancelled(self.reason)
+        try:
+            await asyncio.wait_for(waiter, max(0.0, seconds))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._remove_callback(wake)
+        self.raise_if_cancelled()
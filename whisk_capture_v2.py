@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 网络拦截图片捕获
+监听页面 response 事件，直接保存生成图片的原始字节，
+无需点击下载按钮，也不会像截图那样重新编码
+"""
+
+import asyncio
+import base64
+import json
+import re
+import time
+from typing import List, Optional, Sequence, Tuple
+
+
+def guess_image_ext(data: bytes, content_type: str = "") -> str:
+    """根据文件头（或 content-type）判断图片扩展名"""
+    if data.startswith(b'\x89PNG'):
+        return '.png'
+    if data.startswith(b'\xff\xd8'):
+        return '.jpg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return '.gif'
+
+    content_type = content_type.lower()
+    for mime, ext in (('png', '.png'), ('webp', '.webp'), ('gif', '.gif')):
+        if mime in content_type:
+            return ext
+    return '.jpg'
+
+
+class ImageResponseCapture:
+    """生成图片的网络响应捕获器"""
+
+    # 直接返回图片字节的响应（按 URL 匹配）
+    IMAGE_URL_PATTERNS = (
+        r'googleusercontent\.com',
+        r'storage\.googleapis\.com',
+    )
+
+    # 以 JSON + base64 返回图片的生成接口
+    JSON_URL_PATTERNS = (
+        r'generateImage',
+        r'runImageFx',
+    )
+
+    # JSON 中保存 base64 图片的字段名
+    JSON_IMAGE_KEYS = ('encodedImage', 'encoded_image', 'imageBytes', 'bytesBase64Encoded')
+
+    # 小于该字节数的图片视为图标/头像，忽略
+    MIN_IMAGE_BYTES = 20 * 1024
+
+    def __init__(self, page, image_url_patterns: Optional[Sequence[str]] = None,
+                 json_url_patterns: Optional[Sequence[str]] = None,
+                 min_image_bytes: Optional[int] = None):
+        self.page = page
+        self.image_url_re = re.compile('|'.join(image_url_patterns or self.IMAGE_URL_PATTERNS))
+        self.json_url_re = re.compile('|'.join(json_url_patterns or self.JSON_URL_PATTERNS))
+        self.min_image_bytes = self.MIN_IMAGE_BYTES if min_image_bytes is None else min_image_bytes
+
+        self._pending = []
+        self._armed = False
+        self._listening = False
+
+    def start(self):
+        """开始监听页面响应"""
+        if not self._listening:
+            self.page.on('response', self._on_response)
+            self._listening = True
+
+    def stop(self):
+        """停止监听"""
+        if self._listening:
+            try:
+                self.page.remove_listener('response', self._on_response)
+            except Exception:
+                pass
+            self._listening = False
+        self._pending = []
+        self._armed = False
+
+    def arm(self):
+        """开始新一轮捕获（在触发生成前调用），丢弃之前的响应"""
+        self._pending = []
+        self._armed = True
+
+    def _on_response(self, response):
+        """response 事件回调：只记录匹配的响应，正文在 collect 中读取"""
+        if not self._armed:
+            return
+
+        try:
+            url = response.url
+            content_type = response.headers.get('content-type', '')
+
+            if content_type.startswith('image/') and self.image_url_re.search(url):
+                self._pending.append(('image', response, content_type))
+            elif 'json' in content_type and self.json_url_re.search(url):
+                self._pending.append(('json', response, content_type))
+        except Exception:
+            pass
+
+    def _extract_json_images(self, text: str) -> List[bytes]:
+        """从生成接口的 JSON 中提取 base64 图片"""
+        # 部分接口会加 )]}' 防劫持前缀
+        text = text.lstrip(")]}'\n ")
+        images = []
+
+        def walk(node):
+            if isinstance(node, dict):
+                for key, value in node.items():
+                    if key in self.JSON_IMAGE_KEYS and isinstance(value, str):
+                        try:
+                            images.append(base64.b64decode(value))
+                        except Exception:
+                            pass
+                    else:
+                        walk(value)
+            elif isinstance(node, list):
+                for item in node:
+                    walk(item)
+
+        walk(json.loads(text))
+        return images
+
+    def _accept(self, candidates: List[bytes], content_type: str,
+                images: List[Tuple[bytes, str]], seen: set):
+        """过滤小图和重复图片后加入结果列表"""
+        for data in candidates:
+            # 同一张图片可能被多次请求（缩略图/原图），按长度+头部粗略去重
+            key = (len(data), data[:64])
+            if len(data) < self.min_image_bytes or key in seen:
+                continue
+            seen.add(key)
+            images.append((data, guess_image_ext(data, content_type)))
+
+    def collect(self, expected: int, timeout: float = 10) -> List[Tuple[bytes, str]]:
+        """
+        读取本轮捕获到的图片，返回 [(图片字节, 扩展名), ...]
+        同步 API 只在 Playwright 调用期间分发事件，因此用 wait_for_timeout 让出等待
+        """
+        images = []
+        seen = set()
+        processed = 0
+        deadline = time.time() + timeout
+
+        while True:
+            pending = self._pending[processed:]
+            processed += len(pending)
+
+            for kind, response, content_type in pending:
+                try:
+                    if kind == 'image':
+                        candidates = [response.body()]
+                    else:
+                        candidates = self._extract_json_images(response.text())
+                except Exception:
+                    continue
+                self._accept(candidates, content_type, images, seen)
+
+            if len(images) >= expected or time.time() >= deadline:
+                break
+            self.page.wait_for_timeout(200)
+
+        self._armed = False
+        return images
+
+    async def collect_async(self, expected: int, timeout: float = 10) -> List[Tuple[bytes, str]]:
+        """collect 的 async_api 版本，page 为 playwright.async_api 的 Page"""
+        images = []
+        seen = set()
+        processed = 0
+        deadline = time.time() + timeout
+
+        while True:
+            pending = self._pending[processed:]
+            processed += len(pending)
+
+            for kind, response, content_type in pending:
+                try:
+                    if kind == 'image':
+                        candidates = [await response.body()]
+                    else:
+                        candidates = self._extract_json_images(await response.text())
+                except Exception:
+                    continue
+                self._accept(candidates, content_type, images, seen)
+
+            if len(images) >= expected or time.time() >= deadline:
+                break
+            await asyncio.sleep(0.2)
+
+        self._armed = False
+        return images
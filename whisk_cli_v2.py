@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 命令行批量运行（无界面）
+从 JSONL/CSV 文件读取任务，按指定并发运行，进度以 JSON Lines 输出到标准输出
+
+任务字段: prompt, aspect_ratio (或 ratio), count, output_dir (或 save_directory), browser_id
+用法: python whisk_cli_v2.py jobs.jsonl --concurrency 3 --browser <默认窗口ID>
+Ctrl-C 取消所有任务：正在运行的任务在下一个等待点停止并归还浏览器，排队的任务不再运行
+"""
+
+import argparse
+import csv
+import json
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+_emit_lock = threading.Lock()
+
+
+def emit(event: str, **fields):
+    """输出一行 JSON 进度事件"""
+    record = {'event': event, 'time': round(time.time(), 3)}
+    record.update(fields)
+    with _emit_lock:
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
+def load_jobs(path: str, defaults: Optional[Dict] = None) -> List[Dict]:
+    """读取任务文件（.csv 按表头解析，其他按 JSONL 解析）并补全默认值"""
+    defaults = defaults or {}
+    path = Path(path)
+
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if path.suffix.lower() == '.csv':
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+    jobs = []
+    for number, row in enumerate(rows, 1):
+        prompt = (row.get('prompt') or '').strip()
+        if not prompt:
+            raise ValueError(f"第 {number} 个任务缺少 prompt")
+
+        browser_id = row.get('browser_id') or defaults.get('browser_id')
+        if not browser_id:
+            raise ValueError(f"第 {number} 个任务缺少 browser_id（可用 --browser 指定默认值）")
+
+        jobs.append({
+            'job': number,
+            'prompt': prompt,
+            'aspect_ratio': row.get('aspect_ratio') or row.get('ratio') or defaults.get('aspect_ratio', '1:1'),
+            'count': int(row.get('count') or defaults.get('count', 1)),
+            'output_dir': row.get('output_dir') or row.get('save_directory') or defaults.get('output_dir', './downloads'),
+            'browser_id': str(browser_id),
+        })
+    return jobs
+
+
+def run_jobs(jobs: List[Dict], concurrency: int, core_options: Dict,
+             min_delay: int, max_delay: int, verbose: bool = False, resume: bool = False,
+             expand: bool = False, variables_dir: Optional[str] = None) -> List[Dict]:
+    """
+    运行任务：同一窗口的任务在连接池线程中依次执行（复用连接），
+    不同窗口之间最多 concurrency 个任务同时运行；resume=True 时按各保存目录的任务日志续跑
+    expand=True 时任务的提示词按模板展开（见 whisk_template_v2），展开结果在同一会话中依次生成
+    所有任务共用一个取消标记（core_options 中未给出时新建），Ctrl-C 时取消全部任务并等待它们退出
+    """
+    from whisk_cancel_v2 import CancellationToken, TaskCancelled
+    from whisk_core_v2 import WhiskAutomationCoreV2
+    from whisk_pool_v2 import CDPConnectionPool
+    from whisk_template_v2 import expand_prompts
+
+    cancel_token = core_options.get('cancel_token') or CancellationToken()
+    core_options = dict(core_options, cancel_token=cancel_token)
+    pool = CDPConnectionPool()
+    slots = threading.BoundedSemaphore(max(1, concurrency))
+    results = []
+
+    def run_job(job: Dict) -> Dict:
+        with slots:
+            job_id = job['job']
+            start_time = time.time()
+            emit('job_start', job=job_id, browser_id=job['browser_id'],
+                 count=job['count'], aspect_ratio=job['aspect_ratio'])
+
+            def message_callback(msg):
+                if verbose:
+                    emit('log', job=job_id, message=msg)
+
+            def progress_callback(current, total):
+                emit('progress', job=job_id, current=current, total=total)
+
+            result = {'job': job_id, 'browser_id': job['browser_id'], 'success': True, 'error': None,
+                      'cancelled': False}
+            automation = None
+            try:
+                # 目录或参数有误时只让这一行任务失败，不影响其他任务和结果汇总
+                Path(job['output_dir']).mkdir(parents=True, exist_ok=True)
+                automation = WhiskAutomationCoreV2(
+                    browser_id=job['browser_id'],
+                    save_directory=job['output_dir'],
+                    message_callback=message_callback,
+                    progress_callback=progress_callback,
+                    connection_pool=pool,
+                    **core_options
+                )
+
+                if expand:
+                    prompts = expand_prompts([job['prompt']], variables_dir=variables_dir)
+                    session = automation.run_session(prompts, job['aspect_ratio'], job['count'],
+                                                     min_delay, max_delay, resume)
+                    result.update(prompts=session['prompts'], failed_prompts=session['failed'])
+                else:
+                    automation.run(job['prompt'], job['count'], job['aspect_ratio'], min_delay, max_delay, resume)
+            except TaskCancelled as e:
+                result.update(success=False, cancelled=True, error=str(e))
+            except Exception as e:
+                result.update(success=False, error=str(e))
+
+            result['downloaded'] = automation.downloaded_count if automation else 0
+            result['metrics'] = automation.metrics_summary if automation else None
+            result['seconds'] = round(time.time() - start_time, 2)
+            emit('job_done', **result)
+            return result
+
+    futures = [pool.submit(job['browser_id'], run_job, job) for job in jobs]
+    try:
+        try:
+            for future in futures:
+                results.append(_wait(future))
+        except KeyboardInterrupt:
+            # 先取消，再等待：运行中的任务在下一个等待点退出，排队的任务立即结束
+            cancel_token.cancel("用户中断")
+            emit('interrupted', finished=len(results), remaining=len(futures) - len(results))
+            for future in futures[len(results):]:
+                results.append(future.result())
+    finally:
+        pool.shutdown()
+
+    return results
+
+
+def _wait(future):
+    """分段等待 future：Windows 上无超时的等待不响应 Ctrl-C"""
+    while True:
+        try:
+            return future.result(timeout=0.5)
+        except FutureTimeoutError:
+            continue
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Whisk AI 命令行批量生成（无界面）")
+    parser.add_argument('jobs', help="任务文件（.jsonl 或 .csv）")
+    parser.add_argument('--concurrency', type=int, default=2, help="同时运行的任务数（不同浏览器窗口）")
+    parser.add_argument('--browser', help="任务未指定 browser_id 时使用的窗口ID")
+    parser.add_argument('--ratio', default='1:1', help="默认纵横比")
+    parser.add_argument('--count', type=int, default=1, help="默认生成次数")
+    parser.add_argument('--output-dir', default='./downloads', help="默认保存目录")
+    parser.add_argument('--min-delay', type=int, default=5)
+    parser.add_argument('--max-delay', type=int, default=8)
+    parser.add_argument('--wait-mode', choices=('event', 'poll'), default='event')
+    parser.add_argument('--capture-mode', choices=('click', 'network'), default='click')
+    parser.add_argument('--pacing', choices=('static', 'adaptive'), default='static',
+                        help="生成间隔：static 在延时范围内随机，adaptive 按服务状态自动调整")
+    parser.add_argument('--input-mode', choices=('fill', 'js', 'type'), default='fill',
+                        help="提示词输入方式（type 为逐字输入）")
+    parser.add_argument('--pipeline', action='store_true', help="图片取回后在后台写盘，与生成间隔和下一次生成重叠")
+    parser.add_argument('--tabs', type=int, default=1,
+                        help="每个浏览器窗口同时使用的 Whisk 标签页数（1-4），多次生成分摊到各标签页")
+    parser.add_argument('--no-enhanced-download', action='store_true', help="关闭增强版下载（截图兜底）")
+    parser.add_argument('--dedup', choices=('off', 'skip', 'link'), default='off',
+                        help="重复图片处理：skip 跳过，link 硬链接到已保存的同一张图")
+    parser.add_argument('--post-process', action='store_true',
+                        help="后台进程池处理保存的图片：损坏检测")
+    parser.add_argument('--post-convert', choices=('jpeg', 'webp'), help="后处理时把 PNG 截图转换为该格式")
+    parser.add_argument('--post-max-size', type=int, default=0, help="后处理时把长边缩小到该像素（0 不缩放）")
+    parser.add_argument('--post-thumbnail', type=int, default=0, help="后处理时生成该尺寸的缩略图（0 不生成）")
+    parser.add_argument('--post-metadata', action='store_true',
+                        help="后处理时把提示词写入图片元数据（每张图片会在保存后再重写一次）")
+    parser.add_argument('--post-workers', type=int, default=0, help="后处理进程数（默认 CPU 核数减一，最多 4）")
+    parser.add_argument('--expand', action='store_true',
+                        help="提示词按模板展开：{a|b|c} 依次取值，{$name} 取变量文件 name.txt 的每一行")
+    parser.add_argument('--vars-dir', help="模板变量文件所在目录")
+    parser.add_argument('--resume', action='store_true', help="断点续跑：跳过保存目录任务日志中已完成的生成")
+    parser.add_argument('--verbose', action='store_true', help="输出核心日志事件")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = load_jobs(args.jobs, {
+            'browser_id': args.browser,
+            'aspect_ratio': args.ratio,
+            'count': args.count,
+            'output_dir': args.output_dir,
+        })
+    except (OSError, ValueError) as e:
+        emit('error', message=f"读取任务文件失败: {e}")
+        return 2
+
+    core_options = {
+        'use_enhanced_download': not args.no_enhanced_download,
+        'wait_mode': args.wait_mode,
+        'capture_mode': args.capture_mode,
+        'input_mode': args.input_mode,
+        'pacing': args.pacing,
+        'pipeline': args.pipeline,
+        'tabs': args.tabs,
+        'journal': True,
+        'dedup': args.dedup,
+    }
+
+    post_processor = None
+    if args.post_process or args.post_convert or args.post_max_size or args.post_thumbnail or args.post_metadata:
+        from whisk_postprocess_v2 import PostProcessor
+        post_processor = PostProcessor(convert=args.post_convert, max_size=args.post_max_size,
+                                       thumbnail=args.post_thumbnail, metadata=args.post_metadata,
+                                       workers=args.post_workers,
+                                       message_callback=lambda msg: emit('log', job=None, message=msg))
+        core_options['post_process_callback'] = post_processor
+
+    start_time = time.time()
+    emit('batch_start', jobs=len(jobs), concurrency=args.concurrency)
+    try:
+        results = run_jobs(jobs, args.concurrency, core_options, args.min_delay, args.max_delay,
+                           args.verbose, args.resume, args.expand, args.vars_dir)
+    finally:
+        if post_processor is not None:
+            post_processor.close()
+            emit('postprocess', **post_processor.stats)
+
+    cancelled = sum(1 for r in results if r['cancelled'])
+    failed = sum(1 for r in results if not r['success']) - cancelled
+    emit('batch_done', jobs=len(results), failed=failed, cancelled=cancelled,
+         downloaded=sum(r['downloaded'] for r in results),
+         seconds=round(time.time() - start_time, 2))
+    if cancelled:
+        return 130
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
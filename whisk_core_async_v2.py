@@ -0,0 +1,776 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 异步核心类 V2
+基于 playwright.async_api，步骤与 WhiskAutomationCoreV2 相同：
+连接、选择纵横比、输入、触发、等待、下载
+多个比特浏览器窗口可以在同一个事件循环、同一个 Playwright 驱动进程中运行
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from playwright.async_api import async_playwright, Download
+
+from whisk_cancel_v2 import CancellationToken, TaskCancelled
+from whisk_capture_v2 import ImageResponseCapture
+from whisk_core_v2 import (
+    WhiskAutomationCoreV2,
+    CLICK_ASPECT_RATIO_OPTION_JS,
+    MARK_GENERATION_BASELINE_JS,
+    PAGE_STATE_JS,
+    SET_TEXTAREA_VALUE_JS,
+    WAIT_FOR_NEW_IMAGES_JS,
+    _page_aspect_ratios,
+)
+
+
+class WhiskAutomationCoreAsyncV2(WhiskAutomationCoreV2):
+    """
+    Google Whisk AI 图像生成自动化异步核心类 V2
+    页面操作均为协程；文件命名、保存、日志等本地逻辑复用同步核心类
+    """
+
+    def __init__(self, browser_id: str, save_directory: str,
+                 message_callback: Optional[Callable] = None,
+                 progress_callback: Optional[Callable] = None,
+                 use_enhanced_download: bool = True,
+                 wait_mode: str = 'event',
+                 capture_mode: str = 'click',
+                 pipeline: bool = False,
+                 post_process_callback: Optional[Callable] = None,
+                 metrics_callback: Optional[Callable] = None,
+                 input_mode: str = 'fill',
+                 pacing: str = 'static',
+                 journal: bool = False,
+                 dedup: str = 'off',
+                 dedup_directory: Optional[str] = None,
+                 cancel_token: Optional[CancellationToken] = None,
+                 tabs: int = 1):
+        super().__init__(browser_id, save_directory,
+                         message_callback=message_callback,
+                         progress_callback=progress_callback,
+                         use_enhanced_download=use_enhanced_download,
+                         wait_mode=wait_mode,
+                         capture_mode=capture_mode,
+                         pipeline=pipeline,
+                         post_process_callback=post_process_callback,
+                         metrics_callback=metrics_callback,
+                         input_mode=input_mode,
+                         pacing=pacing,
+                         journal=journal,
+                         dedup=dedup,
+                         dedup_directory=dedup_directory,
+                         cancel_token=cancel_token,
+                         tabs=tabs)
+
+        # 是否由本实例启动了 Playwright 驱动（共享驱动时不负责关闭）
+        self._owns_playwright = False
+
+    async def _sleep_async(self, seconds: float):
+        """可被取消打断的等待（取消可以来自其他线程）"""
+        await self.cancel_token.sleep_async(seconds)
+
+    async def connect_browser(self, playwright=None):
+        """连接到比特浏览器；传入 playwright 时复用已启动的驱动"""
+        try:
+            # 比特浏览器 API 为阻塞请求，放到线程中执行
+            ws_endpoint = await asyncio.to_thread(self.get_bitbrowser_cdp)
+
+            if playwright is None:
+                self.playwright = await async_playwright().start()
+                self._owns_playwright = True
+            else:
+                self.playwright = playwright
+            self.browser = await self.playwright.chromium.connect_over_cdp(ws_endpoint)
+
+            # 获取已有的页面或创建新页面
+            contexts = self.browser.contexts
+            if contexts:
+                context = contexts[0]
+                pages = context.pages
+                if pages:
+                    self.page = pages[0]
+                else:
+                    self.page = await context.new_page()
+            else:
+                raise Exception("浏览器没有可用的上下文")
+
+            self.log("成功连接到浏览器")
+
+            # 网络拦截模式：监听生成图片的响应
+            if self.capture_mode == 'network':
+                self.capture = ImageResponseCapture(self.page)
+                self.capture.start()
+                self.log("已启用网络拦截图片捕获")
+
+            # 检查当前页面
+            current_url = self.page.url
+            self.log(f"当前页面: {current_url}")
+
+            # 如果不在 Whisk 项目页面，尝试导航
+            if "whisk" not in current_url:
+                self.log("不在 Whisk 页面，尝试导航...")
+                await self.page.goto(self.WHISK_URL)
+                self._set_applied_ratio(None)
+                await self._sleep_async(3)
+
+        except Exception as e:
+            self.log(f"连接浏览器失败: {e}")
+            raise
+
+    async def ensure_settings_panel_open(self):
+        """确保设置面板打开"""
+        try:
+            settings_visible = await self.page.locator('*:has-text("设置"):visible').count() > 0
+
+            if not settings_visible:
+                settings_button = self.page.locator(self.selectors['settings_button']).first
+                if not await settings_button.count():
+                    settings_button = self.page.locator('button:has-text("menu"):visible').first
+
+                if await settings_button.count():
+                    self.log("打开设置面板...")
+                    await settings_button.click()
+                    await self._sleep_async(2)
+                else:
+                    self.log("未找到设置按钮")
+
+        except Exception as e:
+            self.log(f"打开设置面板失败: {e}")
+
+    async def select_aspect_ratio(self, aspect_ratio: str):
+        """选择纵横比（新版页面）；页面已是该纵横比时直接跳过"""
+        try:
+            if aspect_ratio not in self.ASPECT_RATIOS:
+                self.log(f"不支持的纵横比: {aspect_ratio}，使用默认设置")
+                return
+
+            if _page_aspect_ratios.get(self.page) == aspect_ratio:
+                self.log(f"✓ 页面已是纵横比 {aspect_ratio}，跳过设置")
+                return
+
+            self.log(f"选择纵横比: {aspect_ratio} ({self.ASPECT_RATIOS[aspect_ratio]})")
+
+            aspect_button = self.page.locator(self.selectors['aspect_ratio_button']).first
+
+            if await aspect_button.count():
+                self.log("找到 aspect_ratio 按钮，点击打开纵横比面板")
+                await aspect_button.click()
+
+                matched = await self._click_aspect_ratio_option(aspect_ratio)
+                if not matched:
+                    self.log(f"未找到 {aspect_ratio} 选项")
+                    return
+
+                self.log(f"✓ 成功选择纵横比: {aspect_ratio} (选项: {matched})")
+                self._set_applied_ratio(aspect_ratio)
+                await self._sleep_async(self.ASPECT_RATIO_SETTLE)
+
+            else:
+                self.log("未找到 aspect_ratio 按钮，尝试设置面板方法")
+                await self.ensure_settings_panel_open()
+                await self._sleep_async(1)
+
+                dropdown = self.page.locator('select:visible').first
+                if await dropdown.count():
+                    try:
+                        await dropdown.select_option(value=aspect_ratio)
+                        self.log(f"✓ 通过设置面板选择成功: {aspect_ratio}")
+                        self._set_applied_ratio(aspect_ratio)
+                        await self._sleep_async(self.ASPECT_RATIO_SETTLE)
+                    except Exception:
+                        self.log("设置面板选择失败")
+
+        except Exception as e:
+            self.log(f"选择纵横比失败: {e}")
+
+    async def _click_aspect_ratio_option(self, aspect_ratio: str) -> Optional[str]:
+        """查找并点击纵横比选项，未出现时短暂等待后重试（见同步版 _click_aspect_ratio_option）"""
+        deadline = time.time() + self.ASPECT_RATIO_OPTION_TIMEOUT
+        while True:
+            try:
+                matched = await self.page.evaluate(CLICK_ASPECT_RATIO_OPTION_JS, aspect_ratio)
+            except Exception:
+                matched = None
+            if matched or time.time() >= deadline:
+                return matched
+            await self._sleep_async(self.ASPECT_RATIO_OPTION_POLL)
+
+    async def input_prompt(self, prompt: str):
+        """输入提示词（输入框中已是相同提示词时跳过）"""
+        try:
+            textarea = self.page.locator(self.selectors['textarea']).first
+            if not await textarea.count():
+                raise Exception("未找到输入框")
+
+            if await textarea.input_value() == prompt:
+                await textarea.focus()
+                self.log("✓ 输入框已是当前提示词，跳过输入")
+                return
+
+            self.log(f"输入提示词: {prompt[:50]}...")
+
+            for mode in self.INPUT_MODES[self.INPUT_MODES.index(self.input_mode):]:
+                await self._enter_prompt(textarea, prompt, mode)
+
+                if await textarea.input_value() == prompt:
+                    self.log("✓ 成功输入提示词")
+                    return
+                self.log(f"⚠ {mode} 方式输入不完整，尝试下一种方式")
+                self.metrics.count('input_fallback')
+
+            self.log("⚠ 提示词可能未完全输入")
+
+        except Exception as e:
+            self.log(f"输入提示词失败: {e}")
+            raise
+
+    async def _enter_prompt(self, textarea, prompt: str, mode: str):
+        """按指定方式写入输入框（见同步版 _enter_prompt）"""
+        if mode == 'fill':
+            await textarea.fill(prompt)
+        elif mode == 'js':
+            await textarea.evaluate(SET_TEXTAREA_VALUE_JS, prompt)
+        else:
+            await textarea.click()
+            await self._sleep_async(0.5)
+            await textarea.select_text()
+            await textarea.type(prompt)
+
+    async def trigger_generation(self):
+        """触发图片生成"""
+        try:
+            self.log("触发生成...")
+
+            # 登记触发前的图片，等待和下载只关注之后出现的新图片
+            try:
+                await self.page.evaluate(MARK_GENERATION_BASELINE_JS)
+                self._baseline_marked = True
+            except Exception:
+                self._baseline_marked = False
+
+            if self.capture:
+                self.capture.arm()
+
+            await self.page.keyboard.press('Enter')
+            await self._sleep_async(1)
+
+            self.log("✓ 已触发生成")
+
+        except Exception as e:
+            self.log(f"触发生成失败: {e}")
+            raise
+
+    async def wait_for_generation(self, timeout: int = 60):
+        """等待图片生成完成，按 wait_mode 选择事件驱动或轮询方式"""
+        ready = None
+        if self.wait_mode == 'event':
+            try:
+                ready = await self.wait_for_generation_event(timeout)
+            except Exception as e:
+                self.log(f"事件驱动等待失败，改用轮询: {e}")
+                self.metrics.count('wait_event_fallback')
+
+        if ready is None:
+            ready = await self.wait_for_generation_poll(timeout)
+        if not ready:
+            self.metrics.count('wait_timeout')
+        return ready
+
+    async def wait_for_generation_event(self, timeout: int = 60):
+        """事件驱动等待：新图片全部解码完成后立即返回"""
+        self.log(f"等待生成完成 (事件驱动，最多 {timeout} 秒)...")
+
+        if not self._baseline_marked:
+            await self.page.evaluate(MARK_GENERATION_BASELINE_JS)
+
+        start_time = time.time()
+        deadline = start_time + timeout
+        while True:
+            remaining = min(self.WAIT_SLICE, deadline - time.time())
+            ready_count = await self.page.evaluate(
+                WAIT_FOR_NEW_IMAGES_JS,
+                [self.IMAGES_PER_GENERATION, self.GENERATED_IMAGE_MIN_SIZE, max(0, remaining) * 1000]
+            )
+            if ready_count >= self.IMAGES_PER_GENERATION or time.time() >= deadline:
+                break
+            self.cancel_token.raise_if_cancelled()
+        self._baseline_marked = False
+
+        if ready_count < self.IMAGES_PER_GENERATION:
+            self.log(f"⚠ 等待超时 (已就绪 {ready_count}/{self.IMAGES_PER_GENERATION} 张)")
+            return False
+
+        self.log(f"✓ {ready_count} 张新图片已加载完成 ({time.time() - start_time:.1f} 秒)")
+
+        try:
+            await self.page.locator(self.selectors['download_button']).first.wait_for(state='visible', timeout=5000)
+        except Exception:
+            self.log("⚠ 未等到下载按钮出现")
+
+        return True
+
+    async def probe_page_state(self) -> Dict:
+        """一次 evaluate 获取页面状态（见同步版 probe_page_state）"""
+        return await self.page.evaluate(PAGE_STATE_JS, self._page_state_args())
+
+    async def _error_banner(self) -> Optional[str]:
+        """页面上的错误提示（仅 adaptive 模式检测）"""
+        if self.pacer is None:
+            return None
+        try:
+            alerts = (await self.probe_page_state())['alerts']
+        except Exception:
+            return None
+        return alerts[0] if alerts else None
+
+    async def wait_for_generation_poll(self, timeout: int = 60):
+        """轮询等待图片生成完成（旧版方式，固定等待时间）"""
+        try:
+            self.log(f"等待生成完成 (最多 {timeout} 秒)...")
+
+            start_time = time.time()
+            initial_images = len((await self.probe_page_state())['images'])
+
+            while time.time() - start_time < timeout:
+                await self._sleep_async(3)
+
+                state = await self.probe_page_state()
+                current_images = len(state['images'])
+                # 加载指示器只在尚无新结果时视为仍在生成（见同步版）
+                if state['spinners'] and current_images <= initial_images and not state['buttons']:
+                    continue
+
+                if current_images > initial_images:
+                    self.log(f"✓ 检测到新图片 (共 {current_images} 张)")
+                    self.log("等待图片完全加载...")
+                    await self._sleep_async(7)
+                    return True
+
+                if state['buttons']:
+                    self.log(f"✓ 检测到下载按钮 ({len(state['buttons'])} 个)")
+                    await self._sleep_async(5)
+                    return True
+
+            self.log("⚠ 等待超时")
+            return False
+
+        except Exception as e:
+            self.log(f"等待生成失败: {e}")
+            return False
+
+    async def _resolve_download(self, download: Download) -> Dict:
+        """等待下载完成并返回待保存项（见同步版 _resolve_download）"""
+        try:
+            return {'path': await download.path(), 'move': False}
+        except Exception:
+            temp_path = self._temp_download_path()
+            await download.save_as(temp_path)
+            return {'path': temp_path, 'move': True}
+
+    async def collect_images(self) -> List[Dict]:
+        """识别并取回本轮生成的图片，返回待保存项列表"""
+        if self.capture:
+            images = await self.capture.collect_async(self.IMAGES_PER_GENERATION)
+            if images:
+                return [
+                    {'index': index, 'ext': ext, 'prefix': 'whisk', 'data': data, 'source': 'capture'}
+                    for index, (data, ext) in enumerate(images[:self.IMAGES_PER_GENERATION])
+                ]
+            self.log("⚠ 未捕获到图片响应，改用下载按钮")
+            self.metrics.count('capture_fallback')
+
+        items = []
+
+        try:
+            if self.use_enhanced_download:
+                self.log("使用增强版下载机制...")
+                if self.wait_mode == 'poll':
+                    await self._sleep_async(5)
+
+            state = await self.probe_page_state()
+            if not self._has_download_buttons(state):
+                return []
+
+            # 按x坐标排序（从左到右），通过 data 属性定位点击
+            for button in sorted(state['buttons'], key=lambda b: b['x']):
+                self.cancel_token.raise_if_cancelled()
+                try:
+                    async with self.page.expect_download(timeout=30000) as download_info:
+                        await self.page.locator(f'[data-whisk-download="{button["index"]}"]').click()
+                    download = await download_info.value
+
+                    item = {'index': button['index'], 'ext': '.jpg', 'prefix': 'whisk', 'source': 'download'}
+                    item.update(await self._resolve_download(download))
+                    items.append(item)
+
+                    await self._sleep_async(1)
+
+                except Exception as e:
+                    self.log(f"⚠ 下载失败: {e}")
+                    self.metrics.count('download_failed')
+
+                    # 尝试截图保存
+                    if self.use_enhanced_download:
+                        try:
+                            image_index = self._button_image_index(state, button)
+                            if image_index is not None:
+                                self.metrics.count('screenshot_fallback')
+                                items.append({
+                                    'index': button['index'],
+                                    'ext': '.png',
+                                    'prefix': 'whisk_screenshot',
+                                    'data': await self.page.locator(f'[data-whisk-image="{image_index}"]').screenshot(),
+                                    'source': 'screenshot'
+                                })
+                        except Exception:
+                            pass
+
+            return items
+
+        except Exception as e:
+            self.log(f"下载过程出错: {e}")
+            return items
+
+    async def download_image(self, download_all: bool = True):
+        """下载图片；写盘在线程中执行，不阻塞事件循环"""
+        items = await self.collect_images()
+        return await asyncio.to_thread(self.save_images, items)
+
+    async def generate_images(self, prompt: str, count: int, aspect_ratio: str = "1:1",
+                              min_delay: int = 5, max_delay: int = 8, resume: bool = False):
+        """生成多张图片的主流程（resume=True 时跳过任务日志中已完成的生成）"""
+        pending_save = None
+
+        try:
+            self.log(f"开始生成任务: {count} 次生成, 比例 {aspect_ratio} (每次生成2张图片)")
+            pending = self._pending_iterations(prompt, count, aspect_ratio, resume)
+            if not pending:
+                self.update_progress(count, count)
+                self.log("✓ 任务日志显示所有生成均已完成，无需续跑")
+                return
+
+            if aspect_ratio != self._get_applied_ratio():
+                with self.metrics.span('aspect_ratio'):
+                    await self.select_aspect_ratio(aspect_ratio)
+
+            self.pipeline_stats = {'batches': 0, 'save_seconds': 0.0, 'blocked_seconds': 0.0, 'overlap_seconds': 0.0}
+            self.start_pacing(min_delay, max_delay)
+
+            if self.tabs > 1 and len(pending) > 1:
+                await self._generate_images_tabs(prompt, pending, count, aspect_ratio, min_delay, max_delay)
+            else:
+                for position, i in enumerate(pending):
+                    self.cancel_token.raise_if_cancelled()
+                    self.log(f"\n--- 第 {i+1}/{count} 次生成 ---")
+                    self.update_progress(count - len(pending) + position, count)
+
+                    with self.metrics.span('input'):
+                        await self.input_prompt(prompt)
+
+                    generation_start = time.perf_counter()
+                    with self.metrics.span('trigger'):
+                        await self.trigger_generation()
+                    items = await self._collect_generation(generation_start)
+
+                    if items is not None:
+                        save = asyncio.to_thread(self._save_iteration, i + 1, items, prompt, aspect_ratio)
+
+                        if self.pipeline:
+                            # 流水线模式：取回后写盘在后台进行，最多一轮在途
+                            await self._join_pending_save_async(pending_save)
+                            pending_save = asyncio.ensure_future(save)
+                        else:
+                            await save
+                    else:
+                        self.log(f"⚠ 第 {i+1} 次生成超时")
+                        if self.journal:
+                            self.journal.record(i + 1, prompt, aspect_ratio, 'timeout', error='生成超时')
+
+                    if position < len(pending) - 1:
+                        delay = self.next_delay(min_delay, max_delay)
+                        self.log(f"等待 {delay:.1f} 秒...")
+                        with self.metrics.span('delay'):
+                            await self._sleep_async(delay)
+
+            if self.pipeline:
+                await self._join_pending_save_async(pending_save)
+                pending_save = None
+                self._report_pipeline_stats()
+
+            self.update_progress(count, count)
+            self.log(f"\n✅ 任务完成！共下载 {self.downloaded_count} 张图片")
+            self.log(f"保存位置: {self.save_directory}")
+
+        except Exception as e:
+            self.log(f"❌ 生成过程出错: {e}")
+            raise
+        finally:
+            # 确保后台保存在浏览器断开前完成
+            if pending_save is not None:
+                await self._join_pending_save_async(pending_save)
+
+    async def generate_once(self, prompt: str, aspect_ratio: Optional[str] = None) -> int:
+        """单次生成：必要时切换纵横比，然后输入、触发、等待并保存（见同步版 generate_once）"""
+        if aspect_ratio and aspect_ratio != self._get_applied_ratio():
+            with self.metrics.span('aspect_ratio'):
+                await self.select_aspect_ratio(aspect_ratio)
+
+        with self.metrics.span('input'):
+            await self.input_prompt(prompt)
+
+        items = await self._generate_and_collect()
+        if items is None:
+            self.log("⚠ 生成超时")
+            return 0
+
+        downloaded = await asyncio.to_thread(self.save_images, items)
+        if downloaded > 0:
+            self.log(f"✓ 生成完成，下载了 {downloaded} 张图片")
+        else:
+            self.log("⚠ 生成下载失败")
+        return downloaded
+
+    async def _generate_and_collect(self) -> Optional[List[Dict]]:
+        """触发、等待并取回图片；等待超时返回 None"""
+        generation_start = time.perf_counter()
+        with self.metrics.span('trigger'):
+            await self.trigger_generation()
+        return await self._collect_generation(generation_start)
+
+    async def _collect_generation(self, generation_start: float, activate: bool = False) -> Optional[List[Dict]]:
+        """等待已触发的生成完成并取回图片；等待超时返回 None（activate 时取回前把页面切到前台）"""
+        with self.metrics.span('wait'):
+            ready = await self.wait_for_generation()
+        if not ready:
+            self._record_pacing(None, None, await self._error_banner())
+            return None
+        if activate:
+            await self._activate_page()
+        with self.metrics.span('collect'):
+            items = await self.collect_images()
+        latency = time.perf_counter() - generation_start
+        self.metrics.observe('generation', latency, bool(items))
+        self._record_pacing(items, latency, await self._error_banner())
+        return items
+
+    async def _activate_page(self):
+        """把本页面切到前台后再操作（见同步版 _activate_page）"""
+        try:
+            await self.page.bring_to_front()
+        except Exception:
+            pass
+
+    async def _open_tabs(self, total: int) -> List['WhiskAutomationCoreAsyncV2']:
+        """在同一上下文中打开其余标签页（见同步版 _open_tabs）"""
+        url = self.page.url if "whisk" in self.page.url else self.WHISK_URL
+        # 会话中前一个提示词已打开的标签页直接复用
+        workers = [self] + self._tab_workers[:total - 1]
+        for tab in workers[1:]:
+            self._share_run_state(tab)
+        for number in range(len(workers) + 1, total + 1):
+            try:
+                page = await self.page.context.new_page()
+                await page.goto(url)
+                workers.append(self._make_tab_worker(page, number))
+            except Exception as e:
+                self.log(f"⚠ 打开第 {number} 个标签页失败: {e}")
+                break
+        self.log(f"多标签页模式: {len(workers)} 个标签页同时生成")
+        return workers
+
+    async def _close_tabs(self):
+        """关闭本实例打开的标签页（主页面保留）"""
+        for tab in self._tab_workers:
+            try:
+                if tab.capture:
+                    tab.capture.stop()
+                await tab.page.close()
+            except Exception:
+                pass
+        self._tab_workers = []
+
+    async def _generate_images_tabs(self, prompt: str, pending: List[int], count: int, aspect_ratio: str,
+                                    min_delay: int, max_delay: int):
+        """
+        多标签页生成：每个标签页一个协程，从共享队列领取生成序号，
+        提交、等待、保存互不阻塞；生成间隔按标签页各自计算
+        输入和取回前把标签页切到前台；等待期间其他标签页可能在前台（见 _activate_page）
+        """
+        workers = await self._open_tabs(min(self.tabs, len(pending)))
+        queue = deque(pending)
+        done = count - len(pending)
+
+        async def work(tab):
+            nonlocal done
+            while queue:
+                self.cancel_token.raise_if_cancelled()
+                i = queue.popleft()
+                tab.log(f"\n--- 第 {i+1}/{count} 次生成 ---")
+                try:
+                    await tab._activate_page()
+                    if aspect_ratio != tab._get_applied_ratio():
+                        with self.metrics.span('aspect_ratio'):
+                            await tab.select_aspect_ratio(aspect_ratio)
+                    with self.metrics.span('input'):
+                        await tab.input_prompt(prompt)
+                    generation_start = time.perf_counter()
+                    with self.metrics.span('trigger'):
+                        await tab.trigger_generation()
+                    items = await tab._collect_generation(generation_start, activate=True)
+                    if items is None:
+                        tab._record_tab_failure(i + 1, prompt, aspect_ratio, 'timeout', "超时")
+                    else:
+                        await asyncio.to_thread(tab._save_iteration, i + 1, items, prompt, aspect_ratio)
+                except Exception as e:
+                    tab._record_tab_failure(i + 1, prompt, aspect_ratio, 'failed', f"失败: {e}")
+
+                done += 1
+                self.update_progress(done, count)
+
+                if queue:
+                    delay = self.next_delay(min_delay, max_delay)
+                    tab.log(f"等待 {delay:.1f} 秒...")
+                    with self.metrics.span('delay'):
+                        await self._sleep_async(delay)
+
+        tasks = [asyncio.ensure_future(work(tab)) for tab in workers]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # 一个标签页被取消或出错时停止其余标签页
+            for task in tasks:
+                task.cancel()
+
+    async def _join_pending_save_async(self, future) -> None:
+        """等待上一轮后台保存完成（见同步版 _join_pending_save）"""
+        if future is None:
+            return
+
+        wait_start = time.time()
+        try:
+            result = await future
+            self.pipeline_stats['save_seconds'] += result['busy']
+        except Exception as e:
+            self.log(f"⚠ 后台保存出错: {e}")
+        self.pipeline_stats['blocked_seconds'] += time.time() - wait_start
+        self.pipeline_stats['batches'] += 1
+
+    async def cleanup(self):
+        """清理资源；共享的 Playwright 驱动由调用方负责关闭"""
+        try:
+            await self._close_tabs()
+            if self.capture:
+                self.capture.stop()
+            if self.browser:
+                await self.browser.close()
+            if self.playwright and self._owns_playwright:
+                await self.playwright.stop()
+            self.log("资源清理完成")
+        except Exception as e:
+            self.log(f"清理资源时出错: {e}")
+
+    async def run(self, prompt: str, count: int, aspect_ratio: str = "1:1",
+                  min_delay: int = 5, max_delay: int = 8, playwright=None, resume: bool = False):
+        """运行完整的自动化流程（取消时抛出 TaskCancelled）"""
+        try:
+            self.cancel_token.raise_if_cancelled()
+            with self.metrics.span('connect'):
+                await self.connect_browser(playwright)
+            await self.generate_images(prompt, count, aspect_ratio, min_delay, max_delay, resume)
+        except TaskCancelled:
+            self.log("⚠ 任务已停止")
+            raise
+        except Exception as e:
+            self.log(f"运行失败: {e}")
+            raise
+        finally:
+            await self.cleanup()
+            self._report_metrics()
+
+    async def run_session(self, items, aspect_ratio: str = "1:1", count: int = 1,
+                          min_delay: int = 5, max_delay: int = 8, playwright=None,
+                          resume: bool = False) -> Dict:
+        """在一次浏览器连接中依次生成多个提示词（见同步版 run_session）"""
+        summary = {'prompts': 0, 'failed': 0}
+        try:
+            self.cancel_token.raise_if_cancelled()
+            with self.metrics.span('connect'):
+                await self.connect_browser(playwright)
+
+            for number, item in enumerate(self._session_items(items, aspect_ratio, count), 1):
+                if number > 1:
+                    delay = self.next_delay(min_delay, max_delay)
+                    self.log(f"等待 {delay:.1f} 秒...")
+                    with self.metrics.span('delay'):
+                        await self._sleep_async(delay)
+
+                self._log_session_item(number, item)
+                summary['prompts'] += 1
+                try:
+                    await self.generate_images(item['prompt'], item['count'], item['aspect_ratio'],
+                                               min_delay, max_delay, resume)
+                except Exception:
+                    self._session_item_failed(summary)
+
+            self.log(f"\n✅ 会话完成: {summary['prompts']} 个提示词 (失败 {summary['failed']} 个), "
+                     f"共下载 {self.downloaded_count} 张图片")
+        except TaskCancelled:
+            self.log("⚠ 任务已停止")
+            raise
+        except Exception as e:
+            self.log(f"运行失败: {e}")
+            raise
+        finally:
+            await self.cleanup()
+            self._report_metrics()
+
+        summary['downloaded'] = self.downloaded_count
+        return summary
+
+
+async def run_many(jobs: List[Dict], message_callback: Optional[Callable] = None,
+                   max_concurrent: Optional[int] = None) -> List[Dict]:
+    """
+    在同一个事件循环和同一个 Playwright 驱动中并发运行多个任务
+
+    jobs 中每项包含 browser_id、save_directory、prompt、count（或 items：多个提示词在同一会话中生成，见 run_session），
+    可选 aspect_ratio、min_delay、max_delay、resume 以及构造参数（wait_mode、capture_mode、journal 等）
+    返回每个任务的结果 {'browser_id', 'success', 'downloaded', 'error', 'metrics'}
+    """
+    message_callback = message_callback or (lambda msg: print(msg))
+    semaphore = asyncio.Semaphore(max_concurrent or len(jobs) or 1)
+    run_keys = ('prompt', 'count', 'aspect_ratio', 'min_delay', 'max_delay', 'resume')
+
+    async with async_playwright() as playwright:
+
+        async def run_job(job: Dict) -> Dict:
+            browser_id = job['browser_id']
+            options = {k: v for k, v in job.items()
+                       if k not in run_keys and k not in ('browser_id', 'save_directory', 'items')}
+            automation = WhiskAutomationCoreAsyncV2(
+                browser_id=browser_id,
+                save_directory=job['save_directory'],
+                message_callback=lambda msg: message_callback(f"[{browser_id}] {msg}"),
+                **options
+            )
+
+            async with semaphore:
+                result = {'browser_id': browser_id, 'success': True, 'error': None}
+                try:
+                    run_args = {k: job[k] for k in run_keys if k in job}
+                    if 'items' in job:
+                        run_args.pop('prompt', None)
+                        await automation.run_session(job['items'], playwright=playwright, **run_args)
+                    else:
+                        await automation.run(playwright=playwright, **run_args)
+                except TaskCancelled as e:
+                    result.update(success=False, error=str(e) or "任务已停止")
+                except Exception as e:
+                    result.update(success=False, error=str(e))
+                result.update(downloaded=automation.downloaded_count, metrics=automation.metrics_summary)
+                return result
+
+        return await asyncio.gather(*(run_job(job) for job in jobs))
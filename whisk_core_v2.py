@@ -7,14 +7,184 @@ Google Whisk AI 图像生成自动化 - 核心类 V2 (修复版)
 """
 
 import json
+import os
 import random
+import shutil
 import time
-import requests
+import uuid
+from collections import deque
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Callable, Optional, List
+from typing import Dict, Callable, Iterable, Iterator, Optional, List, Union
 from playwright.sync_api import sync_playwright, Download
 import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from whisk_bitbrowser_v2 import get_client
+from whisk_cancel_v2 import CancellationToken, TaskCancelled
+from whisk_capture_v2 import ImageResponseCapture
+from whisk_dedup_v2 import dhash, get_image_index, hash_bytes, hash_file
+from whisk_journal_v2 import JobJournal
+from whisk_metrics_v2 import RunMetrics
+from whisk_pacing_v2 import AdaptivePacer
+
+# 触发生成前把页面上现有图片的 src 登记到 window.__whiskSeenSrcs（不回传），
+# 之后的等待和页面探测只关注不在集合中的新图片；返回集合大小
+# 每次登记都重建集合，只保留仍在页面中的图片：已移除图片的 src（可能是很长的 data: / blob: URL）
+# 不会随生成次数在页面内存中累积
+MARK_GENERATION_BASELINE_JS = """
+() => {
+    const seen = new Set();
+    for (const img of document.images) {
+        const src = img.currentSrc || img.src;
+        if (src) seen.add(src);
+    }
+    window.__whiskSeenSrcs = seen;
+    return seen.size;
+}
+"""
+
+# 页面内等待脚本：用 MutationObserver + img load 事件检测新图片解码完成
+# 参数: [期望新图片数, 最小尺寸, 超时毫秒]，返回已就绪的新图片数
+WAIT_FOR_NEW_IMAGES_JS = """
+([expected, minSize, timeoutMs]) => new Promise((resolve) => {
+    const seen = window.__whiskSeenSrcs || new Set();
+    const readyImages = () => Array.from(document.images).filter((img) => {
+        const src = img.currentSrc || img.src;
+        if (!src || seen.has(src)) return false;
+        const rect = img.getBoundingClientRect();
+        return img.complete && img.naturalWidth > 0
+            && rect.width > minSize && rect.height > minSize;
+    });
+    let finished = false;
+    const observer = new MutationObserver(() => check());
+    const onLoad = (event) => { if (event.target && event.target.tagName === 'IMG') check(); };
+    const timer = setTimeout(() => finish(readyImages().length), timeoutMs);
+    function finish(count) {
+        if (finished) return;
+        finished = true;
+        observer.disconnect();
+        document.removeEventListener('load', onLoad, true);
+        clearTimeout(timer);
+        resolve(count);
+    }
+    function check() {
+        const count = readyImages().length;
+        if (count >= expected) finish(count);
+    }
+    observer.observe(document.body, {
+        childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'srcset']
+    });
+    // load 事件不冒泡，在捕获阶段监听
+    document.addEventListener('load', onLoad, true);
+    check();
+})
+"""
+
+# 通过原生 setter 设置输入框的值并派发 input/change 事件（React 等框架能感知到变化）
+SET_TEXTAREA_VALUE_JS = """
+(el, value) => {
+    const setter = Object.getOwnPropertyDescriptor(Object.getPrototypeOf(el), 'value').set;
+    el.focus();
+    setter.call(el, value);
+    el.dispatchEvent(new Event('input', { bubbles: true }));
+    el.dispatchEvent(new Event('change', { bubbles: true }));
+}
+"""
+
+# 在页面内查找并点击纵横比选项：先找文本包含 "16:9" 的按钮，再去掉空白模糊匹配（"16 : 9"、"169"）
+# 多个匹配时取文本最短的（选项本身，而不是包含所有选项的容器）；返回选项文本，未找到返回 null
+CLICK_ASPECT_RATIO_OPTION_JS = """
+(ratio) => {
+    const visible = (el) => {
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && getComputedStyle(el).visibility !== 'hidden';
+    };
+    const text = (el) => el.textContent || '';
+    const candidates = Array.from(document.querySelectorAll('button, div[role="button"]')).filter(visible);
+    const compact = ratio.replace(':', '');
+    const shortest = (list) => list.sort((a, b) => text(a).length - text(b).length)[0];
+    const match = shortest(candidates.filter((el) => text(el).includes(ratio)))
+        || shortest(candidates.filter((el) => {
+            const clean = text(el).replace(/\\s+/g, '');
+            return clean.includes(ratio) || clean.includes(compact);
+        }));
+    if (!match) return null;
+    match.click();
+    return text(match).trim() || ratio;
+}
+"""
+
+# 各页面已应用的纵横比，页面对象回收后自动清除；连接池复用同一页面时，相同纵横比的任务无需再打开面板
+_page_aspect_ratios = weakref.WeakKeyDictionary()
+
+# 页面状态探测：一次返回本次生成的新图片、下载按钮的位置、加载指示器数量和错误提示文本
+# 同时给图片、下载按钮打上 data-whisk-image / data-whisk-download 序号，之后用定位器点击或截图，
+# 不需要持有元素句柄（句柄不释放会在浏览器端累积）
+# 已登记在 window.__whiskSeenSrcs 中的旧图片，以及归属于旧图片的下载按钮只计数不返回，
+# 页面保留的历史结果再多，每次返回的数据量也不变；未登记基线时所有结果都视为新结果
+# 下载按钮归属于向上第一个包含生成图片的祖先节点中离它最近的图片
+# 参数: [下载按钮选择器, 加载指示器选择器, 错误提示选择器, 生成图片最小尺寸]
+PAGE_STATE_JS = """
+([downloadSelector, spinnerSelector, alertSelector, minSize]) => {
+    const seen = window.__whiskSeenSrcs || new Set();
+    const srcOf = (img) => img.currentSrc || img.src;
+    const visible = (el) => {
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && getComputedStyle(el).visibility !== 'hidden';
+    };
+    const box = (el) => {
+        const rect = el.getBoundingClientRect();
+        return { x: rect.x, y: rect.y, width: rect.width, height: rect.height };
+    };
+    const distance = (a, b) => {
+        const dx = Math.max(b.left - a.right, a.left - b.right, 0);
+        const dy = Math.max(b.top - a.bottom, a.top - b.bottom, 0);
+        return dx * dx + dy * dy;
+    };
+    document.querySelectorAll('[data-whisk-image], [data-whisk-download]').forEach((el) => {
+        el.removeAttribute('data-whisk-image');
+        el.removeAttribute('data-whisk-download');
+    });
+    const allImages = Array.from(document.images).filter(visible);
+    const generated = new Set(allImages.filter((img) => {
+        const rect = img.getBoundingClientRect();
+        return rect.width > minSize && rect.height > minSize;
+    }));
+    const imageIndex = new Map();
+    const images = allImages.filter((img) => !seen.has(srcOf(img))).map((img, index) => {
+        img.setAttribute('data-whisk-image', index);
+        imageIndex.set(img, index);
+        return Object.assign(box(img), { index });
+    });
+    const owner = (el) => {
+        for (let node = el.parentElement; node; node = node.parentElement) {
+            const candidates = Array.from(node.querySelectorAll('img')).filter((img) => generated.has(img));
+            if (candidates.length) {
+                const rect = el.getBoundingClientRect();
+                return candidates.reduce((best, img) => distance(rect, img.getBoundingClientRect())
+                    < distance(rect, best.getBoundingClientRect()) ? img : best);
+            }
+        }
+        return null;
+    };
+    const allButtons = Array.from(document.querySelectorAll(downloadSelector)).filter(visible);
+    const buttons = [];
+    allButtons.forEach((el) => {
+        const img = owner(el);
+        if (img && seen.has(srcOf(img))) return;
+        const index = buttons.length;
+        el.setAttribute('data-whisk-download', index);
+        buttons.push(Object.assign(box(el), { index, image: img ? imageIndex.get(img) : null }));
+    });
+    const spinners = Array.from(document.querySelectorAll(spinnerSelector)).filter(visible).length;
+    const alerts = Array.from(document.querySelectorAll(alertSelector)).filter(visible)
+        .map((el) => (el.textContent || '').trim().slice(0, 200)).filter(Boolean);
+    const stale = { images: allImages.length - images.length, buttons: allButtons.length - buttons.length };
+    return { images, buttons, spinners, alerts, stale };
+}
+"""
 
 class WhiskAutomationCoreV2:
     """Google Whisk AI 图像生成自动化核心类 V2"""
@@ -28,39 +198,129 @@ class WhiskAutomationCoreV2:
         '9:16': '宽屏纵向'
     }
     
+    # 等待模式：event 为事件驱动（默认），poll 为旧版轮询
+    WAIT_MODES = ('event', 'poll')
+    
+    # 图片获取方式：click 为点击下载按钮（默认），network 为拦截网络响应直接保存
+    CAPTURE_MODES = ('click', 'network')
+    
+    # 生成间隔：static 在 [min_delay, max_delay] 内随机（默认），adaptive 根据生成结果自动调整
+    PACING_MODES = ('static', 'adaptive')
+    
+    # 重复图片处理：off 不检查，skip 跳过，link 硬链接到已有文件
+    DEDUP_MODES = ('off', 'skip', 'link')
+    
+    # 页面内等待的分片时长（秒），每片结束时检查取消
+    WAIT_SLICE = 2
+    
+    # 每个比特浏览器窗口最多同时使用的 Whisk 标签页数
+    MAX_TABS = 4
+    
+    WHISK_URL = "https://labs.google/fx/tools/whisk"
+    
+    # 提示词输入方式：fill 一次性写入（默认），js 脚本设置值并派发事件，type 逐字输入（旧版）
+    # 写入后校验不一致时依次改用后面的方式
+    INPUT_MODES = ('fill', 'js', 'type')
+    
+    # 纵横比选项出现的最长等待时间、选择后等待生效的时间（秒）
+    ASPECT_RATIO_OPTION_TIMEOUT = 5
+    ASPECT_RATIO_OPTION_POLL = 0.1
+    ASPECT_RATIO_SETTLE = 0.5
+    
+    # Whisk 每次生成的图片数量
+    IMAGES_PER_GENERATION = 2
+    
+    # 生成结果图片的最小显示尺寸（像素），用于排除头像、图标等小图
+    GENERATED_IMAGE_MIN_SIZE = 200
+    
     def __init__(self, browser_id: str, save_directory: str, 
                  message_callback: Optional[Callable] = None,
                  progress_callback: Optional[Callable] = None,
-                 use_enhanced_download: bool = True):
+                 use_enhanced_download: bool = True,
+                 wait_mode: str = 'event',
+                 capture_mode: str = 'click',
+                 pipeline: bool = False,
+                 post_process_callback: Optional[Callable] = None,
+                 connection_pool=None,
+                 metrics_callback: Optional[Callable] = None,
+                 input_mode: str = 'fill',
+                 pacing: str = 'static',
+                 journal: bool = False,
+                 dedup: str = 'off',
+                 dedup_directory: Optional[str] = None,
+                 cancel_token: Optional[CancellationToken] = None,
+                 tabs: int = 1):
         self.browser_id = browser_id
         self.save_directory = Path(save_directory)
         self.save_directory.mkdir(exist_ok=True)
+        # 任务日志：保存目录下记录每次生成的结果，用于断点续跑
+        self.journal = JobJournal.for_directory(self.save_directory) if journal else None
+        # 去重：skip 跳过重复图片，link 以硬链接保存；索引默认放在保存目录，可指定上级目录供多个任务共用
+        self.dedup = dedup if dedup in self.DEDUP_MODES else 'off'
+        self.dedup_index = get_image_index(dedup_directory or self.save_directory) if self.dedup != 'off' else None
         self.use_enhanced_download = use_enhanced_download
+        self.wait_mode = wait_mode if wait_mode in self.WAIT_MODES else 'event'
+        self.capture_mode = capture_mode if capture_mode in self.CAPTURE_MODES else 'click'
+        self.input_mode = input_mode if input_mode in self.INPUT_MODES else 'fill'
+        self.pacing = pacing if pacing in self.PACING_MODES else 'static'
+        self.pacer = None  # AdaptivePacer，由 start_pacing 按延时范围创建
+        
+        # 多标签页模式：同一窗口中最多 tabs 个标签页同时生成（每个标签页一个页面状态副本）
+        self.tabs = max(1, min(int(tabs), self.MAX_TABS))
+        self._tab_workers = []
+        
+        # 流水线模式：图片的写盘、哈希和后处理放到后台线程，与生成间隔及下一次生成重叠；
+        # 取回图片（点击下载、等待下载完成）仍在浏览器线程中进行，不与生成重叠
+        # 后处理回调参数为 (保存路径, 图片信息)
+        self.pipeline = pipeline
+        self.post_process_callback = post_process_callback
+        self.pipeline_stats = {}
+        
+        # 取消标记：所有等待都可被打断，取消后 run() 立即清理资源
+        self.cancel_token = cancel_token or CancellationToken()
         
         # 回调函数
         self.message_callback = message_callback or (lambda msg: print(msg))
         self.progress_callback = progress_callback or (lambda current, total: None)
         
+        # 运行指标：各阶段耗时、生成延迟、下载字节、超时/降级计数；事件推送给 metrics_callback
+        self.metrics = RunMetrics(metrics_callback)
+        self.metrics_summary = None
+        
         # 浏览器相关
         self.browser = None
         self.page = None
         self.playwright = None
+        self.capture = None
+        
+        # 连接池（whisk_pool_v2.CDPConnectionPool）：设置后 run 必须在池的工作线程中执行
+        self.connection_pool = connection_pool
         
         # 下载统计
         self.downloaded_count = 0
         
+        # 本轮触发前是否已在页面内登记旧图片（见 MARK_GENERATION_BASELINE_JS）
+        self._baseline_marked = False
+        
         # 线程安全锁
         self.lock = threading.Lock()
         
         # 页面元素选择器（基于新页面分析）
         self.selectors = {
             'textarea': 'textarea:visible',
+            'aspect_ratio_button': 'button:has-text("aspect_ratio"):visible, button:has(i:has-text("aspect_ratio")):visible',
             'download_button': 'button[aria-label="下载图片"]',
+            'loading_spinner': '[role="progressbar"], [aria-busy="true"], mat-spinner, mat-progress-spinner',
+            'error_banner': '[role="alert"], mat-snack-bar-container, .mdc-snackbar',
             'settings_button': 'button[aria-label*="设置面板"]',
             'aspect_ratio_dropdown': 'select:visible',
             'aspect_ratio_custom': '*:has-text("选择一种纵横"):visible'
         }
     
+    def _sleep(self, seconds: float):
+        """可被取消打断的等待"""
+        self.cancel_token.sleep(seconds)
+    
     def log(self, message: str):
         """发送日志消息"""
         timestamp = datetime.now().strftime("%H:%M:%S")
@@ -70,25 +330,13 @@ class WhiskAutomationCoreV2:
         """更新进度"""
         self.progress_callback(current, total)
     
-    def get_bitbrowser_cdp(self) -> str:
-        """调用比特浏览器 API 获取 CDP 端点"""
+    def get_bitbrowser_cdp(self, force_refresh: bool = False) -> str:
+        """调用比特浏览器 API 获取 CDP 端点（端点有缓存，force_refresh 时重新打开窗口）"""
         try:
-            api_url = f"http://127.0.0.1:54345/browser/open"
-            payload = {"id": self.browser_id}
-            
             self.log(f"正在连接比特浏览器，窗口ID: {self.browser_id}")
-            response = requests.post(api_url, json=payload, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success') and 'data' in data and 'ws' in data['data']:
-                    ws_endpoint = data['data']['ws']
-                    self.log(f"成功获取CDP端点: {ws_endpoint}")
-                    return ws_endpoint
-                else:
-                    raise ValueError("无法从响应中获取WebSocket端点")
-            else:
-                raise Exception(f"比特浏览器API请求失败: {response.text}")
+            ws_endpoint = get_client().open_browser(self.browser_id, force_refresh=force_refresh)
+            self.log(f"成功获取CDP端点: {ws_endpoint}")
+            return ws_endpoint
                 
         except Exception as e:
             self.log(f"连接比特浏览器失败: {e}")
@@ -97,10 +345,22 @@ class WhiskAutomationCoreV2:
     def connect_browser(self):
         """连接到比特浏览器"""
         try:
-            ws_endpoint = self.get_bitbrowser_cdp()
-            
-            self.playwright = sync_playwright().start()
-            self.browser = self.playwright.chromium.connect_over_cdp(ws_endpoint)
+            if self.connection_pool:
+                # 复用池中的连接，跳过 /browser/open、驱动启动和 CDP 握手
+                self.browser, reused = self.connection_pool.acquire(self.browser_id, self.get_bitbrowser_cdp)
+                if reused:
+                    self.log("✓ 复用已有浏览器连接")
+            else:
+                ws_endpoint = self.get_bitbrowser_cdp()
+                
+                self.playwright = sync_playwright().start()
+                try:
+                    self.browser = self.playwright.chromium.connect_over_cdp(ws_endpoint)
+                except Exception:
+                    # 缓存的端点可能已失效（窗口被关闭重开），重新打开窗口后重试
+                    self.log("CDP端点不可用，重新获取...")
+                    ws_endpoint = self.get_bitbrowser_cdp(force_refresh=True)
+                    self.browser = self.playwright.chromium.connect_over_cdp(ws_endpoint)
             
             # 获取已有的页面或创建新页面
             contexts = self.browser.contexts
@@ -116,6 +376,12 @@ class WhiskAutomationCoreV2:
                 
             self.log("成功连接到浏览器")
             
+            # 网络拦截模式：监听生成图片的响应
+            if self.capture_mode == 'network':
+                self.capture = ImageResponseCapture(self.page)
+                self.capture.start()
+                self.log("已启用网络拦截图片捕获")
+            
             # 检查当前页面
             current_url = self.page.url
             self.log(f"当前页面: {current_url}")
@@ -123,8 +389,9 @@ class WhiskAutomationCoreV2:
             # 如果不在 Whisk 项目页面，尝试导航
             if "whisk/project" not in current_url and "whisk" not in current_url:
                 self.log("不在 Whisk 页面，尝试导航...")
-                self.page.goto("https://labs.google/fx/tools/whisk")
-                time.sleep(3)
+                self.page.goto(self.WHISK_URL)
+                self._set_applied_ratio(None)
+                self._sleep(3)
                 
         except Exception as e:
             self.log(f"连接浏览器失败: {e}")
@@ -134,140 +401,165 @@ class WhiskAutomationCoreV2:
         """确保设置面板打开"""
         try:
             # 检查设置面板是否可见
-            settings_visible = self.page.query_selector('*:has-text("设置"):visible')
+            settings_visible = self.page.locator('*:has-text("设置"):visible').count() > 0
             
             if not settings_visible:
                 # 打开设置面板
-                settings_button = self.page.query_selector(self.selectors['settings_button'])
-                if not settings_button:
+                settings_button = self.page.locator(self.selectors['settings_button']).first
+                if not settings_button.count():
                     # 尝试其他选择器
-                    settings_button = self.page.query_selector('button:has-text("menu"):visible')
+                    settings_button = self.page.locator('button:has-text("menu"):visible').first
                 
-                if settings_button:
+                if settings_button.count():
                     self.log("打开设置面板...")
                     settings_button.click()
-                    time.sleep(2)
+                    self._sleep(2)
                 else:
                     self.log("未找到设置按钮")
                     
         except Exception as e:
             self.log(f"打开设置面板失败: {e}")
     
+    def _get_applied_ratio(self) -> str:
+        """当前页面已应用的纵横比；没有记录时视为页面默认的 1:1"""
+        return _page_aspect_ratios.get(self.page, "1:1") if self.page is not None else "1:1"
+    
+    def _set_applied_ratio(self, aspect_ratio: Optional[str]):
+        """记录（None 时清除）当前页面已应用的纵横比"""
+        if self.page is None:
+            return
+        if aspect_ratio is None:
+            _page_aspect_ratios.pop(self.page, None)
+        else:
+            _page_aspect_ratios[self.page] = aspect_ratio
+    
     def select_aspect_ratio(self, aspect_ratio: str):
-        """选择纵横比（新版页面）"""
+        """选择纵横比（新版页面）；页面已是该纵横比时直接跳过"""
         try:
             if aspect_ratio not in self.ASPECT_RATIOS:
                 self.log(f"不支持的纵横比: {aspect_ratio}，使用默认设置")
                 return
             
+            if _page_aspect_ratios.get(self.page) == aspect_ratio:
+                self.log(f"✓ 页面已是纵横比 {aspect_ratio}，跳过设置")
+                return
+            
             self.log(f"选择纵横比: {aspect_ratio} ({self.ASPECT_RATIOS[aspect_ratio]})")
             
             # 新版页面：纵横比在底部工具栏
-            # 1. 首先查找 aspect_ratio 按钮
-            aspect_button = self.page.query_selector('button:has-text("aspect_ratio"):visible, button:has(i:has-text("aspect_ratio")):visible')
+            aspect_button = self.page.locator(self.selectors['aspect_ratio_button']).first
             
-            if aspect_button:
+            if aspect_button.count():
                 self.log("找到 aspect_ratio 按钮，点击打开纵横比面板")
                 aspect_button.click()
-                time.sleep(2)  # 等待面板展开
-                
-                # 2. 查找纵横比选项
-                # 纵横比选项通常在彩色方块中显示
-                ratio_buttons = self.page.query_selector_all('button:visible, div[role="button"]:visible')
-                
-                for button in ratio_buttons:
-                    try:
-                        text = button.text_content() or ""
-                        # 匹配纵横比格式
-                        if aspect_ratio in text:
-                            self.log(f"找到 {aspect_ratio} 选项，点击...")
-                            button.click()
-                            self.log(f"✓ 成功选择纵横比: {aspect_ratio}")
-                            time.sleep(2)  # 等待选择生效
-                            
-                            # 关闭纵横比面板（如果需要）
-                            # 可以再次点击 aspect_ratio 按钮或点击其他地方
-                            return
-                    except:
-                        pass
-                
-                # 如果没找到精确匹配，尝试其他方法
-                self.log(f"未找到精确的 {aspect_ratio} 选项，尝试其他方法...")
                 
-                # 查找包含比例数字的元素
-                for button in ratio_buttons:
-                    try:
-                        text = button.text_content() or ""
-                        # 去除空格和特殊字符
-                        clean_text = text.replace(" ", "").replace("\n", "")
-                        if aspect_ratio.replace(":", "") in clean_text or aspect_ratio in clean_text:
-                            self.log(f"找到匹配的选项: {text.strip()}")
-                            button.click()
-                            self.log(f"✓ 成功选择纵横比: {aspect_ratio}")
-                            time.sleep(2)
-                            return
-                    except:
-                        pass
+                matched = self._click_aspect_ratio_option(aspect_ratio)
+                if not matched:
+                    self.log(f"未找到 {aspect_ratio} 选项")
+                    return
                 
-                self.log(f"未找到 {aspect_ratio} 选项")
+                self.log(f"✓ 成功选择纵横比: {aspect_ratio} (选项: {matched})")
+                self._set_applied_ratio(aspect_ratio)
+                self._sleep(self.ASPECT_RATIO_SETTLE)  # 等待选择生效
                 
             else:
                 # 尝试旧版方法（设置面板）
                 self.log("未找到 aspect_ratio 按钮，尝试设置面板方法")
                 self.ensure_settings_panel_open()
-                time.sleep(1)
+                self._sleep(1)
                 
                 # 查找下拉菜单
-                dropdown = self.page.query_selector('select:visible')
-                if dropdown:
+                dropdown = self.page.locator('select:visible').first
+                if dropdown.count():
                     try:
                         dropdown.select_option(value=aspect_ratio)
                         self.log(f"✓ 通过设置面板选择成功: {aspect_ratio}")
-                        time.sleep(2)
+                        self._set_applied_ratio(aspect_ratio)
+                        self._sleep(self.ASPECT_RATIO_SETTLE)
                     except:
                         self.log("设置面板选择失败")
                         
         except Exception as e:
             self.log(f"选择纵横比失败: {e}")
     
+    def _click_aspect_ratio_option(self, aspect_ratio: str) -> Optional[str]:
+        """
+        查找并点击纵横比选项（每次一次 evaluate，不逐个读取按钮文本），面板未渲染完时短暂等待后重试
+        不使用 wait_for_function：其默认按 requestAnimationFrame 轮询，后台标签页中不会触发
+        返回选项文本，超时返回 None
+        """
+        deadline = time.time() + self.ASPECT_RATIO_OPTION_TIMEOUT
+        while True:
+            try:
+                matched = self.page.evaluate(CLICK_ASPECT_RATIO_OPTION_JS, aspect_ratio)
+            except Exception:
+                matched = None
+            if matched or time.time() >= deadline:
+                return matched
+            self._sleep(self.ASPECT_RATIO_OPTION_POLL)
+    
     def input_prompt(self, prompt: str):
-        """输入提示词"""
+        """输入提示词（输入框中已是相同提示词时跳过）"""
         try:
-            self.log(f"输入提示词: {prompt[:50]}...")
-            
             # 查找输入框
-            textarea = self.page.query_selector(self.selectors['textarea'])
+            textarea = self.page.locator(self.selectors['textarea']).first
             
-            if not textarea:
+            if not textarea.count():
                 raise Exception("未找到输入框")
             
-            # 点击并清空
-            textarea.click()
-            time.sleep(0.5)
+            # 上一次生成的提示词仍在输入框中，无需重新输入
+            if textarea.input_value() == prompt:
+                textarea.focus()
+                self.log("✓ 输入框已是当前提示词，跳过输入")
+                return
             
-            # 清空现有内容
-            textarea.select_text()
-            textarea.type(prompt)
+            self.log(f"输入提示词: {prompt[:50]}...")
             
-            # 验证输入
-            value = textarea.input_value()
-            if prompt in value:
-                self.log("✓ 成功输入提示词")
-            else:
-                self.log("⚠ 提示词可能未完全输入")
+            # 从 input_mode 开始依次尝试，后面的方式作为兜底
+            for mode in self.INPUT_MODES[self.INPUT_MODES.index(self.input_mode):]:
+                self._enter_prompt(textarea, prompt, mode)
+                
+                # 验证输入
+                if textarea.input_value() == prompt:
+                    self.log("✓ 成功输入提示词")
+                    return
+                self.log(f"⚠ {mode} 方式输入不完整，尝试下一种方式")
+                self.metrics.count('input_fallback')
+            
+            self.log("⚠ 提示词可能未完全输入")
                 
         except Exception as e:
             self.log(f"输入提示词失败: {e}")
             raise
     
+    def _enter_prompt(self, textarea, prompt: str, mode: str):
+        """按指定方式写入输入框"""
+        if mode == 'fill':
+            # 一次性插入全部文本并触发 input 事件
+            textarea.fill(prompt)
+        elif mode == 'js':
+            textarea.evaluate(SET_TEXTAREA_VALUE_JS, prompt)
+        else:
+            # 逐字输入（旧版方式，最慢）
+            textarea.click()
+            self._sleep(0.5)
+            textarea.select_text()
+            textarea.type(prompt)
+    
     def trigger_generation(self):
         """触发图片生成"""
         try:
             self.log("触发生成...")
             
+            # 登记触发前的图片，等待和下载只关注之后出现的新图片
+            self._mark_generation_baseline()
+            
+            if self.capture:
+                self.capture.arm()
+            
             # 新版页面直接按回车即可
             self.page.keyboard.press('Enter')
-            time.sleep(1)
+            self._sleep(1)
             
             self.log("✓ 已触发生成")
             
@@ -275,32 +567,97 @@ class WhiskAutomationCoreV2:
             self.log(f"触发生成失败: {e}")
             raise
     
+    def _mark_generation_baseline(self):
+        """在页面内登记当前所有图片为旧结果（只回传集合大小）"""
+        try:
+            self.page.evaluate(MARK_GENERATION_BASELINE_JS)
+            self._baseline_marked = True
+        except Exception:
+            self._baseline_marked = False
+    
     def wait_for_generation(self, timeout: int = 60):
-        """等待图片生成完成（增加等待时间）"""
+        """等待图片生成完成，按 wait_mode 选择事件驱动或轮询方式"""
+        ready = None
+        if self.wait_mode == 'event':
+            try:
+                ready = self.wait_for_generation_event(timeout)
+            except Exception as e:
+                self.log(f"事件驱动等待失败，改用轮询: {e}")
+                self.metrics.count('wait_event_fallback')
+        
+        if ready is None:
+            ready = self.wait_for_generation_poll(timeout)
+        if not ready:
+            self.metrics.count('wait_timeout')
+        return ready
+    
+    def wait_for_generation_event(self, timeout: int = 60):
+        """事件驱动等待：新图片全部解码完成（complete && naturalWidth > 0）后立即返回"""
+        self.log(f"等待生成完成 (事件驱动，最多 {timeout} 秒)...")
+        
+        if not self._baseline_marked:
+            self.page.evaluate(MARK_GENERATION_BASELINE_JS)
+        
+        start_time = time.time()
+        deadline = start_time + timeout
+        while True:
+            # 分片等待，取消后最多再等一个分片
+            remaining = min(self.WAIT_SLICE, deadline - time.time())
+            ready_count = self.page.evaluate(
+                WAIT_FOR_NEW_IMAGES_JS,
+                [self.IMAGES_PER_GENERATION, self.GENERATED_IMAGE_MIN_SIZE, max(0, remaining) * 1000]
+            )
+            if ready_count >= self.IMAGES_PER_GENERATION or time.time() >= deadline:
+                break
+            self.cancel_token.raise_if_cancelled()
+        self._baseline_marked = False
+        
+        if ready_count < self.IMAGES_PER_GENERATION:
+            self.log(f"⚠ 等待超时 (已就绪 {ready_count}/{self.IMAGES_PER_GENERATION} 张)")
+            return False
+        
+        self.log(f"✓ {ready_count} 张新图片已加载完成 ({time.time() - start_time:.1f} 秒)")
+        
+        # 图片就绪后下载按钮通常随即出现，短暂等待即可
+        try:
+            self.page.locator(self.selectors['download_button']).first.wait_for(state='visible', timeout=5000)
+        except Exception:
+            self.log("⚠ 未等到下载按钮出现")
+        
+        return True
+    
+    def wait_for_generation_poll(self, timeout: int = 60):
+        """轮询等待图片生成完成（旧版方式，固定等待时间）"""
         try:
             self.log(f"等待生成完成 (最多 {timeout} 秒)...")
             
             start_time = time.time()
-            initial_images = len(self.page.query_selector_all('img:visible'))
+            initial_images = len(self.probe_page_state()['images'])
             
             while time.time() - start_time < timeout:
-                time.sleep(3)  # 增加检查间隔
+                self._sleep(3)  # 增加检查间隔
+                
+                # 一次探测取得图片、下载按钮和加载状态
+                state = self.probe_page_state()
+                current_images = len(state['images'])
+                # 加载指示器只在尚无新结果时视为仍在生成：
+                # 页面在结果区外常驻的加载指示器不应让已完成的生成一直等到超时
+                if state['spinners'] and current_images <= initial_images and not state['buttons']:
+                    continue  # 仍在生成中
                 
                 # 检查新图片
-                current_images = len(self.page.query_selector_all('img:visible'))
                 if current_images > initial_images:
                     self.log(f"✓ 检测到新图片 (共 {current_images} 张)")
                     # 增加等待时间，确保图片完全生成
                     self.log("等待图片完全加载...")
-                    time.sleep(7)  # 从2秒增加到7秒
+                    self._sleep(7)  # 从2秒增加到7秒
                     return True
                 
                 # 检查下载按钮
-                download_buttons = self.page.query_selector_all(self.selectors['download_button'] + ':visible')
-                if download_buttons:
-                    self.log(f"✓ 检测到下载按钮 ({len(download_buttons)} 个)")
+                if state['buttons']:
+                    self.log(f"✓ 检测到下载按钮 ({len(state['buttons'])} 个)")
                     # 额外等待确保所有元素加载完成
-                    time.sleep(5)  # 新增5秒等待
+                    self._sleep(5)  # 新增5秒等待
                     return True
             
             self.log("⚠ 等待超时")
@@ -310,157 +667,513 @@ class WhiskAutomationCoreV2:
             self.log(f"等待生成失败: {e}")
             return False
     
-    def download_image(self, download_all: bool = True):
-        """下载图片（默认下载所有图片）"""
-        downloaded = 0
+    def probe_page_state(self) -> Dict:
+        """
+        一次 evaluate 获取页面状态（见 PAGE_STATE_JS）
+        返回 {'images': [...], 'buttons': [...], 'spinners': n, 'alerts': [错误提示文本],
+              'stale': {'images': n, 'buttons': n}}，
+        images / buttons 只含本次生成的新结果，含 index、x、y、width、height；按钮的 image 为所属图片序号
+        """
+        return self.page.evaluate(PAGE_STATE_JS, self._page_state_args())
+    
+    def _page_state_args(self) -> List[Union[str, int]]:
+        return [self.selectors['download_button'], self.selectors['loading_spinner'],
+                self.selectors['error_banner'], self.GENERATED_IMAGE_MIN_SIZE]
+    
+    def _has_download_buttons(self, state: Dict) -> bool:
+        """记录本次生成的下载按钮数量（旧结果的按钮不下载）"""
+        stale = state['stale']['buttons']
+        if stale:
+            self.metrics.count('stale_buttons_skipped', stale)
+        
+        if not state['buttons']:
+            self.log(f"未找到本次生成的下载按钮 (忽略 {stale} 个旧结果)" if stale else "未找到下载按钮")
+            self.metrics.count('download_button_missing')
+            return False
+        
+        self.log(f"找到 {len(state['buttons'])} 个下载按钮" + (f" (忽略 {stale} 个旧结果)" if stale else ""))
+        return True
+    
+    def _button_image_index(self, state: Dict, button: Dict) -> Optional[int]:
+        """下载按钮对应的生成图片序号（截图兜底用）；无法确定归属时按从左到右的位置对应"""
+        if button.get('image') is not None:
+            return button['image']
+        generated_images = self._generated_images(state)
+        if button['index'] < len(generated_images):
+            return generated_images[button['index']]['index']
+        return None
+    
+    def _generated_images(self, state: Dict) -> List[Dict]:
+        """从页面状态中取出生成结果大图（排除头像、图标），按x坐标从左到右排序"""
+        size = self.GENERATED_IMAGE_MIN_SIZE
+        return sorted((img for img in state['images'] if img['width'] > size and img['height'] > size),
+                      key=lambda img: img['x'])
+    
+    def _position_label(self, index: int) -> str:
+        """图片位置描述（Whisk 一次生成左右两张）"""
+        return "左侧" if index == 0 else "右侧"
+    
+    def _next_image_path(self, index: int, ext: str = '.jpg', prefix: str = 'whisk') -> Path:
+        """分配下一个图片文件路径（线程安全计数）"""
+        with self.lock:
+            self.downloaded_count += 1
+            count = self.downloaded_count
+        
+        position = self._position_label(index)
+        filename = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{count}_{position}{ext}"
+        return self.save_directory / filename
+    
+    def collect_images_network(self) -> List[Dict]:
+        """网络拦截模式：取出本轮捕获到的原始图片字节"""
+        images = self.capture.collect(self.IMAGES_PER_GENERATION)
+        
+        if not images:
+            self.log("⚠ 未捕获到图片响应")
+            return []
+        
+        return [
+            {'index': index, 'ext': ext, 'prefix': 'whisk', 'data': data, 'source': 'capture'}
+            for index, (data, ext) in enumerate(images[:self.IMAGES_PER_GENERATION])
+        ]
+    
+    def _temp_download_path(self) -> Path:
+        """保存目录中的临时文件路径（隐藏文件，保存阶段再重命名）"""
+        return self.save_directory / f".whisk_{uuid.uuid4().hex}.part"
+    
+    def _resolve_download(self, download: Download) -> Dict:
+        """
+        等待下载完成并返回待保存项
+        优先使用 Playwright 临时文件路径，由保存阶段移动到保存目录（见 _place_item）；
+        无法获取路径时直接落盘为临时文件
+        """
+        try:
+            return {'path': Path(download.path()), 'move': False}
+        except Exception:
+            temp_path = self._temp_download_path()
+            download.save_as(temp_path)
+            return {'path': temp_path, 'move': True}
+    
+    def collect_images(self) -> List[Dict]:
+        """
+        识别并取回本轮生成的图片（需要在浏览器线程中执行）
+        返回待保存项列表，由 save_images 负责命名、写盘和后处理
+        """
+        if self.capture:
+            items = self.collect_images_network()
+            if items:
+                return items
+            self.log("网络捕获失败，改用下载按钮")
+            self.metrics.count('capture_fallback')
+        
+        items = []
         
         try:
             if self.use_enhanced_download:
                 self.log("使用增强版下载机制...")
-                time.sleep(5)  # 增强版等待时间
-            
-            # 查找所有下载按钮
-            download_buttons = self.page.query_selector_all(self.selectors['download_button'] + ':visible')
+                # 事件驱动等待已确认图片解码完成，无需额外等待
+                if self.wait_mode == 'poll':
+                    self._sleep(5)  # 增强版等待时间
             
-            if not download_buttons:
-                self.log("未找到下载按钮")
-                return 0
+            # 一次 evaluate 取得本次生成的下载按钮和图片的位置（不创建元素句柄）
+            state = self.probe_page_state()
+            if not self._has_download_buttons(state):
+                return []
             
-            self.log(f"找到 {len(download_buttons)} 个下载按钮")
-            
-            # Whisk现在一次生成2张图片，需要下载所有图片
-            # 按位置排序，确保按顺序下载（左->右）
-            button_positions = []
-            for i, button in enumerate(download_buttons):
-                try:
-                    box = button.bounding_box()
-                    if box:
-                        button_positions.append({
-                            'index': i,
-                            'button': button,
-                            'x': box['x']
-                        })
-                except:
-                    pass
-            
-            # 按x坐标排序（从左到右）
-            sorted_buttons = sorted(button_positions, key=lambda b: b['x'])
-            
-            # 下载所有图片
-            for btn_info in sorted_buttons:
+            # Whisk现在一次生成2张图片，需要下载本次生成的所有图片
+            # 按x坐标排序（从左到右），通过探测时标记的 data 属性定位点击
+            for button in sorted(state['buttons'], key=lambda b: b['x']):
+                self.cancel_token.raise_if_cancelled()
                 try:
-                    button = btn_info['button']
-                    position = "左侧" if btn_info['index'] == 0 else "右侧"
-                    
                     # 准备下载
                     with self.page.expect_download(timeout=30000) as download_info:
-                        button.click()
-                        download = download_info.value
-                        
-                        # 生成文件名
-                        with self.lock:
-                            self.downloaded_count += 1
-                            count = self.downloaded_count
-                        
-                        filename = f"whisk_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{count}_{position}.jpg"
-                        save_path = self.save_directory / filename
-                        
-                        # 保存文件
-                        download.save_as(save_path)
-                        downloaded += 1
-                        
-                        self.log(f"✓ 下载成功 ({position}): {filename}")
-                        
+                        self.page.locator(f'[data-whisk-download="{button["index"]}"]').click()
+                    download = download_info.value
+                    
+                    item = {'index': button['index'], 'ext': '.jpg', 'prefix': 'whisk', 'source': 'download'}
+                    item.update(self._resolve_download(download))
+                    items.append(item)
+                    
                     # 短暂延迟，避免下载冲突
-                    time.sleep(1)
+                    self._sleep(1)
                         
                 except Exception as e:
                     self.log(f"⚠ 下载失败: {e}")
+                    self.metrics.count('download_failed')
                     
-                    # 尝试截图保存
+                    # 尝试截图保存对应位置的生成图片
                     if self.use_enhanced_download:
                         try:
-                            # 查找生成的大图片
-                            images = self.page.query_selector_all('img:visible')
-                            generated_images = []
-                            
-                            for img in images:
-                                try:
-                                    box = img.bounding_box()
-                                    if box and box['width'] > 200 and box['height'] > 200:
-                                        generated_images.append({
-                                            'element': img,
-                                            'x': box['x']
-                                        })
-                                except:
-                                    pass
-                            
-                            # 按x坐标排序
-                            sorted_images = sorted(generated_images, key=lambda img: img['x'])
-                            
-                            # 保存对应位置的图片
-                            if btn_info['index'] < len(sorted_images):
-                                img_element = sorted_images[btn_info['index']]['element']
-                                
-                                with self.lock:
-                                    self.downloaded_count += 1
-                                    count = self.downloaded_count
-                                
-                                position = "左侧" if btn_info['index'] == 0 else "右侧"
-                                filename = f"whisk_screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{count}_{position}.png"
-                                save_path = self.save_directory / filename
-                                
-                                img_element.screenshot(path=save_path)
-                                downloaded += 1
-                                
-                                self.log(f"✓ 截图保存 ({position}): {filename}")
+                            image_index = self._button_image_index(state, button)
+                            if image_index is not None:
+                                self.metrics.count('screenshot_fallback')
+                                items.append({
+                                    'index': button['index'],
+                                    'ext': '.png',
+                                    'prefix': 'whisk_screenshot',
+                                    'data': self.page.locator(f'[data-whisk-image="{image_index}"]').screenshot(),
+                                    'source': 'screenshot'
+                                })
                         except:
                             pass
             
-            return downloaded
+            return items
             
         except Exception as e:
             self.log(f"下载过程出错: {e}")
-            return downloaded
+            return items
+    
+    def save_images(self, items: List[Dict], saved_paths: Optional[List[Path]] = None) -> int:
+        """
+        保存 collect_images 取回的图片：分配文件名、写盘并执行后处理
+        只做本地文件操作，可以在后台线程中运行；saved_paths 不为空时追加保存路径
+        """
+        with self.metrics.span('save'):
+            return self._save_items(items, saved_paths)
+    
+    def _save_items(self, items: List[Dict], saved_paths: Optional[List[Path]] = None) -> int:
+        saved = 0
+        
+        for item in items:
+            position = self._position_label(item['index'])
+            try:
+                duplicate = None
+                if self.dedup_index is not None:
+                    digest, fingerprint = self._fingerprint(item)
+                    # 截图与原图字节不同，只有截图按感知哈希比较（避免把相似的新图误判为重复）
+                    duplicate = self.dedup_index.find(digest, fingerprint if item['source'] == 'screenshot' else None)
+                    if duplicate is not None:
+                        self.metrics.count('duplicate')
+                        if self.dedup == 'skip':
+                            self.log(f"⚠ 重复图片已跳过 ({position}): 与 {duplicate.name} 相同")
+                            self._discard_item(item)
+                            continue
+                
+                save_path = self._next_image_path(item['index'], item['ext'], item['prefix'])
+                
+                if duplicate is not None:
+                    self._link_duplicate(duplicate, save_path)
+                    self._discard_item(item)
+                    self.log(f"✓ 重复图片已链接 ({position}): {save_path.name} -> {duplicate.name}")
+                    saved += 1
+                    if saved_paths is not None:
+                        saved_paths.append(save_path)
+                    continue
+                
+                self.metrics.count(f"place_{self._place_item(item, save_path)}")
+                saved += 1
+                if self.dedup_index is not None:
+                    self.dedup_index.add(save_path, digest, fingerprint)
+                if saved_paths is not None:
+                    saved_paths.append(save_path)
+                size = len(item['data']) if item.get('data') is not None else save_path.stat().st_size
+                self.metrics.add_image(size, item['source'])
+                
+                if item['source'] == 'screenshot':
+                    self.log(f"✓ 截图保存 ({position}): {save_path.name}")
+                elif item['source'] == 'capture':
+                    self.log(f"✓ 捕获保存 ({position}): {save_path.name} ({len(item['data']) // 1024} KB)")
+                else:
+                    self.log(f"✓ 下载成功 ({position}): {save_path.name}")
+                
+                if self.post_process_callback:
+                    try:
+                        self.post_process_callback(save_path, item)
+                    except Exception as e:
+                        self.log(f"⚠ 后处理失败 ({save_path.name}): {e}")
+                        
+            except Exception as e:
+                self.log(f"⚠ 保存图片失败 ({position}): {e}")
+                self.metrics.count('save_failed')
+                self._discard_item(item)
+        
+        return saved
+    
+    def _place_item(self, item: Dict, save_path: Path) -> str:
+        """
+        把待保存项放到最终路径，返回放置方式（move / link / copy / write）
+        下载文件与保存目录在同一文件系统时直接重命名（失败时硬链接），不再复制一遍；
+        其余情况先写入保存目录中的临时文件，完成后再重命名，输出目录中不会出现写了一半的图片
+        """
+        if item.get('data') is not None:
+            self._write_via_temp(save_path, lambda temp_path: temp_path.write_bytes(item['data']))
+            return 'write'
+        
+        try:
+            os.replace(item['path'], save_path)
+            return 'move'
+        except OSError:
+            # 跨文件系统（或文件仍被占用）时无法重命名
+            pass
+        if not item.get('move'):
+            try:
+                os.link(item['path'], save_path)
+                return 'link'
+            except OSError:
+                pass
+        
+        self._copy_via_temp(item['path'], save_path)
+        self._discard_item(item)
+        return 'copy'
+    
+    def _write_via_temp(self, save_path: Path, write: Callable[[Path], None]):
+        """写入保存目录中的临时文件，完成后重命名为 save_path；失败时删除临时文件"""
+        temp_path = self._temp_download_path()
+        try:
+            write(temp_path)
+            os.replace(temp_path, save_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+    
+    def _copy_via_temp(self, source, save_path: Path):
+        # copyfile 分块复制（平台支持时使用零拷贝系统调用），不把文件读入内存
+        self._write_via_temp(save_path, lambda temp_path: shutil.copyfile(source, temp_path))
+    
+    @staticmethod
+    def _discard_item(item: Dict):
+        """删除未使用的临时下载文件（Playwright 自己的临时文件由其自行清理）"""
+        if item.get('move') and item.get('path'):
+            try:
+                os.unlink(item['path'])
+            except OSError:
+                pass
+    
+    def _fingerprint(self, item: Dict):
+        """图片的 SHA-256（文件分块读取）与 dHash（Pillow 不可用时为 None）"""
+        if item.get('data') is not None:
+            return hash_bytes(item['data']), dhash(item['data'])
+        return hash_file(item['path']), dhash(item['path'])
+    
+    def _link_duplicate(self, existing: Path, save_path: Path):
+        """以硬链接保存重复图片，不支持硬链接（跨盘、FAT 等）时经临时文件复制"""
+        try:
+            os.link(existing, save_path)
+        except OSError:
+            self._copy_via_temp(existing, save_path)
+    
+    def download_image(self, download_all: bool = True):
+        """下载图片（默认下载所有图片）"""
+        return self.save_images(self.collect_images())
+    
+    def _save_iteration(self, iteration: int, items: List[Dict],
+                        prompt: Optional[str] = None, aspect_ratio: Optional[str] = None) -> Dict:
+        """流水线后台任务：保存一次生成的图片并记录耗时，结果写入任务日志"""
+        start_time = time.time()
+        saved_paths = []
+        # 提示词等信息随待保存项交给后处理（写入图片元数据）
+        for item in items:
+            item.update(iteration=iteration, prompt=prompt, aspect_ratio=aspect_ratio)
+        downloaded = self.save_images(items, saved_paths)
+        
+        if downloaded > 0:
+            self.log(f"✓ 第 {iteration} 次生成完成，下载了 {downloaded} 张图片")
+        else:
+            self.log(f"⚠ 第 {iteration} 次生成下载失败")
+        
+        if self.journal:
+            self.journal.record(iteration, prompt, aspect_ratio, 'done' if downloaded > 0 else 'failed',
+                                saved_paths, None if downloaded > 0 else '下载失败')
+        
+        return {'downloaded': downloaded, 'busy': time.time() - start_time}
+    
+    def _join_pending_save(self, future) -> None:
+        """等待上一轮后台保存完成，统计主线程被阻塞的时间"""
+        if future is None:
+            return
+        
+        wait_start = time.time()
+        try:
+            result = future.result()
+            self.pipeline_stats['save_seconds'] += result['busy']
+        except Exception as e:
+            self.log(f"⚠ 后台保存出错: {e}")
+        self.pipeline_stats['blocked_seconds'] += time.time() - wait_start
+        self.pipeline_stats['batches'] += 1
+    
+    def _report_pipeline_stats(self):
+        """输出流水线重叠统计（只统计保存阶段，取回图片的耗时不在其中）"""
+        stats = self.pipeline_stats
+        saved = max(0.0, stats['save_seconds'] - stats['blocked_seconds'])
+        stats['overlap_seconds'] = saved
+        ratio = saved / stats['save_seconds'] * 100 if stats['save_seconds'] > 0 else 0.0
+        
+        self.log(f"流水线统计: 后台保存 {stats['batches']} 批，耗时 {stats['save_seconds']:.2f} 秒，"
+                 f"主线程等待 {stats['blocked_seconds']:.2f} 秒，"
+                 f"重叠节省约 {saved:.2f} 秒 ({ratio:.0f}%)")
+    
+    def _generate_and_collect(self) -> Optional[List[Dict]]:
+        """触发、等待并取回图片，记录整次生成的延迟；等待超时返回 None"""
+        generation_start = time.perf_counter()
+        with self.metrics.span('trigger'):
+            self.trigger_generation()
+        return self._collect_generation(generation_start)
+    
+    def _collect_generation(self, generation_start: float) -> Optional[List[Dict]]:
+        """等待已触发的生成完成并取回图片；等待超时返回 None"""
+        with self.metrics.span('wait'):
+            ready = self.wait_for_generation()
+        if not ready:
+            self._record_pacing(None, None, self._error_banner())
+            return None
+        with self.metrics.span('collect'):
+            items = self.collect_images()
+        latency = time.perf_counter() - generation_start
+        self.metrics.observe('generation', latency, bool(items))
+        self._record_pacing(items, latency, self._error_banner())
+        return items
+    
+    def start_pacing(self, min_delay: int, max_delay: int):
+        """
+        adaptive 模式下以静态延时范围为起点创建间隔控制器
+        延时范围不变时保留已有的控制器（同一会话的多个提示词沿用已调整的间隔）
+        """
+        if self.pacing != 'adaptive':
+            return
+        if self.pacer is None or (self.pacer.min_delay, self.pacer.max_delay) != (min_delay, max_delay):
+            self.pacer = AdaptivePacer(min_delay, max_delay)
+    
+    def next_delay(self, min_delay: int, max_delay: int) -> float:
+        """两次生成之间的等待秒数"""
+        if self.pacer is None:
+            return random.randint(min_delay, max_delay)
+        return self.pacer.next_delay()
+    
+    def _error_banner(self) -> Optional[str]:
+        """页面上的错误提示（仅 adaptive 模式检测，多一次 evaluate）"""
+        if self.pacer is None:
+            return None
+        try:
+            alerts = self.probe_page_state()['alerts']
+        except Exception:
+            return None
+        return alerts[0] if alerts else None
+    
+    def _record_pacing(self, items: Optional[List[Dict]], latency: Optional[float], error_banner: Optional[str]):
+        """把本次生成的结果反馈给间隔控制器"""
+        if self.pacer is None:
+            return
+        if error_banner:
+            self.log(f"⚠ 页面错误提示: {error_banner}")
+        previous = self.pacer.delay
+        verdict = self.pacer.record(latency, timed_out=items is None, images=len(items or []),
+                                    expected=self.IMAGES_PER_GENERATION, error_banner=error_banner)
+        self.metrics.count(f'pacing_{verdict}')
+        if verdict == 'degraded' or abs(self.pacer.delay - previous) >= 1:
+            self.log(f"自适应间隔: {previous:.1f} → {self.pacer.delay:.1f} 秒 ({verdict})")
+    
+    def _report_metrics(self):
+        """运行结束时输出指标汇总（JSON）并推送 summary 事件"""
+        try:
+            self.metrics_summary = self.metrics.report()
+            self.log(f"指标汇总: {json.dumps(self.metrics_summary, ensure_ascii=False)}")
+        except Exception as e:
+            self.log(f"⚠ 指标汇总失败: {e}")
+    
+    def generate_once(self, prompt: str, aspect_ratio: Optional[str] = None) -> int:
+        """
+        单次生成：必要时切换纵横比，然后输入、触发、等待并保存
+        返回保存的图片数，供调度器按单次生成分配任务
+        """
+        if aspect_ratio and aspect_ratio != self._get_applied_ratio():
+            with self.metrics.span('aspect_ratio'):
+                self.select_aspect_ratio(aspect_ratio)
+        
+        with self.metrics.span('input'):
+            self.input_prompt(prompt)
+        
+        items = self._generate_and_collect()
+        if items is None:
+            self.log("⚠ 生成超时")
+            return 0
+        
+        downloaded = self.save_images(items)
+        if downloaded > 0:
+            self.log(f"✓ 生成完成，下载了 {downloaded} 张图片")
+        else:
+            self.log("⚠ 生成下载失败")
+        return downloaded
+    
+    def _pending_iterations(self, prompt: str, count: int, aspect_ratio: str, resume: bool) -> List[int]:
+        """本次需要执行的生成序号（从 0 开始），并在任务日志中登记本次任务"""
+        if not self.journal:
+            if resume:
+                self.log("⚠ 未启用任务日志，无法断点续跑，将执行全部生成")
+            return list(range(count))
+        
+        completed = self.journal.completed_iterations(prompt, aspect_ratio) if resume else set()
+        pending = [i for i in range(count) if i + 1 not in completed]
+        self.journal.start_job(prompt, aspect_ratio, count, resume)
+        if resume:
+            self.log(f"断点续跑: 已完成 {count - len(pending)} 次，剩余 {len(pending)} 次生成")
+        return pending
     
     def generate_images(self, prompt: str, count: int, aspect_ratio: str = "1:1", 
-                       min_delay: int = 5, max_delay: int = 8):
-        """生成多张图片的主流程"""
+                       min_delay: int = 5, max_delay: int = 8, resume: bool = False):
+        """生成多张图片的主流程（resume=True 时跳过任务日志中已完成的生成）"""
+        executor = None
+        pending_save = None
+        
         try:
             self.log(f"开始生成任务: {count} 次生成, 比例 {aspect_ratio} (每次生成2张图片)")
+            pending = self._pending_iterations(prompt, count, aspect_ratio, resume)
+            if not pending:
+                self.update_progress(count, count)
+                self.log("✓ 任务日志显示所有生成均已完成，无需续跑")
+                return
             
-            # 选择纵横比（每次任务开始时设置一次）
-            if aspect_ratio != "1:1":  # 如果不是默认比例
-                self.select_aspect_ratio(aspect_ratio)
-                time.sleep(2)  # 等待设置生效
+            # 选择纵横比（每次任务开始时设置一次；页面已是该比例时跳过）
+            if aspect_ratio != self._get_applied_ratio():
+                with self.metrics.span('aspect_ratio'):
+                    self.select_aspect_ratio(aspect_ratio)
             
-            # 生成图片
-            for i in range(count):
-                self.log(f"\n--- 第 {i+1}/{count} 次生成 ---")
-                self.update_progress(i, count)
-                
-                # 输入提示词
-                self.input_prompt(prompt)
-                
-                # 触发生成
-                self.trigger_generation()
-                
-                # 等待生成
-                if self.wait_for_generation():
-                    # 下载图片（Whisk现在一次生成2张）
-                    downloaded = self.download_image()
-                    if downloaded > 0:
-                        self.log(f"✓ 第 {i+1} 次生成完成，下载了 {downloaded} 张图片")
+            # 多标签页模式下各标签页交替等待，不再使用流水线保存
+            tab_mode = self.tabs > 1 and len(pending) > 1
+            
+            # 流水线模式使用单个后台线程保存图片（取回仍在本线程），最多只有一轮在途
+            executor = None
+            if self.pipeline and not tab_mode:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisk-save")
+            self.start_pacing(min_delay, max_delay)
+            self.pipeline_stats = {'batches': 0, 'save_seconds': 0.0, 'blocked_seconds': 0.0, 'overlap_seconds': 0.0}
+            
+            if tab_mode:
+                self._generate_images_tabs(prompt, pending, count, aspect_ratio, min_delay, max_delay)
+            else:
+                # 生成图片
+                for position, i in enumerate(pending):
+                    self.cancel_token.raise_if_cancelled()
+                    self.log(f"\n--- 第 {i+1}/{count} 次生成 ---")
+                    self.update_progress(count - len(pending) + position, count)
+                    
+                    # 输入提示词
+                    with self.metrics.span('input'):
+                        self.input_prompt(prompt)
+                    
+                    # 触发、等待生成并取回图片（Whisk现在一次生成2张）
+                    items = self._generate_and_collect()
+                    if items is not None:
+                        if executor:
+                            # 流水线模式：本轮图片已取回，写盘在后台进行，主线程继续等待间隔和下一次生成
+                            self._join_pending_save(pending_save)
+                            pending_save = executor.submit(self._save_iteration, i + 1, items, prompt, aspect_ratio)
+                        else:
+                            self._save_iteration(i + 1, items, prompt, aspect_ratio)
                     else:
-                        self.log(f"⚠ 第 {i+1} 次生成下载失败")
-                else:
-                    self.log(f"⚠ 第 {i+1} 次生成超时")
-                
-                # 延迟
-                if i < count - 1:
-                    delay = random.randint(min_delay, max_delay)
-                    self.log(f"等待 {delay} 秒...")
-                    time.sleep(delay)
+                        self.log(f"⚠ 第 {i+1} 次生成超时")
+                        if self.journal:
+                            self.journal.record(i + 1, prompt, aspect_ratio, 'timeout', error='生成超时')
+                    
+                    # 延迟
+                    if position < len(pending) - 1:
+                        delay = self.next_delay(min_delay, max_delay)
+                        self.log(f"等待 {delay:.1f} 秒...")
+                        with self.metrics.span('delay'):
+                            self._sleep(delay)
+            
+            if executor:
+                self._join_pending_save(pending_save)
+                pending_save = None
+                self._report_pipeline_stats()
             
             self.update_progress(count, count)
             self.log(f"\n✅ 任务完成！共下载 {self.downloaded_count} 张图片")
@@ -469,11 +1182,230 @@ class WhiskAutomationCoreV2:
         except Exception as e:
             self.log(f"❌ 生成过程出错: {e}")
             raise
+        finally:
+            # 确保后台保存在浏览器断开前完成（下载的临时文件随连接关闭而删除）
+            if executor:
+                if pending_save is not None:
+                    self._join_pending_save(pending_save)
+                executor.shutdown(wait=True)
+    
+    def _make_tab_worker(self, page, number: int) -> 'WhiskAutomationCoreV2':
+        """
+        新标签页的工作实例：按主实例的选项新建，页面、网络捕获和生成基线各自独立（纵横比按页面缓存）
+        连接、指标、任务日志、去重索引、间隔控制器等由 _share_run_state 从主实例同步
+        """
+        tab = type(self)(
+            browser_id=self.browser_id,
+            save_directory=str(self.save_directory),
+            message_callback=lambda msg: self.message_callback(f"[标签页{number}] {msg}"),
+            use_enhanced_download=self.use_enhanced_download,
+            wait_mode=self.wait_mode,
+            capture_mode=self.capture_mode,
+            input_mode=self.input_mode,
+            pacing=self.pacing,
+            cancel_token=self.cancel_token
+        )
+        tab.page = page
+        # 文件编号由主实例统一分配，避免多个标签页重名
+        tab._next_image_path = self._next_image_path
+        if self.capture_mode == 'network':
+            tab.capture = ImageResponseCapture(page)
+            tab.capture.start()
+        self._share_run_state(tab)
+        self._tab_workers.append(tab)
+        return tab
+    
+    def _share_run_state(self, tab: 'WhiskAutomationCoreV2'):
+        """
+        把主实例当前的共享状态交给标签页；每次多标签页生成开始前都重新同步，
+        主实例之后重新创建的对象（如延时范围变化后的间隔控制器）不会在标签页中过期
+        """
+        tab.browser = self.browser
+        tab.selectors = self.selectors
+        tab.metrics = self.metrics
+        tab.pacer = self.pacer
+        tab.journal = self.journal
+        tab.dedup = self.dedup
+        tab.dedup_index = self.dedup_index
+        tab.post_process_callback = self.post_process_callback
+    
+    def _activate_page(self):
+        """
+        把本页面切到前台后再操作：后台标签页中 requestAnimationFrame 暂停、定时器被限流
+        （其余标签页等待期间仍在后台，比特浏览器窗口可加启动参数
+        --disable-background-timer-throttling --disable-renderer-backgrounding 取消限流）
+        """
+        try:
+            self.page.bring_to_front()
+        except Exception:
+            pass
+    
+    def _open_tabs(self, total: int) -> List['WhiskAutomationCoreV2']:
+        """在同一上下文中打开其余标签页（与主页面同一 Whisk 项目），返回包括主实例在内的工作实例"""
+        url = self.page.url if "whisk" in self.page.url else self.WHISK_URL
+        # 会话中前一个提示词已打开的标签页直接复用
+        workers = [self] + self._tab_workers[:total - 1]
+        for tab in workers[1:]:
+            self._share_run_state(tab)
+        for number in range(len(workers) + 1, total + 1):
+            try:
+                page = self.page.context.new_page()
+                page.goto(url)
+                workers.append(self._make_tab_worker(page, number))
+            except Exception as e:
+                self.log(f"⚠ 打开第 {number} 个标签页失败: {e}")
+                break
+        self.log(f"多标签页模式: {len(workers)} 个标签页同时生成")
+        return workers
+    
+    def _close_tabs(self):
+        """关闭本实例打开的标签页（主页面保留）"""
+        for tab in self._tab_workers:
+            try:
+                if tab.capture:
+                    tab.capture.stop()
+                tab.page.close()
+            except Exception:
+                pass
+        self._tab_workers = []
+    
+    def _record_tab_failure(self, iteration: int, prompt: str, aspect_ratio: str, status: str, error: str):
+        self.log(f"⚠ 第 {iteration} 次生成{error}")
+        if self.journal:
+            self.journal.record(iteration, prompt, aspect_ratio, status, error=error)
+    
+    def _generate_images_tabs(self, prompt: str, pending: List[int], count: int, aspect_ratio: str,
+                              min_delay: int, max_delay: int):
+        """
+        多标签页生成：每一轮在各标签页依次输入并触发（服务端并行生成），再按触发顺序依次等待、取回并保存
+        生成本身在服务端重叠，但取回是串行的：后面的标签页要等前面的取回完成才开始等待，
+        一轮的耗时约为最慢的一次生成加上各标签页取回耗时之和
+        """
+        workers = self._open_tabs(min(self.tabs, len(pending)))
+        queue = deque(pending)
+        done = count - len(pending)
+        
+        while queue:
+            wave = [(tab, queue.popleft()) for tab in workers if queue]
+            
+            started = []
+            for tab, i in wave:
+                self.cancel_token.raise_if_cancelled()
+                tab.log(f"\n--- 第 {i+1}/{count} 次生成 ---")
+                try:
+                    tab._activate_page()
+                    if aspect_ratio != tab._get_applied_ratio():
+                        with self.metrics.span('aspect_ratio'):
+                            tab.select_aspect_ratio(aspect_ratio)
+                    with self.metrics.span('input'):
+                        tab.input_prompt(prompt)
+                    generation_start = time.perf_counter()
+                    with self.metrics.span('trigger'):
+                        tab.trigger_generation()
+                    started.append((tab, i, generation_start))
+                except Exception as e:
+                    tab._record_tab_failure(i + 1, prompt, aspect_ratio, 'failed', f"提交失败: {e}")
+            
+            for tab, i, generation_start in started:
+                tab._activate_page()
+                items = tab._collect_generation(generation_start)
+                if items is None:
+                    tab._record_tab_failure(i + 1, prompt, aspect_ratio, 'timeout', "超时")
+                else:
+                    tab._save_iteration(i + 1, items, prompt, aspect_ratio)
+            
+            done += len(wave)
+            self.update_progress(done, count)
+            
+            if queue:
+                delay = self.next_delay(min_delay, max_delay)
+                self.log(f"等待 {delay:.1f} 秒...")
+                with self.metrics.span('delay'):
+                    self._sleep(delay)
+    
+    @staticmethod
+    def _session_items(items: Iterable, aspect_ratio: str, count: int) -> Iterator[Dict]:
+        """会话条目规范化：提示词字符串、(提示词, 纵横比, 次数) 元组或字典，缺省项取会话默认值"""
+        for item in items:
+            if isinstance(item, str):
+                prompt, ratio, n = item, None, None
+            elif isinstance(item, dict):
+                prompt, ratio, n = item['prompt'], item.get('aspect_ratio'), item.get('count')
+            else:
+                prompt, ratio, n = (tuple(item) + (None, None))[:3]
+            yield {'prompt': prompt, 'aspect_ratio': ratio or aspect_ratio, 'count': n or count}
+    
+    def _log_session_item(self, number: int, item: Dict):
+        prompt = item['prompt'] if len(item['prompt']) <= 50 else item['prompt'][:50] + "..."
+        self.log(f"\n=== 提示词 {number}: {prompt} ({item['aspect_ratio']}, {item['count']} 次) ===")
+    
+    def _session_item_failed(self, summary: Dict):
+        """单个提示词失败时继续下一个；浏览器连接已断开时结束会话"""
+        summary['failed'] += 1
+        self.metrics.count('session_item_failed')
+        if self.browser is None or not self.browser.is_connected():
+            raise Exception("浏览器连接已断开，会话结束")
+    
+    def run_session(self, items: Iterable, aspect_ratio: str = "1:1", count: int = 1,
+                    min_delay: int = 5, max_delay: int = 8, resume: bool = False) -> Dict:
+        """
+        在一次浏览器连接中依次生成多个提示词：连接、清理只做一次，纵横比不变时不再重复选择
+        items 见 _session_items，可以是生成器（如 whisk_template_v2.expand_prompts），逐条取用
+        返回 {'prompts': 提示词数, 'failed': 失败数, 'downloaded': 图片数}
+        """
+        summary = {'prompts': 0, 'failed': 0}
+        try:
+            self.cancel_token.raise_if_cancelled()
+            
+            with self.metrics.span('connect'):
+                self.connect_browser()
+            
+            for number, item in enumerate(self._session_items(items, aspect_ratio, count), 1):
+                if number > 1:
+                    # 提示词之间同样保持生成间隔
+                    delay = self.next_delay(min_delay, max_delay)
+                    self.log(f"等待 {delay:.1f} 秒...")
+                    with self.metrics.span('delay'):
+                        self._sleep(delay)
+                
+                self._log_session_item(number, item)
+                summary['prompts'] += 1
+                try:
+                    self.generate_images(item['prompt'], item['count'], item['aspect_ratio'],
+                                         min_delay, max_delay, resume)
+                except Exception:
+                    self._session_item_failed(summary)
+            
+            self.log(f"\n✅ 会话完成: {summary['prompts']} 个提示词 (失败 {summary['failed']} 个), "
+                     f"共下载 {self.downloaded_count} 张图片")
+            
+        except TaskCancelled:
+            self.log("⚠ 任务已停止")
+            raise
+        except Exception as e:
+            self.log(f"运行失败: {e}")
+            raise
+        finally:
+            self.cleanup()
+            self._report_metrics()
+        
+        summary['downloaded'] = self.downloaded_count
+        return summary
     
     def cleanup(self):
         """清理资源"""
         try:
-            if self.browser:
+            self._close_tabs()
+            if self.capture:
+                self.capture.stop()
+                self.capture = None
+            if self.connection_pool:
+                # 连接归还给连接池，由池负责空闲断开
+                healthy = bool(self.browser) and self.browser.is_connected()
+                self.connection_pool.release(self.browser_id, healthy)
+                self.browser = None
+                self.page = None
+            elif self.browser:
                 self.browser.close()
             if self.playwright:
                 self.playwright.stop()
@@ -482,18 +1414,26 @@ class WhiskAutomationCoreV2:
             self.log(f"清理资源时出错: {e}")
     
     def run(self, prompt: str, count: int, aspect_ratio: str = "1:1",
-            min_delay: int = 5, max_delay: int = 8):
-        """运行完整的自动化流程"""
+            min_delay: int = 5, max_delay: int = 8, resume: bool = False):
+        """运行完整的自动化流程（取消时抛出 TaskCancelled）"""
         try:
+            # 排队期间可能已被取消
+            self.cancel_token.raise_if_cancelled()
+            
             # 连接浏览器
-            self.connect_browser()
+            with self.metrics.span('connect'):
+                self.connect_browser()
             
             # 生成图片
-            self.generate_images(prompt, count, aspect_ratio, min_delay, max_delay)
+            self.generate_images(prompt, count, aspect_ratio, min_delay, max_delay, resume)
             
+        except TaskCancelled:
+            self.log("⚠ 任务已停止")
+            raise
         except Exception as e:
             self.log(f"运行失败: {e}")
             raise
         finally:
             # 清理资源
-            self.cleanup()
\ No newline at end of file
+            self.cleanup()
+            self._report_metrics()
\ No newline at end of file
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 图片去重索引
+按内容哈希（SHA-256）索引已保存的图片，检测误判后重复保存的同一张图；
+截图兜底得到的图片与原图字节不同，额外用感知哈希（dHash）比较
+
+索引追加写入保存目录下的 .whisk_index.jsonl，每行一条记录:
+    {"sha256": "...", "dhash": "0f3c...", "file": "任务_1/whisk_..._1_左.jpg"}
+后处理转换格式后追加一条改名记录:
+    {"moved_from": "任务_1/whisk_screenshot_..._1_左.png", "file": "任务_1/whisk_screenshot_..._1_左.jpg"}
+同一目录的索引在进程内共享（多个任务并发写入），后续任务只需读取一次索引文件
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+
+# 流式哈希的分块大小
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: Union[str, Path]) -> str:
+    """分块读取计算 SHA-256，不把整个文件读入内存"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dhash(source: Union[bytes, str, Path], size: int = 8) -> Optional[int]:
+    """
+    差值哈希（64 位）：缩放为 (size+1) x size 灰度图，比较相邻像素
+    缩放、重新编码、截图后哈希基本不变；Pillow 不可用或无法解码时返回 None
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+            # JPEG 直接按缩小的尺寸解码，避免完整解码大图
+            image.draft('L', (size * 4, size * 4))
+            pixels = list(image.convert('L').resize((size + 1, size), Image.Resampling.LANCZOS).getdata())
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+class ImageIndex:
+    """已保存图片的内容索引（线程安全）"""
+
+    FILENAME = ".whisk_index.jsonl"
+
+    # dHash 汉明距离不超过该值视为同一张图
+    DHASH_THRESHOLD = 6
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.path = self.directory / self.FILENAME
+        self._lock = threading.Lock()
+        self._by_sha: Dict[str, str] = {}
+        self._dhashes: List[Tuple[int, str]] = []
+        self._loaded = False
+
+    def _load(self):
+        """首次查询时读取索引文件（跳过损坏的行）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if 'moved_from' in record:
+                        self._rename(record['moved_from'], record['file'])
+                        continue
+                    self._remember(record['sha256'], record.get('dhash'), record['file'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def _remember(self, sha256: str, fingerprint, file: str):
+        self._by_sha.setdefault(sha256, file)
+        if fingerprint is not None:
+            self._dhashes.append((int(fingerprint, 16) if isinstance(fingerprint, str) else fingerprint, file))
+
+    def _rename(self, old: str, new: str) -> bool:
+        renamed = False
+        for sha256, file in self._by_sha.items():
+            if file == old:
+                self._by_sha[sha256] = new
+                renamed = True
+        for position, (fingerprint, file) in enumerate(self._dhashes):
+            if file == old:
+                self._dhashes[position] = (fingerprint, new)
+                renamed = True
+        return renamed
+
+    def _relative(self, path: Union[str, Path]) -> str:
+        try:
+            return os.path.relpath(path, self.directory)
+        except ValueError:
+            # Windows 下不同盘符无法取相对路径
+            return str(Path(path).resolve())
+
+    def _existing(self, file: str) -> Optional[Path]:
+        path = self.directory / file
+        return path if path.exists() else None
+
+    def find(self, sha256: str, fingerprint: Optional[int] = None) -> Optional[Path]:
+        """
+        查找内容相同的已保存图片；传入 fingerprint 时再按感知哈希查找相似图片
+        索引中的文件已被删除时不算重复
+        """
+        with self._lock:
+            self._load()
+            file = self._by_sha.get(sha256)
+            if file is not None:
+                existing = self._existing(file)
+                if existing:
+                    return existing
+
+            if fingerprint is not None:
+                for other, file in self._dhashes:
+                    if bin(fingerprint ^ other).count('1') <= self.DHASH_THRESHOLD:
+                        existing = self._existing(file)
+                        if existing:
+                            return existing
+        return None
+
+    def add(self, path: Union[str, Path], sha256: str, fingerprint: Optional[int] = None):
+        """登记一张新保存的图片并追加写入索引文件"""
+        file = self._relative(path)
+        record = {'sha256': sha256, 'dhash': f"{fingerprint:016x}" if fingerprint is not None else None, 'file': file}
+
+        with self._lock:
+            self._load()
+            self._remember(sha256, fingerprint, file)
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def rename(self, old_path: Union[str, Path], new_path: Union[str, Path]) -> bool:
+        """已登记的图片被改名（如后处理转换格式）时更新索引；未登记时返回 False"""
+        old, new = self._relative(old_path), self._relative(new_path)
+        with self._lock:
+            self._load()
+            if not self._rename(old, new):
+                return False
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'moved_from': old, 'file': new}, ensure_ascii=False) + "\n")
+        return True
+
+
+_indexes: Dict[str, ImageIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_image_index(directory: Union[str, Path]) -> ImageIndex:
+    """进程内共享的目录索引（同一目录只加载一次）"""
+    key = str(Path(directory).resolve())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = ImageIndex(directory)
+        return index
+
+
+def rename_indexed_file(old_path: Union[str, Path], new_path: Union[str, Path]):
+    """在进程内已打开的所有索引中更新被改名的图片"""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.rename(old_path, new_path)
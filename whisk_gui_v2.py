@@ -13,9 +13,14 @@ from pathlib import Path
 from datetime import datetime
 import queue
 import logging
+import multiprocessing
 
-# 导入新的核心自动化类
-from whisk_core_v2 import WhiskAutomationCoreV2
+# 核心自动化类（playwright）和比特浏览器客户端（requests）在首次使用时才导入，加快启动
+from whisk_cancel_v2 import CancellationToken, TaskCancelled
+from whisk_log_v2 import LogBuffer, get_task_logs
+from whisk_pool_v2 import get_default_pool
+from whisk_postprocess_v2 import PostProcessor
+from whisk_template_v2 import PromptTemplate, expand_prompts
 
 class WhiskGUIV2:
     def __init__(self, root):
@@ -31,6 +36,8 @@ class WhiskGUIV2:
         self.threads = {}  # 存储活动线程
         self.thread_counter = 0
         self.max_concurrent_tasks = 3  # 最大并发任务数
+        self.scheduler = None  # 多窗口调度器（按需创建）
+        self.post_processor = None  # 图片后处理进程池（按需创建，所有任务共用）
         
         # 消息队列用于线程间通信
         self.message_queue = queue.Queue()
@@ -38,14 +45,21 @@ class WhiskGUIV2:
         # 加载配置
         self.load_config()
         
+        # 日志管道：界面日志按周期合并插入并限制行数，完整日志异步写入各任务的滚动文件
+        self.log_buffer = LogBuffer(max_lines=self.config.get('log_max_lines', 2000))
+        self.task_logs = get_task_logs(self.config.get('log_directory', './logs'))
+        
         # 创建界面
         self.create_widgets()
         
         # 启动消息处理
         self.process_messages()
         
-        # 加载比特浏览器列表
+        # 在后台加载比特浏览器列表，窗口先完成绘制；之后定时刷新
         self.load_browser_list()
+        interval = self.config.get('browser_refresh_interval', 30)
+        if interval > 0:
+            self.root.after(int(interval * 1000), self.auto_refresh_browser_list)
     
     def load_config(self):
         """加载配置文件"""
@@ -57,10 +71,27 @@ class WhiskGUIV2:
             "last_count": 4,
             "save_directory": "./downloads",
             "use_enhanced_download": True,
+            "event_wait": True,
+            "network_capture": False,
+            "pipeline": False,
+            "adaptive_pacing": False,
+            "skip_duplicates": False,
+            "post_process": False,
+            "post_convert": "jpeg",
+            "post_max_size": 0,
+            "post_thumbnail": 256,
+            "post_metadata": False,
+            "multi_prompt": False,
+            "template_variable_dir": "./prompt_vars",
+            "use_scheduler": False,
             "create_task_folders": True,
             "min_delay": 5,
             "max_delay": 8,
-            "max_concurrent": 2
+            "max_concurrent": 2,
+            "tabs_per_profile": 1,
+            "browser_refresh_interval": 30,
+            "log_max_lines": 2000,
+            "log_directory": "./logs"
         }
         
         if self.config_file.exists():
@@ -124,11 +155,15 @@ class WhiskGUIV2:
                                          width=22, state="readonly")
         self.browser_combo.grid(row=row, column=1, sticky=(tk.W, tk.E), pady=2)
         
-        # 存储浏览器ID映射
+        # 存储浏览器ID映射，以及上次获取的各窗口 (名称, 状态)，用于比较变化
         self.browser_id_map = {}
+        self.browser_states = None
+        self.browser_list_loading = False
+        self.browser_list_error = None
         
-        # 刷新浏览器列表按钮
-        refresh_btn = ttk.Button(config_frame, text="刷新", command=self.load_browser_list, width=6)
+        # 刷新浏览器列表按钮（手动刷新不使用缓存）
+        refresh_btn = ttk.Button(config_frame, text="刷新", width=6,
+                                 command=lambda: self.load_browser_list(force_refresh=True))
         refresh_btn.grid(row=row, column=2, padx=(5, 0), pady=2)
         row += 1
         
@@ -139,6 +174,13 @@ class WhiskGUIV2:
         self.prompt_text.insert(tk.END, self.config.get('last_prompt', ''))
         row += 1
         
+        # 多提示词：每行一个提示词（支持模板展开），在同一浏览器连接中依次生成
+        self.multi_prompt_var = tk.BooleanVar(value=self.config.get('multi_prompt', False))
+        multi_prompt_cb = ttk.Checkbutton(config_frame, text="多提示词 (每行一个，支持 {a|b} 和 {$变量} 模板)", 
+                                         variable=self.multi_prompt_var)
+        multi_prompt_cb.grid(row=row, column=1, columnspan=2, sticky=tk.W, pady=2)
+        row += 1
+        
         # 纵横比选择（新增5种选项）
         ttk.Label(config_frame, text="纵横比:").grid(row=row, column=0, sticky=tk.W, pady=2)
         self.ratio_var = tk.StringVar(value=self.config.get('last_ratio', '1:1'))
@@ -214,6 +256,55 @@ class WhiskGUIV2:
         enhanced_cb.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=2)
         row += 1
         
+        # 事件驱动等待生成完成
+        self.event_wait_var = tk.BooleanVar(value=self.config.get('event_wait', True))
+        event_wait_cb = ttk.Checkbutton(config_frame, text="事件驱动等待生成 (更快)", 
+                                       variable=self.event_wait_var)
+        event_wait_cb.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=2)
+        row += 1
+        
+        # 网络拦截保存原图
+        self.network_capture_var = tk.BooleanVar(value=self.config.get('network_capture', False))
+        network_capture_cb = ttk.Checkbutton(config_frame, text="网络拦截保存原图 (跳过下载按钮)", 
+                                            variable=self.network_capture_var)
+        network_capture_cb.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=2)
+        row += 1
+        
+        # 流水线模式：图片取回后在后台写盘，与生成间隔和下一次生成重叠
+        self.pipeline_var = tk.BooleanVar(value=self.config.get('pipeline', False))
+        pipeline_cb = ttk.Checkbutton(config_frame, text="流水线模式 (后台保存图片)", 
+                                     variable=self.pipeline_var)
+        pipeline_cb.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=2)
+        row += 1
+        
+        # 自适应间隔：服务正常时缩短生成间隔，超时或出错时自动退避
+        self.adaptive_pacing_var = tk.BooleanVar(value=self.config.get('adaptive_pacing', False))
+        adaptive_pacing_cb = ttk.Checkbutton(config_frame, text="自适应生成间隔 (根据服务状态调整延时)", 
+                                            variable=self.adaptive_pacing_var)
+        adaptive_pacing_cb.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=2)
+        row += 1
+        
+        # 去重：按内容哈希跳过误判后重复保存的图片（索引位于保存目录，所有任务共用）
+        self.skip_duplicates_var = tk.BooleanVar(value=self.config.get('skip_duplicates', False))
+        skip_duplicates_cb = ttk.Checkbutton(config_frame, text="跳过重复图片 (按内容比对已保存的图片)", 
+                                            variable=self.skip_duplicates_var)
+        skip_duplicates_cb.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=2)
+        row += 1
+        
+        # 后处理：截图转换格式、生成缩略图（后台进程池，参数见配置文件 post_*；post_metadata 开启后写入提示词，每张图会多写一次）
+        self.post_process_var = tk.BooleanVar(value=self.config.get('post_process', False))
+        post_process_cb = ttk.Checkbutton(config_frame, text="图片后处理 (截图转JPEG、缩略图)", 
+                                         variable=self.post_process_var)
+        post_process_cb.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=2)
+        row += 1
+        
+        # 多窗口调度：任务拆分到所有运行中的浏览器执行
+        self.scheduler_var = tk.BooleanVar(value=self.config.get('use_scheduler', False))
+        scheduler_cb = ttk.Checkbutton(config_frame, text="多窗口调度 (使用所有运行中浏览器)", 
+                                      variable=self.scheduler_var)
+        scheduler_cb.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=2)
+        row += 1
+        
         # 延时设置
         delay_frame = ttk.Frame(config_frame)
         delay_frame.grid(row=row, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
@@ -246,6 +337,18 @@ class WhiskGUIV2:
         ttk.Label(concur_frame, text="个").pack(side=tk.LEFT, padx=(5, 0))
         row += 1
         
+        # 每个窗口的标签页数
+        tabs_frame = ttk.Frame(config_frame)
+        tabs_frame.grid(row=row, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
+        
+        ttk.Label(tabs_frame, text="每窗口标签页:").pack(side=tk.LEFT)
+        self.tabs_var = tk.IntVar(value=self.config.get('tabs_per_profile', 1))
+        tabs_spin = ttk.Spinbox(tabs_frame, from_=1, to=4, textvariable=self.tabs_var, 
+                               width=5)
+        tabs_spin.pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Label(tabs_frame, text="个 (多次生成分摊到多个标签页同时进行)").pack(side=tk.LEFT, padx=(5, 0))
+        row += 1
+        
         # 操作按钮
         button_frame = ttk.Frame(config_frame)
         button_frame.grid(row=row, column=0, columnspan=3, pady=(20, 0))
@@ -333,6 +436,7 @@ class WhiskGUIV2:
         self.context_menu = tk.Menu(self.root, tearoff=0)
         self.context_menu.add_command(label="查看详情", command=self.view_task_details)
         self.context_menu.add_command(label="停止任务", command=self.stop_selected_task)
+        self.context_menu.add_command(label="断点续跑", command=self.resume_selected_task)
         self.context_menu.add_separator()
         self.context_menu.add_command(label="清除已完成", command=self.clear_completed_tasks)
     
@@ -368,67 +472,120 @@ class WhiskGUIV2:
                                  foreground="gray")
         version_label.pack(side=tk.RIGHT, padx=10)
     
-    def load_browser_list(self):
-        """加载比特浏览器列表"""
-        try:
-            import requests
-            
-            # 使用正确的API参数
-            payload = {"page": 0, "pageSize": 200}
-            self.log_message("正在获取浏览器列表...", "info")
-            
-            response = requests.post("http://127.0.0.1:54345/browser/list", json=payload, timeout=5)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data.get('success') and 'data' in data:
-                    browsers = []
-                    self.browser_id_map = {}
-                    data_obj = data['data']
-                    
-                    if isinstance(data_obj, dict) and 'list' in data_obj:
-                        browser_list = data_obj['list']
-                        
-                        running_count = 0
-                        for browser in browser_list:
-                            if isinstance(browser, dict):
-                                name = browser.get('name', '未命名')
-                                browser_id = browser.get('id', '')
-                                status_code = browser.get('status', 0)
-                                
-                                if status_code == 1:
-                                    running_count += 1
-                                    status = "运行中"
-                                    display_name = f"{name} ({status})"
-                                    browsers.append(display_name)
-                                    self.browser_id_map[display_name] = browser_id
-                        
-                        self.log_message(f"找到 {running_count} 个运行中的浏览器", "success")
-                        
-                        if browsers:
-                            current_value = self.browser_var.get()
-                            self.browser_combo['values'] = browsers
-                            
-                            if current_value in browsers:
-                                self.browser_var.set(current_value)
-                            else:
-                                self.browser_var.set(browsers[0])
-                        else:
-                            self.browser_combo['values'] = []
-                            self.browser_var.set("")
-                            self.log_message("没有找到运行中的浏览器", "warning")
-                    else:
-                        self.log_message("API响应格式错误", "error")
-                else:
-                    self.log_message("获取浏览器列表失败", "error")
+    def fetch_browser_list(self, force_refresh: bool = False):
+        """获取比特浏览器窗口列表（不操作界面，可在后台线程中调用；缓存未过期时不请求 API）"""
+        # 延迟导入：requests 只在第一次获取列表时加载
+        from whisk_bitbrowser_v2 import get_client
+        
+        # 客户端自动翻页获取全部窗口，并复用连接
+        return get_client().list_browsers(force_refresh=force_refresh, timeout=5)
+    
+    def describe_browser_list_error(self, error):
+        """浏览器列表获取失败时的提示信息"""
+        import requests
+        from whisk_bitbrowser_v2 import BitBrowserError
+        
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return "无法连接到比特浏览器，请确保其正在运行"
+        if isinstance(error, BitBrowserError):
+            return f"获取浏览器列表失败: {error}"
+        return f"加载浏览器列表时出错: {str(error)}"
+    
+    def apply_browser_list(self, browser_list, quiet: bool = False):
+        """
+        用获取到的窗口列表更新下拉框（须在界面线程中调用）
+        与上次结果比较，只增删状态或名称变化的窗口，没有变化时不改动下拉框
+        """
+        states = {}
+        for browser in browser_list:
+            browser_id = browser.get('id', '')
+            if browser_id:
+                states[browser_id] = (browser.get('name', '未命名'), browser.get('status', 0))
+        
+        # 首次加载时 browser_states 为 None，总是刷新下拉框
+        old_states = self.browser_states if self.browser_states is not None else {}
+        first_load = self.browser_states is None
+        self.browser_states = states
+        changed = {b for b in states.keys() | old_states.keys() if states.get(b) != old_states.get(b)}
+        
+        running = {b: name for b, (name, status) in states.items() if status == 1}
+        if not quiet:
+            self.log_message(f"找到 {len(running)} 个运行中的浏览器", "success")
+        if not changed and not first_load:
+            return
+        
+        # 保留原有顺序：去掉停止/消失的窗口，更新改名的窗口，新运行的窗口追加在末尾
+        display_by_id = {b: d for d, b in self.browser_id_map.items() if b in running and b not in changed}
+        order = [b for b in self.browser_id_map.values() if b in running]
+        order += [b for b in running if b not in order]
+        for browser_id in order:
+            display_by_id.setdefault(browser_id, f"{running[browser_id]} (运行中)")
+        
+        added = [b for b in order if b not in self.browser_id_map.values()]
+        removed = [b for b in self.browser_id_map.values() if b not in running]
+        if quiet and (added or removed):
+            self.log_message(f"浏览器列表变化: 新增 {len(added)} 个，移除 {len(removed)} 个", "info")
+        
+        current_id = self.browser_id_map.get(self.browser_var.get())
+        self.browser_id_map = {display_by_id[b]: b for b in order}
+        browsers = list(self.browser_id_map)
+        self.browser_combo['values'] = browsers
+        
+        # 调度器运行中时，把新出现的窗口加入调度
+        if self.scheduler and added:
+            for browser_id in added:
+                self.scheduler.add_browser(browser_id)
+        
+        if browsers:
+            if current_id in order:
+                self.browser_var.set(display_by_id[current_id])
+            elif self.config.get('last_browser') in browsers:
+                self.browser_var.set(self.config['last_browser'])
             else:
-                self.log_message(f"API请求失败: {response.status_code}", "error")
-                
-        except requests.exceptions.ConnectionError:
-            self.log_message("无法连接到比特浏览器，请确保其正在运行", "error")
-        except Exception as e:
-            self.log_message(f"加载浏览器列表时出错: {str(e)}", "error")
+                self.browser_var.set(browsers[0])
+        else:
+            self.browser_var.set("")
+            self.log_message("没有找到运行中的浏览器", "warning")
+    
+    def load_browser_list(self, force_refresh: bool = False, quiet: bool = False):
+        """
+        在后台线程获取浏览器列表，结果通过消息队列回到界面线程
+        启动加载和定时刷新使用客户端的列表缓存，只有点击"刷新"时强制请求
+        """
+        if self.browser_list_loading:
+            return
+        self.browser_list_loading = True
+        if not quiet:
+            self.log_message("正在获取浏览器列表...", "info")
+        
+        def worker():
+            try:
+                result = ('ok', self.fetch_browser_list(force_refresh))
+            except Exception as e:
+                result = ('error', self.describe_browser_list_error(e))
+            self.message_queue.put(('browsers', None, (result, quiet)))
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def on_browser_list_loaded(self, result, quiet):
+        """处理后台获取的浏览器列表（界面线程）"""
+        self.browser_list_loading = False
+        status, payload = result
+        if status == 'ok':
+            self.browser_list_error = None
+            self.apply_browser_list(payload, quiet=quiet)
+        elif not quiet or payload != self.browser_list_error:
+            # 自动刷新时同样的错误只提示一次
+            self.browser_list_error = payload
+            self.log_message(payload, "error")
+    
+    def auto_refresh_browser_list(self):
+        """定时刷新浏览器列表（间隔 browser_refresh_interval 秒，0 表示关闭）"""
+        interval = self.config.get('browser_refresh_interval', 30)
+        if interval <= 0:
+            return
+        self.load_browser_list(quiet=True)
+        self.root.after(int(interval * 1000), self.auto_refresh_browser_list)
     
     def browse_directory(self):
         """浏览目录"""
@@ -445,11 +602,11 @@ class WhiskGUIV2:
     
     def add_task(self):
         """添加新任务"""
-        # 检查并发限制
-        running_count = sum(1 for t in self.threads.values() if t['status'] == 'running')
+        # 检查并发限制（调度模式下任务排队，由空闲窗口领取；停止中的任务在线程退出前仍占用名额）
+        running_count = self.active_task_count()
         max_concurrent = self.max_concurrent_var.get()
         
-        if running_count >= max_concurrent:
+        if running_count >= max_concurrent and not self.scheduler_var.get():
             messagebox.showwarning("并发限制", 
                                  f"当前已有 {running_count} 个任务在运行，\n"
                                  f"最大并发数为 {max_concurrent}。\n"
@@ -472,6 +629,18 @@ class WhiskGUIV2:
             messagebox.showerror("错误", "请输入提示词")
             return
         
+        multi_prompt = self.multi_prompt_var.get()
+        if multi_prompt:
+            if self.scheduler_var.get():
+                messagebox.showerror("错误", "多窗口调度暂不支持多提示词，请关闭其中一项")
+                return
+            try:
+                total = sum(PromptTemplate(line, variables_dir=self.config.get('template_variable_dir')).size()
+                            for line in prompt.splitlines() if line.strip())
+            except (OSError, ValueError) as e:
+                messagebox.showerror("错误", f"提示词模板有误: {e}")
+                return
+        
         # 保存配置
         self.config['last_browser'] = browser_display
         self.config['last_prompt'] = prompt
@@ -479,10 +648,19 @@ class WhiskGUIV2:
         self.config['last_count'] = self.count_var.get()
         self.config['save_directory'] = self.save_dir_var.get()
         self.config['use_enhanced_download'] = self.enhanced_download_var.get()
+        self.config['event_wait'] = self.event_wait_var.get()
+        self.config['network_capture'] = self.network_capture_var.get()
+        self.config['pipeline'] = self.pipeline_var.get()
+        self.config['adaptive_pacing'] = self.adaptive_pacing_var.get()
+        self.config['skip_duplicates'] = self.skip_duplicates_var.get()
+        self.config['post_process'] = self.post_process_var.get()
+        self.config['multi_prompt'] = multi_prompt
+        self.config['use_scheduler'] = self.scheduler_var.get()
         self.config['create_task_folders'] = self.create_folders_var.get()
         self.config['min_delay'] = self.min_delay_var.get()
         self.config['max_delay'] = self.max_delay_var.get()
         self.config['max_concurrent'] = self.max_concurrent_var.get()
+        self.config['tabs_per_profile'] = self.tabs_var.get()
         self.save_config()
         
         # 更新状态栏
@@ -517,6 +695,10 @@ class WhiskGUIV2:
             "准备中"
         ))
         
+        if self.scheduler_var.get():
+            self.submit_scheduled_task(task_id, tree_item, browser_display, prompt, str(task_dir))
+            return
+        
         # 创建线程
         thread = threading.Thread(
             target=self.run_task,
@@ -531,7 +713,10 @@ class WhiskGUIV2:
             'tree_item': tree_item,
             'status': 'running',
             'browser': browser_display,
+            'browser_id': browser_id,
+            'cancel': CancellationToken(),
             'prompt': prompt,
+            'multi_prompt': multi_prompt,
             'ratio': self.ratio_var.get(),
             'count': self.count_var.get(),
             'save_dir': str(task_dir)
@@ -547,10 +732,112 @@ class WhiskGUIV2:
         # 更新任务名称
         self.task_name_var.set(f"任务_{datetime.now().strftime('%H%M%S')}")
         
-        self.log_message(f"任务 {task_id} 已启动", "success")
+        if multi_prompt:
+            self.log_message(f"任务 {task_id} 已启动 (多提示词，最多 {total} 个)", "success")
+        else:
+            self.log_message(f"任务 {task_id} 已启动", "success")
+    
+    def get_core_options(self):
+        """当前界面选项对应的核心类参数"""
+        return {
+            'use_enhanced_download': self.enhanced_download_var.get(),
+            'wait_mode': 'event' if self.event_wait_var.get() else 'poll',
+            'capture_mode': 'network' if self.network_capture_var.get() else 'click',
+            'pipeline': self.pipeline_var.get(),
+            'tabs': self.tabs_var.get(),
+            'pacing': 'adaptive' if self.adaptive_pacing_var.get() else 'static',
+            'journal': True,
+            'dedup': 'skip' if self.skip_duplicates_var.get() else 'off',
+            'dedup_directory': self.save_dir_var.get(),
+            'post_process_callback': self.get_post_processor() if self.post_process_var.get() else None
+        }
+    
+    def get_post_processor(self):
+        """获取图片后处理进程池（首次使用时按配置创建）"""
+        if self.post_processor is None:
+            self.post_processor = PostProcessor(
+                convert=self.config.get('post_convert', 'jpeg'),
+                max_size=self.config.get('post_max_size', 0),
+                thumbnail=self.config.get('post_thumbnail', 256),
+                metadata=self.config.get('post_metadata', False),
+                message_callback=lambda msg: self.message_queue.put(('log', '后处理', msg))
+            )
+        return self.post_processor
     
-    def run_task(self, task_id, browser_id, prompt, count, ratio, save_dir, tree_item):
-        """在单独线程中运行任务"""
+    def get_scheduler(self):
+        """获取多窗口调度器，并把当前所有运行中的浏览器加入调度"""
+        if self.scheduler is None:
+            from whisk_scheduler_v2 import WhiskScheduler
+            
+            def progress_callback(job_id, done, total):
+                self.message_queue.put(('progress', job_id, (done, total)))
+            
+            def job_done_callback(job_id, summary):
+                # 运行在调度线程中：任务状态随 done 消息交给界面线程更新
+                if summary.get('cancelled'):
+                    status = 'stopped'
+                else:
+                    status = 'completed' if summary['done'] > 0 else 'failed'
+                self.message_queue.put(('log', job_id, 
+                                        f"调度任务结束: 成功 {summary['done']} 次, 失败 {summary['failed']} 次, "
+                                        f"共 {summary['images']} 张图片"))
+                self.message_queue.put(('status', job_id, {'completed': "已完成", 'stopped': "已停止"}.get(status, "失败")))
+                self.message_queue.put(('done', job_id, status))
+            
+            # 构造参数只是默认值，每个任务提交时带上当时的界面选项
+            self.scheduler = WhiskScheduler(
+                browser_ids=[],
+                save_directory=self.save_dir_var.get(),
+                message_callback=lambda msg: self.message_queue.put(('log', '调度', msg)),
+                progress_callback=progress_callback,
+                job_done_callback=job_done_callback,
+                connection_pool=get_default_pool(),
+                core_options=self.get_core_options(),
+                min_delay=self.min_delay_var.get(),
+                max_delay=self.max_delay_var.get()
+            )
+        
+        for browser_id in self.browser_id_map.values():
+            self.scheduler.add_browser(browser_id)
+        
+        return self.scheduler
+    
+    def submit_scheduled_task(self, task_id, tree_item, browser_display, prompt, save_dir):
+        """把任务提交给多窗口调度器"""
+        try:
+            scheduler = self.get_scheduler()
+            scheduler.submit(prompt, self.ratio_var.get(), self.count_var.get(),
+                             save_directory=save_dir, job_id=task_id,
+                             core_options=self.get_core_options(),
+                             min_delay=self.min_delay_var.get(),
+                             max_delay=self.max_delay_var.get())
+        except Exception as e:
+            self.task_tree.set(tree_item, '状态', "失败")
+            self.log_message(f"[{task_id}] 调度失败: {e}", "error")
+            return
+        
+        self.threads[task_id] = {
+            'thread': None,
+            'tree_item': tree_item,
+            'status': 'running',
+            'cancel': None,
+            'browser': f"调度 ({len(self.browser_id_map)} 个窗口)",
+            'prompt': prompt,
+            'ratio': self.ratio_var.get(),
+            'count': self.count_var.get(),
+            'save_dir': save_dir
+        }
+        
+        self.task_tree.set(tree_item, '浏览器', "调度")
+        self.task_tree.set(tree_item, '状态', "排队中")
+        self.update_running_count()
+        self.stop_all_btn.config(state=tk.NORMAL)
+        self.task_name_var.set(f"任务_{datetime.now().strftime('%H%M%S')}")
+        
+        self.log_message(f"任务 {task_id} 已提交到多窗口调度 ({len(self.browser_id_map)} 个窗口)", "success")
+    
+    def run_task(self, task_id, browser_id, prompt, count, ratio, save_dir, tree_item, resume=False):
+        """在单独线程中运行任务（resume=True 时按保存目录中的任务日志续跑）"""
         def message_callback(msg):
             self.message_queue.put(('log', task_id, msg))
         
@@ -558,8 +845,18 @@ class WhiskGUIV2:
             self.message_queue.put(('progress', task_id, (current, total)))
         
         try:
-            # 更新状态
-            self.message_queue.put(('status', task_id, "连接中"))
+            # 首次运行任务时才加载自动化核心（playwright）
+            import_start = time.perf_counter()
+            from whisk_core_v2 import WhiskAutomationCoreV2
+            import_seconds = time.perf_counter() - import_start
+            if import_seconds > 0.05:
+                self.message_queue.put(('log', task_id, f"加载自动化核心耗时 {import_seconds:.2f} 秒"))
+            
+            # 同一浏览器的任务在连接池线程中依次执行，并复用浏览器连接
+            pool = get_default_pool()
+            if pool.is_busy(browser_id):
+                self.message_queue.put(('status', task_id, "排队中"))
+                self.message_queue.put(('log', task_id, "该浏览器有任务正在运行，排队等待..."))
             
             # 创建自动化实例
             automation = WhiskAutomationCoreV2(
@@ -567,22 +864,48 @@ class WhiskGUIV2:
                 save_directory=save_dir,
                 message_callback=message_callback,
                 progress_callback=progress_callback,
-                use_enhanced_download=self.enhanced_download_var.get()
+                connection_pool=pool,
+                cancel_token=self.threads[task_id]['cancel'],
+                **self.get_core_options()
             )
             
-            # 运行自动化
-            automation.run(
-                prompt=prompt,
-                count=count,
-                aspect_ratio=ratio,
-                min_delay=self.min_delay_var.get(),
-                max_delay=self.max_delay_var.get()
-            )
+            min_delay = self.min_delay_var.get()
+            max_delay = self.max_delay_var.get()
+            
+            def run_in_pool():
+                # 更新状态
+                self.message_queue.put(('status', task_id, "连接中"))
+                
+                # 运行自动化（多提示词在同一连接中依次生成）
+                if self.threads[task_id].get('multi_prompt'):
+                    automation.run_session(
+                        expand_prompts(prompt.splitlines(), variables_dir=self.config.get('template_variable_dir')),
+                        aspect_ratio=ratio,
+                        count=count,
+                        min_delay=min_delay,
+                        max_delay=max_delay,
+                        resume=resume
+                    )
+                else:
+                    automation.run(
+                        prompt=prompt,
+                        count=count,
+                        aspect_ratio=ratio,
+                        min_delay=min_delay,
+                        max_delay=max_delay,
+                        resume=resume
+                    )
+            
+            pool.submit(browser_id, run_in_pool).result()
             
             # 任务完成
             self.message_queue.put(('status', task_id, "已完成"))
             self.threads[task_id]['status'] = 'completed'
             
+        except TaskCancelled:
+            self.message_queue.put(('status', task_id, "已停止"))
+            self.threads[task_id]['status'] = 'stopped'
+            
         except Exception as e:
             self.message_queue.put(('error', task_id, str(e)))
             self.message_queue.put(('status', task_id, "失败"))
@@ -598,23 +921,30 @@ class WhiskGUIV2:
                 msg_type, task_id, data = self.message_queue.get_nowait()
                 
                 if msg_type == 'log':
-                    self.log_message(f"[{task_id}] {data}", "info")
+                    self.log_message(data, "info", task_id=task_id)
                 
                 elif msg_type == 'progress':
                     current, total = data
                     if task_id in self.threads:
                         tree_item = self.threads[task_id]['tree_item']
-                        self.task_tree.set(tree_item, 'progress', f"{current}/{total}")
+                        self.task_tree.set(tree_item, '进度', f"{current}/{total}")
                 
                 elif msg_type == 'status':
                     if task_id in self.threads:
                         tree_item = self.threads[task_id]['tree_item']
-                        self.task_tree.set(tree_item, 'status', data)
+                        self.task_tree.set(tree_item, '状态', data)
                 
                 elif msg_type == 'error':
-                    self.log_message(f"[{task_id}] 错误: {data}", "error")
+                    self.log_message(f"错误: {data}", "error", task_id=task_id)
+                
+                elif msg_type == 'browsers':
+                    self.on_browser_list_loaded(*data)
                 
                 elif msg_type == 'done':
+                    # 调度任务的最终状态随消息传回，普通任务由任务线程设置
+                    if data is not None and task_id in self.threads:
+                        self.threads[task_id]['status'] = data
+                    self.task_logs.close_task(task_id)
                     self.update_running_count()
                     if not any(t['status'] == 'running' for t in self.threads.values()):
                         self.stop_all_btn.config(state=tk.DISABLED)
@@ -622,19 +952,29 @@ class WhiskGUIV2:
         except queue.Empty:
             pass
         
+        # 本周期的日志一次性写入控件
+        self.log_buffer.flush(self.log_text)
+        
         # 继续处理
         self.root.after(100, self.process_messages)
     
-    def log_message(self, message, tag="info"):
-        """添加日志消息"""
+    def log_message(self, message, tag="info", task_id=None):
+        """添加日志消息（下一个消息处理周期显示）；任务日志同时写入该任务的日志文件"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n", tag)
-        self.log_text.see(tk.END)
+        if task_id is not None:
+            self.task_logs.write(task_id, message, tag)
+            message = f"[{task_id}] {message}"
+        else:
+            self.task_logs.write('gui', message, tag)
+        self.log_buffer.append(f"[{timestamp}] {message}\n", tag)
+    
+    def active_task_count(self):
+        """占用浏览器的任务数（包括已请求停止、线程尚未退出的任务）"""
+        return sum(1 for t in self.threads.values() if t['status'] in ('running', 'stopping'))
     
     def update_running_count(self):
         """更新运行中任务计数"""
-        running_count = sum(1 for t in self.threads.values() if t['status'] == 'running')
-        self.running_label.config(text=f"运行中: {running_count}")
+        self.running_label.config(text=f"运行中: {self.active_task_count()}")
     
     def view_task_details(self):
         """查看任务详情"""
@@ -664,21 +1004,67 @@ class WhiskGUIV2:
         
         task_id = self.task_tree.item(selection[0])['text']
         if task_id in self.threads and self.threads[task_id]['status'] == 'running':
-            # 这里需要实现停止机制
             self.log_message(f"正在停止任务 {task_id}...", "warning")
-            self.threads[task_id]['status'] = 'stopped'
-            self.task_tree.set(self.threads[task_id]['tree_item'], 'status', "已停止")
+            self.cancel_task(task_id)
             self.update_running_count()
     
+    def cancel_task(self, task_id):
+        """
+        请求停止任务：取消标记打断正在进行的等待，任务线程随即清理并归还浏览器连接
+        线程退出前状态为"停止中"，仍计入并发数
+        """
+        task_info = self.threads[task_id]
+        if task_info['cancel'] is not None:
+            task_info['cancel'].cancel()
+        elif self.scheduler:
+            # 调度任务：移除排队中的生成，正在进行的那次完成后结束
+            self.scheduler.cancel_job(task_id)
+        task_info['status'] = 'stopping'
+        self.task_tree.set(task_info['tree_item'], '状态', "停止中")
+    
+    def resume_selected_task(self):
+        """断点续跑选中的任务：使用原保存目录，跳过任务日志中已完成的生成"""
+        selection = self.task_tree.selection()
+        if not selection:
+            return
+        
+        task_id = self.task_tree.item(selection[0])['text']
+        task_info = self.threads.get(task_id)
+        if not task_info or task_info['status'] == 'running':
+            return
+        
+        if not task_info.get('browser_id'):
+            messagebox.showwarning("提示", "多窗口调度任务不支持断点续跑")
+            return
+        
+        if task_info['thread'] is not None and task_info['thread'].is_alive():
+            messagebox.showwarning("提示", "该任务的线程仍在运行，请稍后再试")
+            return
+        
+        thread = threading.Thread(
+            target=self.run_task,
+            args=(task_id, task_info['browser_id'], task_info['prompt'], task_info['count'],
+                  task_info['ratio'], task_info['save_dir'], task_info['tree_item'], True),
+            daemon=True
+        )
+        task_info['thread'] = thread
+        task_info['cancel'] = CancellationToken()
+        task_info['status'] = 'running'
+        self.task_tree.set(task_info['tree_item'], '状态', "续跑中")
+        thread.start()
+        
+        self.update_running_count()
+        self.stop_all_btn.config(state=tk.NORMAL)
+        self.log_message(f"任务 {task_id} 断点续跑", "success")
+    
     def stop_all_tasks(self):
         """停止所有任务"""
         if messagebox.askyesno("确认", "确定要停止所有运行中的任务吗？"):
-            for task_id, task_info in self.threads.items():
+            for task_id, task_info in list(self.threads.items()):
                 if task_info['status'] == 'running':
-                    task_info['status'] = 'stopped'
-                    self.task_tree.set(task_info['tree_item'], 'status', "已停止")
+                    self.cancel_task(task_id)
             
-            self.log_message("已停止所有任务", "warning")
+            self.log_message("正在停止所有任务...", "warning")
             self.update_running_count()
             self.stop_all_btn.config(state=tk.DISABLED)
     
@@ -701,4 +1087,6 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    # 打包为 exe 后后处理进程池需要
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 任务日志（断点续跑）
+在任务保存目录中追加写入 .whisk_journal.jsonl，每行一条记录:
+    {"event": "job", "prompt": ..., "ratio": ..., "count": ..., "resume": false, "time": ...}
+    {"event": "generation", "iteration": 3, "prompt": ..., "ratio": ...,
+     "status": "done" | "failed" | "timeout", "files": [...], "error": null, "time": ...}
+
+续跑时读取日志，跳过相同提示词、纵横比下已完成且文件仍存在的生成序号；
+只统计该提示词、纵横比最近一次全新开始（非续跑）的任务之后的记录，保存目录被多次运行共用时，
+之前运行完成的序号不会让续跑跳过本次运行尚未完成的生成
+文件路径记录为绝对路径，从其他工作目录续跑也能找到
+每行写入后立即 fsync，进程崩溃最多丢失正在写入的一行（读取时忽略）
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+
+class JobJournal:
+    """追加写入的任务日志（线程安全，流水线后台保存线程也会写入）"""
+
+    FILENAME = ".whisk_journal.jsonl"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_directory(cls, directory) -> 'JobJournal':
+        return cls(Path(directory) / cls.FILENAME)
+
+    def _append(self, record: Dict):
+        record['time'] = round(time.time(), 3)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def start_job(self, prompt: str, ratio: str, count: int, resume: bool = False):
+        self._append({'event': 'job', 'prompt': prompt, 'ratio': ratio, 'count': count, 'resume': resume})
+
+    def record(self, iteration: int, prompt: str, ratio: str, status: str,
+               files: Optional[List[str]] = None, error: Optional[str] = None):
+        """记录一次生成的结果（iteration 从 1 开始）"""
+        self._append({
+            'event': 'generation', 'iteration': iteration, 'prompt': prompt, 'ratio': ratio,
+            'status': status, 'files': [str(Path(f).resolve()) for f in files or []], 'error': error,
+        })
+
+    def entries(self) -> List[Dict]:
+        """读取全部记录（跳过损坏的行）"""
+        if not self.path.exists():
+            return []
+        records = []
+        with self._lock, open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def completed_iterations(self, prompt: str, ratio: str) -> Set[int]:
+        """
+        相同提示词和纵横比下已完成的生成序号；对应文件全部丢失的不算完成
+        遇到该提示词、纵横比的非续跑 job 记录时清空，只保留最近一次全新运行（及其续跑）的结果
+        """
+        completed = set()
+        for record in self.entries():
+            if record.get('prompt') != prompt or record.get('ratio') != ratio:
+                continue
+            if record.get('event') == 'job':
+                if not record.get('resume'):
+                    completed.clear()
+            elif (record.get('event') == 'generation' and record.get('status') == 'done'
+                    and any(_saved_file_exists(Path(f)) for f in record.get('files', []))):
+                completed.add(record.get('iteration'))
+        return completed
+
+
+# 后处理可能把 PNG 截图转换为其他格式（见 whisk_postprocess_v2）
+CONVERTED_SUFFIXES = ('.jpg', '.webp')
+
+
+def _saved_file_exists(path: Path) -> bool:
+    return path.exists() or any(path.with_suffix(suffix).exists() for suffix in CONVERTED_SUFFIXES)
@@ -2,12 +2,23 @@
 """
 Whisk V2 启动器
 用于exe打包，解决路径和导入问题
+
+启动时只加载界面，自动化核心（playwright）在第一次运行任务时才导入；
+每次启动的各模块导入耗时和首帧时间追加到 startup_timing.jsonl，用于跟踪冷启动变慢
 """
 
+import time
+
+# 尽早记录启动时间，首帧耗时从这里开始计算
+_LAUNCH_START = time.perf_counter()
+
 import sys
 import os
+import json
 import traceback
 
+STARTUP_TIMING_FILE = 'startup_timing.jsonl'
+
 def setup_environment():
     """设置运行环境"""
     # 获取程序运行路径
@@ -26,6 +37,41 @@ def setup_environment():
     
     return application_path
 
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+def load_module_from_file(name, app_path):
+    """模块无法正常导入时直接执行程序目录中的文件"""
+    import importlib.util
+    module_path = os.path.join(app_path, f'{name}.py')
+    
+    if not os.path.exists(module_path):
+        raise FileNotFoundError(f"找不到主程序文件: {module_path}")
+    
+    spec = importlib.util.spec_from_file_location(name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def write_startup_report(timings, first_frame_ms):
+    """追加一条启动耗时记录"""
+    record = {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'frozen': bool(getattr(sys, 'frozen', False)),
+        'python': sys.version.split()[0],
+        'imports_ms': timings,
+        'first_frame_ms': first_frame_ms,
+        # 启动阶段不应加载的重量级模块，出现则说明有模块重新变成了立即导入
+        'eager_heavy_modules': [m for m in ('playwright', 'requests', 'PIL') if m in sys.modules],
+    }
+    try:
+        with open(STARTUP_TIMING_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+    return record
+
 def show_error(title, message):
     """显示错误对话框"""
     try:
@@ -48,41 +94,42 @@ def main():
         # 设置环境
         app_path = setup_environment()
         
-        # 尝试导入主程序
+        timings = {}
+        
+        # 只导入界面；核心模块在第一次运行任务时由界面按需导入
+        # 必须使用静态 import 语句，PyInstaller 才能分析出需要打包的模块（界面中按需导入的模块同样如此）
+        import_start = time.perf_counter()
+        import tkinter as tk
+        timings['tkinter'] = elapsed_ms(import_start)
+        
+        import_start = time.perf_counter()
         try:
             # 首先尝试作为模块导入
             from whisk_gui_v2 import WhiskGUIV2
         except ImportError:
             # 如果失败，尝试直接执行文件
-            import importlib.util
-            gui_path = os.path.join(app_path, 'whisk_gui_v2.py')
-            
-            if not os.path.exists(gui_path):
-                raise FileNotFoundError(f"找不到主程序文件: {gui_path}")
-            
-            spec = importlib.util.spec_from_file_location("whisk_gui_v2", gui_path)
-            whisk_gui_v2 = importlib.util.module_from_spec(spec)
-            sys.modules["whisk_gui_v2"] = whisk_gui_v2
-            spec.loader.exec_module(whisk_gui_v2)
-            WhiskGUIV2 = whisk_gui_v2.WhiskGUIV2
-        
-        # 同样处理核心模块
-        try:
-            import whisk_core_v2
-        except ImportError:
-            import importlib.util
-            core_path = os.path.join(app_path, 'whisk_core_v2.py')
-            
-            if os.path.exists(core_path):
-                spec = importlib.util.spec_from_file_location("whisk_core_v2", core_path)
-                whisk_core_v2 = importlib.util.module_from_spec(spec)
-                sys.modules["whisk_core_v2"] = whisk_core_v2
-                spec.loader.exec_module(whisk_core_v2)
+            WhiskGUIV2 = load_module_from_file('whisk_gui_v2', app_path).WhiskGUIV2
+        timings['whisk_gui_v2'] = elapsed_ms(import_start)
         
         # 创建tkinter根窗口并运行应用
-        import tkinter as tk
         root = tk.Tk()
         app = WhiskGUIV2(root)
+        
+        def on_map(event):
+            # 根窗口映射后，等待绘制完成的空闲回调再计时（只记录一次）
+            if event.widget is root:
+                root.unbind('<Map>')
+                root.after_idle(on_first_frame)
+        
+        def on_first_frame():
+            first_frame_ms = elapsed_ms(_LAUNCH_START)
+            record = write_startup_report(timings, first_frame_ms)
+            imports = ", ".join(f"{name} {ms:.0f}ms" for name, ms in timings.items())
+            app.log_message(f"启动耗时 {first_frame_ms:.0f}ms（{imports}）", "info")
+            if record['eager_heavy_modules']:
+                app.log_message(f"启动时加载了重量级模块: {', '.join(record['eager_heavy_modules'])}", "warning")
+        
+        root.bind('<Map>', on_map)
         root.mainloop()
         
     except Exception as e:
@@ -103,4 +150,7 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
+    # 打包后后处理进程池的子进程也从这里启动，必须最先调用，否则每个子进程都会再打开一个界面
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 日志管道
+TaskLogFiles: 每个任务一个滚动日志文件，写文件在 QueueListener 线程中进行，不阻塞调用方
+LogBuffer: 界面日志缓冲，每个刷新周期合并为一次 insert，并把日志控件限制为最近 N 行
+"""
+
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class _TaskFileRouter(logging.Handler):
+    """按 record.task_id 把日志分发到各任务的 RotatingFileHandler（在监听线程中运行）"""
+
+    def __init__(self, log_directory: Path, max_bytes: int, backup_count: int):
+        super().__init__()
+        self.log_directory = log_directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+        self._handlers: Dict[str, logging.Handler] = {}
+
+    def _handler(self, task_id: str) -> logging.Handler:
+        handler = self._handlers.get(task_id)
+        if handler is None:
+            self.log_directory.mkdir(parents=True, exist_ok=True)
+            safe_name = re.sub(r'[^\w.-]', '_', str(task_id)) or 'task'
+            handler = logging.handlers.RotatingFileHandler(
+                self.log_directory / f"{safe_name}.log", maxBytes=self.max_bytes,
+                backupCount=self.backup_count, encoding='utf-8', delay=True)
+            handler.setFormatter(self.formatter)
+            self._handlers[task_id] = handler
+        return handler
+
+    def emit(self, record: logging.LogRecord):
+        task_id = getattr(record, 'task_id', 'general')
+        if getattr(record, 'close_task', False):
+            handler = self._handlers.pop(task_id, None)
+            if handler:
+                handler.close()
+            return
+        try:
+            self._handler(task_id).handle(record)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        self._handlers.clear()
+        super().close()
+
+
+class TaskLogFiles:
+    """按任务写入滚动日志文件（异步）"""
+
+    LEVELS = {'info': logging.INFO, 'success': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
+
+    def __init__(self, log_directory: str = "./logs", max_bytes: int = 2 * 1024 * 1024, backup_count: int = 3):
+        self.log_directory = Path(log_directory)
+        self._queue = queue.SimpleQueue()
+        self._router = _TaskFileRouter(self.log_directory, max_bytes, backup_count)
+        self._listener = logging.handlers.QueueListener(self._queue, self._router)
+        self._listener.start()
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def _put(self, task_id: str, message: str, level: int, **extra):
+        record = logging.LogRecord('whisk.task', level, __file__, 0, message, None, None)
+        record.task_id = str(task_id)
+        record.__dict__.update(extra)
+        self._queue.put_nowait(record)
+
+    def write(self, task_id: str, message: str, tag: str = "info"):
+        """写一条任务日志（只入队，立即返回）"""
+        if not self._stopped:
+            self._put(task_id, message, self.LEVELS.get(tag, logging.INFO))
+
+    def close_task(self, task_id: str):
+        """任务结束后关闭其日志文件"""
+        if not self._stopped:
+            self._put(task_id, "", logging.INFO, close_task=True)
+
+    def stop(self):
+        """写完队列中剩余的日志并关闭所有文件"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        self._listener.stop()
+        self._router.close()
+
+
+class LogBuffer:
+    """界面日志缓冲：合并插入、限制行数"""
+
+    def __init__(self, max_lines: int = 2000, max_pending: int = 1000):
+        self.max_lines = max_lines
+        # 一个周期内积压过多时丢弃最早的行（完整日志仍在文件中）
+        self._pending = deque(maxlen=max_pending)
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def append(self, line: str, tag: str = "info"):
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self._dropped += 1
+            self._pending.append((line, tag))
+
+    def flush(self, text_widget) -> int:
+        """把积压的日志一次性插入控件并裁剪到 max_lines 行，返回插入的行数"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            items = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+
+        args = []
+        if dropped:
+            args += [f"... 界面日志过多，省略 {dropped} 行（完整日志见日志文件）\n", "warning"]
+        for line, tag in items:
+            args += [line, tag]
+        text_widget.insert('end', *args)
+
+        # 环形缓冲：删除超出上限的最早行
+        line_count = int(text_widget.index('end-1c').split('.')[0]) - 1
+        excess = line_count - self.max_lines
+        if excess > 0:
+            text_widget.delete('1.0', f'{excess + 1}.0')
+
+        text_widget.see('end')
+        return len(items)
+
+
+_default_task_logs: Optional[TaskLogFiles] = None
+_default_task_logs_lock = threading.Lock()
+
+
+def get_task_logs(log_directory: str = "./logs") -> TaskLogFiles:
+    """进程级任务日志（首次调用时创建，退出时写完剩余日志）"""
+    global _default_task_logs
+    with _default_task_logs_lock:
+        if _default_task_logs is None:
+            import atexit
+            _default_task_logs = TaskLogFiles(log_directory)
+            atexit.register(_default_task_logs.stop)
+        return _default_task_logs
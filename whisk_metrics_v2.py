@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 运行指标
+记录各阶段耗时（输入、触发、等待、取图、保存、延迟）、生成延迟分布、
+下载字节数与吞吐，以及超时 / 降级次数，运行结束时汇总为 JSON
+
+每个阶段结束时通过 metrics_callback 推送一个事件:
+    {'type': 'span', 'name': 'wait', 'seconds': 12.3, 'ok': True}
+运行结束时推送 {'type': 'summary', 'summary': {...}}
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class LatencyHistogram:
+    """延迟分布（秒）：固定桶计数 + 最近样本的分位数"""
+
+    BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 30, 45, 60, 90, 120)
+    MAX_SAMPLES = 1000
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(self.BUCKETS) + 1)
+        self._samples: List[float] = []
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+        index = next((i for i, bound in enumerate(self.BUCKETS) if seconds <= bound), len(self.BUCKETS))
+        self.buckets[index] += 1
+
+        self._samples.append(seconds)
+        if len(self._samples) > self.MAX_SAMPLES:
+            del self._samples[0]
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def to_dict(self) -> Dict:
+        labels = [f"<={bound}s" for bound in self.BUCKETS] + [f">{self.BUCKETS[-1]}s"]
+        return {
+            'count': self.count,
+            'total': round(self.total, 3),
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'min': round(self.min, 3) if self.min is not None else None,
+            'max': round(self.max, 3) if self.max is not None else None,
+            'p50': _round(self.percentile(50)),
+            'p90': _round(self.percentile(90)),
+            'p99': _round(self.percentile(99)),
+            'buckets': {label: n for label, n in zip(labels, self.buckets) if n},
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class RunMetrics:
+    """一次运行的指标（线程安全，流水线的后台保存线程也会写入）"""
+
+    def __init__(self, callback: Optional[Callable] = None):
+        self.callback = callback
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stages: Dict[str, LatencyHistogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._bytes: Dict[str, int] = {}
+        self._images = 0
+
+    def _emit(self, event: Dict):
+        if self.callback:
+            try:
+                self.callback(event)
+            except Exception:
+                pass
+
+    def observe(self, name: str, seconds: float, ok: bool = True):
+        """记录一个阶段耗时"""
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = LatencyHistogram()
+            histogram.observe(seconds)
+        self._emit({'type': 'span', 'name': name, 'seconds': round(seconds, 3), 'ok': ok})
+
+    @contextmanager
+    def span(self, name: str):
+        """计时一个阶段；阶段抛出异常时同样记录（ok=False）"""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.observe(name, time.perf_counter() - start, ok)
+
+    def count(self, name: str, n: int = 1):
+        """超时、降级等事件计数"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+        self._emit({'type': 'count', 'name': name, 'value': n})
+
+    def add_image(self, size: int, source: str):
+        """记录一张已保存的图片及其字节数"""
+        with self._lock:
+            self._images += 1
+            self._bytes[source] = self._bytes.get(source, 0) + size
+
+    def summary(self) -> Dict:
+        with self._lock:
+            duration = time.time() - self.started
+            total_bytes = sum(self._bytes.values())
+            save = self._stages.get('save')
+            save_seconds = save.total if save else 0.0
+            return {
+                'duration': round(duration, 3),
+                'images': self._images,
+                'images_per_minute': round(self._images / duration * 60, 2) if duration > 0 else None,
+                'bytes': total_bytes,
+                'bytes_by_source': dict(self._bytes),
+                # 吞吐按保存阶段耗时计算（不含生成等待）
+                'save_throughput_kbps': round(total_bytes / 1024 / save_seconds, 1) if save_seconds > 0 else None,
+                'counters': dict(self._counters),
+                'stages': {name: h.to_dict() for name, h in self._stages.items()},
+            }
+
+    def report(self) -> Dict:
+        """生成汇总并推送 summary 事件"""
+        summary = self.summary()
+        self._emit({'type': 'summary', 'summary': summary})
+        return summary
+
+    def to_json(self, indent: Optional[int] = None) -> str:
+        return json.dumps(self.summary(), ensure_ascii=False, indent=indent)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 自适应生成间隔
+根据每次生成的结果调整两次生成之间的等待时间：
+服务正常（按时出图、下载完整、延迟稳定）时逐步缩短间隔，
+出现超时、下载失败、错误提示或延迟明显变长时指数退避
+"""
+
+import random
+from typing import Dict, Optional
+
+
+class AdaptivePacer:
+    """
+    自适应间隔控制器（非线程安全，每个核心实例一个）
+
+    初始间隔取 [min_delay, max_delay] 的中点；
+    健康时乘以 speedup（下限 floor），退化时乘以 backoff（上限 ceiling），
+    实际等待在当前间隔上加减 jitter 比例的随机抖动
+    """
+
+    # 生成延迟超过基线的倍数时视为服务变慢
+    SLOW_FACTOR = 1.5
+
+    # 延迟基线的指数滑动平均系数
+    LATENCY_ALPHA = 0.2
+
+    def __init__(self, min_delay: float = 5, max_delay: float = 8, floor: float = 1.0,
+                 ceiling: float = 300.0, speedup: float = 0.85, backoff: float = 2.0,
+                 jitter: float = 0.2):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.floor = min(floor, min_delay)
+        self.ceiling = max(ceiling, max_delay)
+        self.speedup = speedup
+        self.backoff = backoff
+        self.jitter = jitter
+
+        self.delay = (min_delay + max_delay) / 2
+        self.latency_baseline: Optional[float] = None
+        self.consecutive_failures = 0
+        self.stats = {'healthy': 0, 'slow': 0, 'partial': 0, 'degraded': 0}
+
+    def record(self, latency: Optional[float] = None, timed_out: bool = False,
+               images: int = 0, expected: int = 2, error_banner: Optional[str] = None) -> str:
+        """
+        记录一次生成的结果并调整间隔，返回判定结果
+        healthy: 加速；slow / partial: 保持；degraded: 退避
+        """
+        if timed_out or error_banner or images == 0:
+            verdict = 'degraded'
+            self.consecutive_failures += 1
+            # 从不低于静态窗口下限的位置开始退避，连续失败时逐次翻倍
+            self.delay = min(self.ceiling, max(self.delay, self.min_delay) * self.backoff)
+        else:
+            self.consecutive_failures = 0
+            slow = (latency is not None and self.latency_baseline is not None
+                    and latency > self.latency_baseline * self.SLOW_FACTOR)
+            if images < expected:
+                verdict = 'partial'
+            elif slow:
+                verdict = 'slow'
+            else:
+                verdict = 'healthy'
+                self.delay = max(self.floor, self.delay * self.speedup)
+
+            # 只用成功的生成更新延迟基线，避免超时把基线拉高
+            if latency is not None:
+                if self.latency_baseline is None:
+                    self.latency_baseline = latency
+                else:
+                    self.latency_baseline += self.LATENCY_ALPHA * (latency - self.latency_baseline)
+
+        self.stats[verdict] += 1
+        return verdict
+
+    def next_delay(self) -> float:
+        """下一次等待的秒数（带随机抖动）"""
+        spread = self.delay * self.jitter
+        return max(0.0, random.uniform(self.delay - spread, self.delay + spread))
+
+    def state(self) -> Dict:
+        return {
+            'delay': round(self.delay, 2),
+            'latency_baseline': round(self.latency_baseline, 2) if self.latency_baseline is not None else None,
+            'consecutive_failures': self.consecutive_failures,
+            'stats': dict(self.stats),
+        }
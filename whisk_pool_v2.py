@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - CDP 连接池
+按 browser_id 复用 connect_over_cdp 连接，连续的任务无需重新调用
+比特浏览器 /browser/open、启动 Playwright 驱动和 CDP 握手
+
+playwright.sync_api 的对象只能在创建它的线程中使用，因此每个浏览器窗口
+对应一个常驻工作线程：驱动、连接都归该线程所有，任务通过 submit 投递到
+该线程执行；空闲超过 idle_timeout 的线程会断开连接并退出
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+
+class PoolThreadError(RuntimeError):
+    """在连接池工作线程之外使用池化连接"""
+
+
+class _ProfileWorker(threading.Thread):
+    """单个浏览器窗口的工作线程，持有该窗口的 Playwright 驱动和 CDP 连接"""
+
+    def __init__(self, pool: 'CDPConnectionPool', browser_id: str):
+        super().__init__(name=f"whisk-pool-{browser_id}", daemon=True)
+        self.pool = pool
+        self.browser_id = browser_id
+        self.jobs = queue.Queue()
+        self.pending = 0
+        self.closing = False
+
+        self.playwright = None
+        self.browser = None
+        self.last_used = time.time()
+
+    def run(self):
+        while True:
+            try:
+                job = self.jobs.get(timeout=self.pool.idle_timeout)
+            except queue.Empty:
+                # 空闲驱逐：确认没有新任务后退出
+                if self.pool._retire(self):
+                    break
+                continue
+
+            if job is None:
+                break
+
+            future, fn, args, kwargs = job
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                self.last_used = time.time()
+                with self.pool._lock:
+                    self.pending -= 1
+
+        self.disconnect(stop_driver=True)
+
+    def is_healthy(self) -> bool:
+        """健康检查：连接仍在且页面可以执行脚本"""
+        if not self.browser:
+            return False
+        try:
+            if not self.browser.is_connected():
+                return False
+            contexts = self.browser.contexts
+            if not contexts:
+                return False
+            pages = contexts[0].pages
+            if pages:
+                pages[0].evaluate("1")
+            return True
+        except Exception:
+            return False
+
+    def connect(self, resolve_endpoint: Callable[..., str]):
+        """返回健康的连接；必要时用缓存的端点或重新打开窗口建立连接"""
+        if self.is_healthy():
+            self.pool._count('reused')
+            return self.browser, True
+
+        self.disconnect()
+
+        if self.playwright is None:
+            from playwright.sync_api import sync_playwright
+            self.playwright = sync_playwright().start()
+            self.pool._count('drivers_started')
+
+        # 先用缓存的 ws 端点（窗口仍开着时可跳过 /browser/open），失败再重新打开窗口
+        try:
+            self.browser = self.playwright.chromium.connect_over_cdp(resolve_endpoint())
+        except Exception:
+            self.browser = self.playwright.chromium.connect_over_cdp(resolve_endpoint(force_refresh=True))
+        self.pool._count('opened')
+        return self.browser, False
+
+    def disconnect(self, stop_driver: bool = False):
+        """断开 CDP 连接（stop_driver 时同时关闭驱动）"""
+        if self.browser:
+            try:
+                self.browser.close()
+            except Exception:
+                pass
+            self.browser = None
+        if stop_driver and self.playwright:
+            try:
+                self.playwright.stop()
+            except Exception:
+                pass
+            self.playwright = None
+
+
+class CDPConnectionPool:
+    """进程级 CDP 连接池，按 browser_id 复用连接"""
+
+    def __init__(self, idle_timeout: float = 300):
+        self.idle_timeout = idle_timeout
+        self._workers: Dict[str, _ProfileWorker] = {}
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'reused': 0, 'drivers_started': 0, 'evicted': 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def submit(self, browser_id: str, fn: Callable, *args, **kwargs) -> Future:
+        """在该浏览器窗口的工作线程中执行 fn，同一窗口的任务依次执行"""
+        future = Future()
+        with self._lock:
+            worker = self._workers.get(browser_id)
+            if worker is None or worker.closing or not worker.is_alive():
+                worker = _ProfileWorker(self, browser_id)
+                self._workers[browser_id] = worker
+                worker.start()
+            worker.pending += 1
+            worker.jobs.put((future, fn, args, kwargs))
+        return future
+
+    def is_busy(self, browser_id: str) -> bool:
+        """该窗口是否有正在执行或排队的任务"""
+        with self._lock:
+            worker = self._workers.get(browser_id)
+            return bool(worker and worker.pending > 0)
+
+    def _current_worker(self, browser_id: str) -> _ProfileWorker:
+        worker = threading.current_thread()
+        if not isinstance(worker, _ProfileWorker) or worker.pool is not self or worker.browser_id != browser_id:
+            raise PoolThreadError(f"浏览器 {browser_id} 的池化连接只能在其连接池线程中使用")
+        return worker
+
+    def acquire(self, browser_id: str, resolve_endpoint: Callable[..., str]):
+        """
+        获取连接（须在 submit 投递的任务中调用）
+        返回 (browser, reused)；resolve_endpoint(force_refresh=False) 返回 ws 地址，
+        缓存端点连接失败时会以 force_refresh=True 再调用一次
+        """
+        return self._current_worker(browser_id).connect(resolve_endpoint)
+
+    def release(self, browser_id: str, healthy: bool = True):
+        """归还连接；连接异常时立即断开，下次获取时重建"""
+        worker = self._current_worker(browser_id)
+        worker.last_used = time.time()
+        if not healthy:
+            worker.disconnect()
+
+    def _retire(self, worker: _ProfileWorker) -> bool:
+        """空闲超时的工作线程退出前从池中摘除；期间有新任务则继续运行"""
+        with self._lock:
+            if worker.pending > 0:
+                return False
+            worker.closing = True
+            if self._workers.get(worker.browser_id) is worker:
+                del self._workers[worker.browser_id]
+            self._stats['evicted'] += 1
+        return True
+
+    def stats(self) -> Dict:
+        """连接池统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['workers'] = len(self._workers)
+            stats['connected'] = sum(1 for w in self._workers.values() if w.browser)
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        """关闭所有工作线程及其连接"""
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+            for worker in workers:
+                worker.closing = True
+                worker.jobs.put(None)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+
+_default_pool: Optional[CDPConnectionPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> CDPConnectionPool:
+    """进程级默认连接池"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = CDPConnectionPool()
+        return _default_pool
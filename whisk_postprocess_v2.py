@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 图片后处理
+保存后的图片交给进程池处理，不占用浏览器线程，也不受 GIL 限制:
+    损坏检测    无法解码的图片重命名为 *.corrupt（续跑时重新生成）
+    格式转换    PNG 截图转为 JPEG / WebP
+    缩放        长边超过 max_size 时等比缩小
+    缩略图      写入保存目录下的 thumbnails/
+    元数据      提示词、纵横比、任务名写入 EXIF ImageDescription（PNG 为 iTXt），内容为 JSON
+                默认关闭：开启后每张图片都会在保存后再重写一次（JPEG 只插入 EXIF 段，不重新编码）
+
+PostProcessor 可直接作为核心类的 post_process_callback；
+在途任务数有上限，处理跟不上时提交会阻塞（背压），避免图片在内存队列中无限堆积
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+from whisk_dedup_v2 import rename_indexed_file
+
+
+CONVERT_FORMATS = {'jpeg': ('JPEG', '.jpg'), 'webp': ('WEBP', '.webp')}
+SUFFIXES = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+
+# EXIF ImageDescription 标签
+IMAGE_DESCRIPTION = 0x010E
+
+THUMBNAIL_DIRECTORY = "thumbnails"
+
+
+def pillow_available() -> bool:
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _temp_path(path: Path) -> Path:
+    """同目录下的临时文件（写完后重命名，输出目录中不会出现写了一半的图片）"""
+    return path.with_name(f".{path.stem}_{uuid.uuid4().hex}.part")
+
+
+def _write_atomic(path: Path, write: Callable[[Path], None]):
+    temp = _temp_path(path)
+    try:
+        write(temp)
+        os.replace(temp, path)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+
+def _description(metadata: Dict) -> str:
+    return json.dumps(metadata, ensure_ascii=False, sort_keys=True)
+
+
+def _splice_jpeg_exif(data: bytes, exif: bytes) -> bytes:
+    """
+    把 EXIF 段插入 JPEG（替换原有的 EXIF 段），图像数据原样保留，不重新编码
+    插入位置在 SOI 和 JFIF APP0 之后
+    """
+    if data[:2] != b'\xff\xd8':
+        raise ValueError("不是 JPEG 文件")
+    segment = b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif
+
+    head, rest, position = [data[:2]], [], 2
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        marker = data[position + 1]
+        if marker == 0xDA:  # 图像数据开始
+            break
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        chunk = data[position:position + 2 + length]
+        if marker == 0xE0 and not rest:
+            head.append(chunk)
+        elif not (marker == 0xE1 and chunk[4:10] == b'Exif\x00\x00'):
+            rest.append(chunk)
+        position += 2 + length
+    return b''.join(head) + segment + b''.join(rest) + data[position:]
+
+
+def process_image(path: str, options: Dict, metadata: Dict) -> Dict:
+    """
+    处理一张已保存的图片（在工作进程中运行）
+    返回 {'path', 'output', 'thumbnail', 'converted', 'corrupt', 'error'}
+    """
+    from PIL import Image, PngImagePlugin
+
+    source = Path(path)
+    result = {'path': path, 'output': path, 'thumbnail': None, 'converted': False, 'corrupt': False, 'error': None}
+
+    # 损坏检测：verify 只检查文件结构，load 真正解码
+    try:
+        with Image.open(source) as image:
+            image.verify()
+        with Image.open(source) as image:
+            image.load()
+    except Exception as e:
+        corrupt = source.with_name(source.name + ".corrupt")
+        os.replace(source, corrupt)
+        result.update(output=str(corrupt), corrupt=True, error=str(e))
+        return result
+
+    with Image.open(source) as image:
+        image.load()
+        source_format = image.format
+        target_format, suffix = source_format, SUFFIXES.get(source_format, source.suffix)
+        if options.get('convert') in CONVERT_FORMATS and source_format == 'PNG':
+            target_format, suffix = CONVERT_FORMATS[options['convert']]
+
+        max_size = options.get('max_size')
+        resize = bool(max_size) and max(image.size) > max_size
+        embed = bool(options.get('metadata') and metadata)
+        output = source.with_suffix(suffix)
+
+        if target_format == 'JPEG' and source_format == 'JPEG' and not resize and embed:
+            # 只写元数据：直接插入 EXIF 段，避免 JPEG 重新编码损失画质
+            exif = image.getexif()
+            exif[IMAGE_DESCRIPTION] = json.dumps(metadata, sort_keys=True)
+            data = _splice_jpeg_exif(source.read_bytes(), exif.tobytes())
+            _write_atomic(source, lambda temp: temp.write_bytes(data))
+
+        elif target_format != source_format or resize or embed:
+            processed = image
+            if resize:
+                processed = image.copy()
+                processed.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            if target_format == 'JPEG' and processed.mode not in ('RGB', 'L'):
+                processed = processed.convert('RGB')
+
+            params = {}
+            if target_format in ('JPEG', 'WEBP'):
+                params['quality'] = options.get('quality', 92)
+                if embed:
+                    exif = image.getexif()
+                    exif[IMAGE_DESCRIPTION] = json.dumps(metadata, sort_keys=True)
+                    params['exif'] = exif
+            elif target_format == 'PNG' and embed:
+                info = PngImagePlugin.PngInfo()
+                info.add_itxt('Description', _description(metadata))
+                params['pnginfo'] = info
+
+            _write_atomic(output, lambda temp: processed.save(temp, target_format, **params))
+            if output != source:
+                source.unlink(missing_ok=True)
+                result.update(output=str(output), converted=True)
+
+        thumbnail_size = options.get('thumbnail')
+        if thumbnail_size:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.Resampling.LANCZOS)
+            if thumbnail.mode not in ('RGB', 'L'):
+                thumbnail = thumbnail.convert('RGB')
+            directory = source.parent / THUMBNAIL_DIRECTORY
+            directory.mkdir(exist_ok=True)
+            thumbnail_path = directory / f"{output.stem}.jpg"
+            _write_atomic(thumbnail_path, lambda temp: thumbnail.save(temp, 'JPEG', quality=85))
+            result['thumbnail'] = str(thumbnail_path)
+
+    return result
+
+
+class PostProcessor:
+    """
+    后处理进程池（可在多个任务、多个核心实例之间共用）
+    调用方式与 post_process_callback 相同: processor(save_path, item)
+    """
+
+    def __init__(self, convert: Optional[str] = None, max_size: int = 0, thumbnail: int = 0,
+                 metadata: bool = False, quality: int = 92, workers: int = 0, max_pending: int = 0,
+                 message_callback: Optional[Callable] = None):
+        self.options = {
+            'convert': convert if convert in CONVERT_FORMATS else None,
+            'max_size': max(0, int(max_size or 0)),
+            'thumbnail': max(0, int(thumbnail or 0)),
+            'metadata': metadata,
+            'quality': quality,
+        }
+        # 默认留一个核心给浏览器和界面
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.max_pending = max_pending or self.workers * 2
+        self.message_callback = message_callback or (lambda msg: print(msg))
+
+        self.available = pillow_available()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats = {'submitted': 0, 'processed': 0, 'converted': 0, 'thumbnails': 0,
+                      'corrupt': 0, 'failed': 0, 'blocked_seconds': 0.0}
+
+        if not self.available:
+            self.log("⚠ 未安装 Pillow，图片后处理已关闭")
+
+    def log(self, msg: str):
+        self.message_callback(msg)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    @staticmethod
+    def metadata_for(save_path: Path, item: Dict) -> Dict:
+        """写入图片的元数据：提示词、纵横比、生成序号来自待保存项，任务名取保存目录名"""
+        metadata = {'task': Path(save_path).parent.name}
+        for key in ('prompt', 'aspect_ratio', 'iteration', 'source'):
+            if item.get(key) is not None:
+                metadata[key] = item[key]
+        return metadata
+
+    def __call__(self, save_path: Union[str, Path], item: Dict):
+        self.submit(save_path, self.metadata_for(save_path, item))
+
+    def submit(self, path: Union[str, Path], metadata: Optional[Dict] = None):
+        """提交一张图片；在途任务已满时阻塞，直到有任务完成"""
+        if not self.available:
+            return
+
+        wait_start = time.perf_counter()
+        self._slots.acquire()
+        blocked = time.perf_counter() - wait_start
+
+        try:
+            future = self._get_executor().submit(process_image, str(path), self.options, metadata or {})
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.stats['submitted'] += 1
+            self.stats['blocked_seconds'] += blocked
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self._slots.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            with self._lock:
+                self.stats['failed'] += 1
+            self.log(f"⚠ 后处理失败: {e}")
+            return
+
+        with self._lock:
+            self.stats['processed'] += 1
+            self.stats['converted'] += result['converted']
+            self.stats['thumbnails'] += result['thumbnail'] is not None
+            self.stats['corrupt'] += result['corrupt']
+
+        if result['corrupt']:
+            self.log(f"⚠ 图片已损坏，已重命名为 {Path(result['output']).name}: {result['error']}")
+        elif result['converted']:
+            # 去重索引改为指向转换后的文件，否则之后的重复图片查不到它
+            rename_indexed_file(result['path'], result['output'])
+            self.log(f"✓ 后处理: {Path(result['path']).name} -> {Path(result['output']).name}")
+
+    def close(self, wait: bool = True):
+        """等待在途任务完成并关闭进程池"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+            stats = self.stats
+            self.log(f"后处理统计: 完成 {stats['processed']} 张, 转换 {stats['converted']} 张, "
+                     f"缩略图 {stats['thumbnails']} 张, 损坏 {stats['corrupt']} 张, 失败 {stats['failed']} 张, "
+                     f"等待 {stats['blocked_seconds']:.1f} 秒")
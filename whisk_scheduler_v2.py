@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 多窗口调度器
+把 (提示词, 纵横比, 次数) 任务拆成单次生成，分配给空闲的比特浏览器窗口执行
+
+每个窗口有自己的本地队列（同一任务尽量留在同一窗口，避免反复切换纵横比），
+窗口空闲时从积压最多的窗口队尾窃取任务；生成失败（超时、限流）的窗口进入
+指数退避冷却，期间它的积压由其他窗口窃取
+
+工作循环运行在连接池中该窗口的线程上；所有队列为空时循环退出，把线程让给
+普通任务，下次 submit 时再重新启动
+
+核心类参数和生成间隔可随每个任务提交（界面中修改的选项对之后提交的任务生效），
+窗口取到参数不同的任务时按新参数重建核心实例，浏览器连接由连接池复用
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from whisk_cancel_v2 import CancellationToken, TaskCancelled
+from whisk_core_v2 import WhiskAutomationCoreV2
+from whisk_pool_v2 import CDPConnectionPool, get_default_pool
+
+
+class WhiskScheduler:
+    """多窗口生成调度器"""
+
+    def __init__(self, browser_ids: Iterable[str], save_directory: str,
+                 message_callback: Optional[Callable] = None,
+                 progress_callback: Optional[Callable] = None,
+                 job_done_callback: Optional[Callable] = None,
+                 connection_pool: Optional[CDPConnectionPool] = None,
+                 core_options: Optional[Dict] = None,
+                 min_delay: int = 5, max_delay: int = 8,
+                 max_attempts: int = 3, cooldown: float = 30, max_cooldown: float = 600):
+        self.save_directory = Path(save_directory)
+        self.message_callback = message_callback or (lambda msg: print(msg))
+        # progress_callback(job_id, 已完成次数, 总次数)；job_done_callback(job_id, 汇总)
+        self.progress_callback = progress_callback or (lambda job_id, done, total: None)
+        self.job_done_callback = job_done_callback or (lambda job_id, summary: None)
+        self.connection_pool = connection_pool or get_default_pool()
+        self.core_options = core_options or {}
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self._cond = threading.Condition()
+        self._queues: Dict[str, deque] = {}
+        self._running: Dict[str, Optional[Dict]] = {}
+        self._cooldown_until: Dict[str, float] = {}
+        self._failures: Dict[str, int] = {}
+        self._futures = {}
+        self._active: Dict[str, bool] = {}
+        self._jobs: Dict[str, Dict] = {}
+        self._cancelled_jobs = set()
+        self._job_counter = itertools.count(1)
+        self._stopping = False
+        self._closed = False
+        # 所有窗口共用的取消标记：stop() 时打断正在进行的生成
+        self._cancel = CancellationToken()
+
+        self.stats = {'generations': 0, 'failed': 0, 'retried': 0, 'stolen': 0, 'images': 0}
+
+        for browser_id in browser_ids:
+            self.add_browser(browser_id)
+
+    def log(self, browser_id: str, message: str):
+        self.message_callback(f"[{browser_id}] {message}")
+
+    def add_browser(self, browser_id: str):
+        """加入一个窗口（有任务时在其连接池线程中启动工作循环）"""
+        with self._cond:
+            if browser_id in self._queues:
+                return
+            self._queues[browser_id] = deque()
+            self._running[browser_id] = None
+            self._cooldown_until[browser_id] = 0.0
+            self._failures[browser_id] = 0
+            self._active[browser_id] = False
+            has_work = any(self._queues.values())
+        if has_work:
+            self._start_loops()
+    
+    def _start_loops(self):
+        """为没有运行工作循环的窗口启动循环"""
+        with self._cond:
+            idle = [b for b in self._queues if not self._active.get(b)]
+            for browser_id in idle:
+                self._active[browser_id] = True
+        for browser_id in idle:
+            self._futures[browser_id] = self.connection_pool.submit(browser_id, self._profile_loop, browser_id)
+
+    def submit(self, prompt: str, aspect_ratio: str = "1:1", count: int = 1,
+               save_directory: Optional[str] = None, job_id: Optional[str] = None,
+               core_options: Optional[Dict] = None,
+               min_delay: Optional[int] = None, max_delay: Optional[int] = None) -> str:
+        """
+        提交任务，拆分为 count 次单次生成，返回任务ID
+        core_options、min_delay、max_delay 未指定时使用构造时的默认值
+        """
+        job_id = job_id or f"J{next(self._job_counter):03d}"
+        job_dir = Path(save_directory) if save_directory else self.save_directory
+        job_dir.mkdir(parents=True, exist_ok=True)
+        options = dict(self.core_options if core_options is None else core_options)
+        delays = (self.min_delay if min_delay is None else min_delay,
+                  self.max_delay if max_delay is None else max_delay)
+
+        units = [
+            {'job_id': job_id, 'prompt': prompt, 'ratio': aspect_ratio, 'index': i,
+             'save_directory': job_dir, 'core_options': options, 'delays': delays, 'attempts': 0}
+            for i in range(count)
+        ]
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("调度器已关闭")
+            if not self._queues:
+                raise RuntimeError("调度器中没有可用的浏览器")
+            self._jobs[job_id] = {'total': count, 'done': 0, 'failed': 0, 'cancelled': 0, 'images': 0}
+
+            # 整个任务放入负载最小的窗口，保持纵横比亲和；其他窗口空闲时会来窃取
+            target = min(self._queues, key=self._load)
+            self._queues[target].extend(units)
+            self._cond.notify_all()
+
+        self._start_loops()
+        return job_id
+
+    def _load(self, browser_id: str) -> int:
+        return len(self._queues[browser_id]) + (1 if self._running[browser_id] else 0)
+
+    def _next_unit(self, browser_id: str) -> Optional[Dict]:
+        """取下一个生成单元：先取本地队列，为空时窃取；冷却中则等待"""
+        with self._cond:
+            while not self._stopping:
+                wait = self._cooldown_until[browser_id] - time.time()
+                if wait > 0:
+                    self._cond.wait(timeout=wait)
+                    continue
+
+                own = self._queues[browser_id]
+                if own:
+                    unit = own.popleft()
+                else:
+                    victim = max(self._queues, key=lambda b: len(self._queues[b]))
+                    if not self._queues[victim]:
+                        # 没有可做的任务：退出循环，释放连接池线程
+                        self._active[browser_id] = False
+                        return None
+                    # 从队尾窃取，保留对方队首（可能是它正在重试的单元）
+                    unit = self._queues[victim].pop()
+                    self.stats['stolen'] += 1
+                    self.log(browser_id, f"从 {victim} 窃取任务 {unit['job_id']} 第 {unit['index'] + 1} 次生成")
+
+                self._running[browser_id] = unit
+                return unit
+            self._active[browser_id] = False
+        return None
+
+    def _finish_unit(self, browser_id: str, unit: Dict, downloaded: int, error: Optional[str]):
+        """记录单元结果：成功计数、失败重试或放弃，并更新冷却"""
+        done_summary = None
+        requeued = False
+
+        with self._cond:
+            self._running[browser_id] = None
+            job = self._jobs[unit['job_id']]
+            self.stats['generations'] += 1
+
+            if downloaded > 0:
+                self._failures[browser_id] = 0
+                job['done'] += 1
+                job['images'] += downloaded
+                self.stats['images'] += downloaded
+            else:
+                # 连续失败时指数退避，冷却期间积压会被其他窗口窃取
+                self._failures[browser_id] += 1
+                backoff = min(self.max_cooldown, self.cooldown * 2 ** (self._failures[browser_id] - 1))
+                self._cooldown_until[browser_id] = time.time() + backoff
+                self.log(browser_id, f"⚠ 生成失败 ({error or '未下载到图片'})，冷却 {backoff:.0f} 秒")
+
+                unit['attempts'] += 1
+                if unit['job_id'] in self._cancelled_jobs:
+                    # 任务已取消：失败的生成不再重试
+                    job['cancelled'] += 1
+                elif unit['attempts'] < self.max_attempts:
+                    self._queues[browser_id].appendleft(unit)
+                    self.stats['retried'] += 1
+                    requeued = True
+                else:
+                    job['failed'] += 1
+                    self.stats['failed'] += 1
+
+            finished = self._finished(job)
+            if finished >= job['total']:
+                done_summary = dict(job)
+            self._cond.notify_all()
+
+        # 唤醒已退出的窗口，让它们在本窗口冷却期间窃取积压
+        if requeued:
+            self._start_loops()
+
+        self.progress_callback(unit['job_id'], finished, job['total'])
+        if done_summary is not None:
+            self.job_done_callback(unit['job_id'], done_summary)
+
+    @staticmethod
+    def _finished(job: Dict) -> int:
+        return job['done'] + job['failed'] + job['cancelled']
+
+    def _abandon_unit(self, unit: Dict):
+        """放弃无法执行的单元（没有可用窗口）"""
+        with self._cond:
+            job = self._jobs[unit['job_id']]
+            job['failed'] += 1
+            self.stats['failed'] += 1
+            finished = self._finished(job)
+            done_summary = dict(job) if finished >= job['total'] else None
+
+        self.progress_callback(unit['job_id'], finished, job['total'])
+        if done_summary is not None:
+            self.job_done_callback(unit['job_id'], done_summary)
+
+    def _create_automation(self, browser_id: str, core_options: Dict) -> WhiskAutomationCoreV2:
+        automation = WhiskAutomationCoreV2(
+            browser_id=browser_id,
+            save_directory=str(self.save_directory),
+            message_callback=lambda msg: self.message_callback(f"[{browser_id}] {msg}"),
+            connection_pool=self.connection_pool,
+            cancel_token=self._cancel,
+            **core_options
+        )
+        automation.connect_browser()
+        return automation
+
+    def _profile_loop(self, browser_id: str):
+        """窗口工作循环（运行在该窗口的连接池线程中）"""
+        automation, options = None, None
+
+        try:
+            while True:
+                unit = self._next_unit(browser_id)
+                if unit is None:
+                    break
+
+                if automation is None or unit['core_options'] != options:
+                    if automation is not None:
+                        automation.cleanup()
+                        automation = None
+                    options = unit['core_options']
+                    automation = self._create_automation(browser_id, options)
+
+                min_delay, max_delay = unit['delays']
+                automation.start_pacing(min_delay, max_delay)
+                automation.save_directory = unit['save_directory']
+                downloaded, error = 0, None
+                try:
+                    downloaded = automation.generate_once(unit['prompt'], unit['ratio'])
+                except Exception as e:
+                    error = str(e)
+                self._finish_unit(browser_id, unit, downloaded, error)
+
+                # 同一窗口两次生成之间的延迟（adaptive 模式由核心类按生成结果调整）
+                delay = automation.next_delay(min_delay, max_delay)
+                with self._cond:
+                    self._cond.wait_for(lambda: self._stopping, timeout=delay)
+
+        except TaskCancelled:
+            with self._cond:
+                self._running[browser_id] = None
+                self._active[browser_id] = False
+                self._cond.notify_all()
+            self.log(browser_id, "⚠ 调度已停止，中断当前生成")
+        except Exception as e:
+            self.log(browser_id, f"❌ 窗口工作循环出错: {e}")
+            abandoned, moved = [], False
+            with self._cond:
+                # 把本窗口的积压（包括连接失败时刚取到的单元）交给其他窗口；没有其他窗口时这些生成记为失败
+                backlog = self._queues.pop(browser_id, deque())
+                running = self._running.pop(browser_id, None)
+                if running:
+                    backlog.appendleft(running)
+                self._active.pop(browser_id, None)
+                if self._queues:
+                    target = min(self._queues, key=self._load)
+                    self._queues[target].extend(backlog)
+                    moved = bool(backlog)
+                else:
+                    abandoned = list(backlog)
+                self._cond.notify_all()
+            # 接手的窗口可能已经空闲退出，需要重新启动它的工作循环
+            if moved:
+                self._start_loops()
+            for unit in abandoned:
+                self._abandon_unit(unit)
+        finally:
+            if automation is not None:
+                automation.cleanup()
+
+    def pending(self) -> int:
+        """尚未完成的生成次数（排队 + 运行中）"""
+        with self._cond:
+            return sum(len(q) for q in self._queues.values()) + sum(1 for u in self._running.values() if u)
+
+    def close(self):
+        """不再接收新任务"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stop(self):
+        """立即停止：丢弃排队的任务，打断正在进行的生成"""
+        with self._cond:
+            self._stopping = True
+            for q in self._queues.values():
+                q.clear()
+            self._cond.notify_all()
+        self._cancel.cancel("调度已停止")
+
+    def cancel_job(self, job_id: str) -> int:
+        """
+        取消一个任务：移除其排队中的生成（记为 cancelled），正在进行的那次生成完成后结束
+        返回移除的生成次数
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return 0
+            self._cancelled_jobs.add(job_id)
+            removed = 0
+            for q in self._queues.values():
+                kept = [unit for unit in q if unit['job_id'] != job_id]
+                removed += len(q) - len(kept)
+                q.clear()
+                q.extend(kept)
+            job['cancelled'] += removed
+            finished = self._finished(job)
+            done_summary = dict(job) if removed and finished >= job['total'] else None
+            self._cond.notify_all()
+
+        if removed:
+            self.progress_callback(job_id, finished, job['total'])
+        if done_summary is not None:
+            self.job_done_callback(job_id, done_summary)
+        return removed
+
+    def wait(self, timeout: Optional[float] = None) -> Dict:
+        """close 后等待所有任务完成、工作循环结束，返回统计"""
+        self.close()
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            # 工作循环可能在等待期间被重新启动，循环直到没有新的 future
+            futures = list(self._futures.values())
+            for future in futures:
+                remaining = None if deadline is None else max(0, deadline - time.time())
+                future.result(timeout=remaining)
+            if futures == list(self._futures.values()):
+                break
+        return dict(self.stats)
+
+    def job_summaries(self) -> List[Dict]:
+        with self._cond:
+            return [dict(job, job_id=job_id) for job_id, job in self._jobs.items()]
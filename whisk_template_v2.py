@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Google Whisk AI 图像生成自动化 - 提示词模板
+语法:
+    {a|b|c}     依次展开为 a、b、c（可嵌套: {红|{深|浅}蓝}色）
+    {$name}     变量：取变量表 name 的每个值，未给出时读取变量目录下的 name.txt（每行一个值，# 开头为注释）
+
+    "一只{猫|狗}在{$places}" 与 places.txt = 草地 / 海边 展开为 4 个提示词
+
+展开是惰性的（生成器），只在取用时组合；完全相同的展开结果（忽略多余空白）只产生一次
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+
+class _Alternation:
+    def __init__(self, options: List[list]):
+        self.options = options
+
+
+class _Variable:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class PromptTemplate:
+    """解析后的提示词模板，迭代得到展开后的提示词（已去重）"""
+
+    def __init__(self, text: str, variables: Optional[Dict[str, List[str]]] = None,
+                 variables_dir: Optional[Union[str, Path]] = None):
+        self.text = text
+        self.variables = dict(variables or {})
+        self.variables_dir = Path(variables_dir) if variables_dir else None
+        self.parts = self._parse(text)
+
+    @staticmethod
+    def _parse(text: str) -> list:
+        """解析为片段列表：字符串、_Alternation、_Variable；括号不匹配时抛出 ValueError"""
+        stack = [[[]]]  # 每层是选项列表，最后一个选项是正在解析的片段列表
+        literal = []
+
+        def flush():
+            if literal:
+                stack[-1][-1].append(''.join(literal))
+                literal.clear()
+
+        for position, char in enumerate(text):
+            if char == '{':
+                flush()
+                stack.append([[]])
+            elif char == '|' and len(stack) > 1:
+                flush()
+                stack[-1].append([])
+            elif char == '}':
+                if len(stack) == 1:
+                    raise ValueError(f"模板第 {position + 1} 个字符处的 }} 没有对应的 {{")
+                flush()
+                options = stack.pop()
+                only = options[0] if len(options) == 1 else None
+                if only and len(only) == 1 and isinstance(only[0], str) and only[0].startswith('$'):
+                    stack[-1][-1].append(_Variable(only[0][1:].strip()))
+                else:
+                    stack[-1][-1].append(_Alternation(options))
+            else:
+                literal.append(char)
+
+        if len(stack) != 1:
+            raise ValueError("模板中有未闭合的 {")
+        flush()
+        return stack[0][0]
+
+    def _values(self, name: str) -> List[str]:
+        """变量的取值（首次使用时读取变量文件并缓存）"""
+        if name not in self.variables:
+            if self.variables_dir is None:
+                raise ValueError(f"未定义模板变量: {name}")
+            self.variables[name] = load_variable_file(self.variables_dir / f"{name}.txt")
+        return self.variables[name]
+
+    def _options(self, part) -> Iterator[str]:
+        if isinstance(part, str):
+            yield part
+        elif isinstance(part, _Variable):
+            yield from self._values(part.name)
+        else:
+            for option in part.options:
+                yield from self._expand(option)
+
+    def _expand(self, parts: list) -> Iterator[str]:
+        if not parts:
+            yield ''
+            return
+        for head in self._options(parts[0]):
+            for rest in self._expand(parts[1:]):
+                yield head + rest
+
+    def size(self) -> int:
+        """展开结果数量上限（去重前），用于显示进度"""
+        return self._size(self.parts)
+
+    def _size(self, parts: list) -> int:
+        total = 1
+        for part in parts:
+            if isinstance(part, _Variable):
+                total *= len(self._values(part.name))
+            elif isinstance(part, _Alternation):
+                total *= sum(self._size(option) for option in part.options)
+        return total
+
+    def __iter__(self) -> Iterator[str]:
+        return _unique(self._expand(self.parts))
+
+
+def load_variable_file(path: Union[str, Path]) -> List[str]:
+    """读取变量文件：每行一个值，忽略空行和 # 开头的注释"""
+    values = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                values.append(line)
+    if not values:
+        raise ValueError(f"变量文件为空: {path}")
+    return values
+
+
+def _unique(prompts: Iterable[str], seen: Optional[set] = None) -> Iterator[str]:
+    seen = set() if seen is None else seen
+    for prompt in prompts:
+        prompt = ' '.join(prompt.split())
+        if prompt and prompt not in seen:
+            seen.add(prompt)
+            yield prompt
+
+
+def expand_prompts(templates: Iterable[str], variables: Optional[Dict[str, List[str]]] = None,
+                   variables_dir: Optional[Union[str, Path]] = None) -> Iterator[str]:
+    """依次展开多个模板（如多行提示词，每行一个），跨模板去重"""
+    seen = set()
+    for text in templates:
+        if text.strip():
+            yield from _unique(PromptTemplate(text, variables, variables_dir), seen)